@@ -0,0 +1,167 @@
+# admission.py
+# Token-bucket admission control for the routes that insert rows or send SMS.
+#
+# Each limited route checks three buckets at once: the caller's (per user, or
+# per client address when logged out), the route's, and one shared by every
+# limited route. A request is admitted only if all three have a token; it
+# then takes one from each. Otherwise it gets an immediate 429 with
+# Retry-After, so a burst at a health camp queues in the clients instead of
+# piling up on SQLite and the Twilio quota.
+#
+# The buckets live in an anonymous shared memory map created when the app is
+# built. With gunicorn --preload every worker inherits the same map and
+# lock, so the limits hold for the whole instance. Without --preload each
+# worker gets its own buckets.
+import hashlib
+import math
+import mmap
+import multiprocessing
+import struct
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+from metrics import ADMISSION_REJECTED
+
+# key hash, tokens, last refill (time.monotonic(), the same clock in every process)
+_SLOT = struct.Struct('<Qdd')
+_PROBES = 8
+
+
+class SharedBuckets:
+    """Fixed-size open-addressing table of token buckets in shared memory.
+
+    When all probe slots of a key are taken, the least recently used one is
+    reused; an idle bucket has refilled by then, so forgetting it costs nothing.
+    """
+
+    def __init__(self, slots=4096):
+        # At least one probe sequence of distinct slots, so each key of a take() finds its own
+        self.slots = max(slots, _PROBES)
+        self._map = mmap.mmap(-1, self.slots * _SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    @staticmethod
+    def key_hash(key):
+        # Never 0, which marks a free slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def _find(self, key_hash, taken=()):
+        """Offset of the slot for ``key_hash``, and whether it is new.
+
+        A new key never gets one of the ``taken`` offsets, the slots of the
+        other keys of the same take().
+        """
+        start = key_hash % self.slots
+        oldest_offset, oldest_time = None, math.inf
+        for probe in range(_PROBES):
+            offset = ((start + probe) % self.slots) * _SLOT.size
+            stored_hash, _, updated = _SLOT.unpack_from(self._map, offset)
+            if stored_hash == key_hash:
+                return offset, False
+            if offset in taken:
+                continue
+            if stored_hash == 0:
+                return offset, True
+            if updated < oldest_time:
+                oldest_offset, oldest_time = offset, updated
+        return oldest_offset, True
+
+    def take(self, buckets, now=None):
+        """Take a token from every (key, rate, burst) bucket, or from none.
+
+        Returns 0 when admitted, else the seconds until all of them have a token.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                key_hash = self.key_hash(key)
+                offset, new = self._find(key_hash, {entry[0] for entry in state})
+                if new:
+                    tokens = float(burst)
+                    # Claimed right away, full, so the next key cannot pick the same slot
+                    _SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+                else:
+                    _, tokens, updated = _SLOT.unpack_from(self._map, offset)
+                    tokens = min(float(burst), tokens + (now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                state.append((offset, key_hash, tokens))
+            if wait:
+                return wait
+            for offset, key_hash, tokens in state:
+                _SLOT.pack_into(self._map, offset, key_hash, tokens - 1, now)
+            return 0
+
+
+class Admission:
+    """Flask extension providing the ``limit(route)`` decorator.
+
+    Settings: ADMISSION_ENABLED, ADMISSION_LIMITS ({route: {'user': (rate,
+    burst), 'route': (rate, burst)}}, rates in requests per second),
+    ADMISSION_GLOBAL (rate, burst) and ADMISSION_SLOTS.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.limits = {}
+        self.global_limit = None
+        self.buckets = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_ENABLED', True)
+        self.limits = app.config.get('ADMISSION_LIMITS', {})
+        self.global_limit = app.config.get('ADMISSION_GLOBAL')
+        # Created here, before gunicorn forks, so every worker shares it
+        self.buckets = SharedBuckets(app.config.get('ADMISSION_SLOTS', 4096))
+        app.extensions['admission'] = self
+
+    def _buckets_for(self, route):
+        limits = self.limits.get(route, {})
+        buckets = []
+        if 'user' in limits:
+            caller = session.get('user_id')
+            caller = f'user:{caller}' if caller is not None else f'addr:{request.remote_addr}'
+            buckets.append((f'{route}:{caller}', *limits['user']))
+        if 'route' in limits:
+            buckets.append((f'{route}:*', *limits['route']))
+        if self.global_limit:
+            buckets.append(('*', *self.global_limit))
+        return buckets
+
+    def check(self, route):
+        """None if the request may proceed, else the 429 response to send."""
+        if not self.enabled:
+            return None
+        wait = self.buckets.take(self._buckets_for(route))
+        if not wait:
+            return None
+        ADMISSION_REJECTED.inc(route)
+        retry_after = max(1, math.ceil(wait))
+        response = jsonify({'error': 'Too many requests, please retry later', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def limit(self, route, methods=None, exempt=None):
+        """Decorator admitting requests to a view through the buckets of ``route``.
+
+        With ``methods``, other methods (say the GET of a form) pass unchecked,
+        as do requests for which ``exempt()`` is true, such as replayed retries
+        (see idempotency.replays).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if (methods is None or request.method in methods) and not (exempt is not None and exempt()):
+                    rejected = current_app.extensions['admission'].check(route)
+                    if rejected is not None:
+                        return rejected
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
@@ -0,0 +1,226 @@
+# analytics.py
+# Rollup counters behind /admin/analytics.
+#
+# Each write path that changes what the admin charts show calls one of the
+# record_*() helpers before its commit, so a counter moves in the same
+# transaction as the rows it counts and never drifts on rollback. Reading
+# the charts then costs one small query per rollup, O(buckets), instead of
+# scanning every appointment and consultation.
+#
+# With SHARDS (see shards.py) every database keeps the rollups of its own
+# rows, written with them, and summary() adds the databases up.
+#
+#   flask --app app analytics rebuild
+#
+# recomputes the rollups that can be derived from the base tables (consultation
+# states, ASHA workload, predicted diseases) after a deploy onto existing data,
+# in every database.
+#
+# Predicted diseases come from Appointment.predicted_disease, which appointments
+# booked before that column existed lack, so a rebuild no longer counts them.
+# Bookings per day are only recorded as they happen: the booking date is not
+# stored on the rows themselves.
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import case, delete, func, insert, select, text, union_all, update
+
+from extensions import db, shards
+from models import (Appointment, AppointmentDailyCount, ArchivedAppointment, ArchivedConsultation, AshaWorkload,
+                    Consultation, ConsultationStateCount, DiseaseCount, User)
+from shards import CURRENT
+
+CONSULTATION_STATES = ('waiting', 'joined', 'completed')
+_UPSERT_DIALECTS = ('sqlite', 'postgresql')
+_upserts = {}  # model -> text() statement, built on first use
+
+
+def consultation_state(consultation):
+    """'waiting' until the patient joins, 'joined' until the doctor has too, then 'completed'."""
+    if consultation.patient_joined and consultation.doctor_joined:
+        return 'completed'
+    if consultation.patient_joined:
+        return 'joined'
+    return 'waiting'
+
+
+def _counter_column(model):
+    return next(column for column in model.__table__.columns if not column.primary_key)
+
+
+def _upsert(model):
+    # Plain text for the same reason as fragment_cache._UPSERT: SQLAlchemy does not
+    # cache the compiled form of on_conflict_do_update(). Same syntax on both dialects.
+    statement = _upserts.get(model)
+    if statement is None:
+        table = model.__tablename__
+        keys = ', '.join(column.name for column in model.__table__.primary_key)
+        values = ', '.join(f':{column.name}' for column in model.__table__.primary_key)
+        counter = _counter_column(model).name
+        statement = _upserts[model] = text(
+            f'INSERT INTO {table} ({keys}, {counter}) VALUES ({values}, :delta) '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {counter} = {table}.{counter} + :delta')
+    return statement
+
+
+def increment(model, delta=1, shard=CURRENT, **keys):
+    """Add ``delta`` to the rollup row of ``model`` identified by ``keys``, in the
+    database ``shard`` of the rows it counts."""
+    bind_arguments = shards.bind_arguments(shard)
+    if db.session.get_bind().dialect.name in _UPSERT_DIALECTS:
+        db.session.execute(_upsert(model), dict(keys, delta=delta), bind_arguments=bind_arguments)
+        return
+    counter = _counter_column(model)
+    where = [getattr(model, name) == value for name, value in keys.items()]
+    result = db.session.execute(update(model).where(*where).values({counter.name: counter + delta}),
+                                bind_arguments=bind_arguments)
+    if not result.rowcount:
+        db.session.execute(insert(model).values(dict(keys, **{counter.name: delta})), bind_arguments=bind_arguments)
+
+
+def record_booking(appointment, consultation, predicted_disease):
+    """A new appointment and its consultation from /chatbot."""
+    shard = shards.shard_of(appointment)
+    increment(AppointmentDailyCount, shard=shard, day=datetime.utcnow().date(), specialty=appointment.type_of_doctor)
+    increment(DiseaseCount, shard=shard, disease=predicted_disease)
+    increment(ConsultationStateCount, shard=shard, state=consultation_state(consultation))
+    if appointment.asha_worker_id is not None:
+        increment(AshaWorkload, shard=shard, asha_worker_id=appointment.asha_worker_id, status=appointment.status)
+
+
+def record_status_change(appointment, old_status):
+    """``appointment.status`` was just changed from ``old_status``."""
+    if appointment.asha_worker_id is None or appointment.status == old_status:
+        return
+    shard = shards.shard_of(appointment)
+    increment(AshaWorkload, -1, shard=shard, asha_worker_id=appointment.asha_worker_id, status=old_status)
+    increment(AshaWorkload, shard=shard, asha_worker_id=appointment.asha_worker_id, status=appointment.status)
+
+
+def record_consultation_change(consultation, old_state, shard=CURRENT):
+    """The joined flags of ``consultation`` were just changed; ``old_state`` is its state before.
+
+    ``consultation`` may be a row rather than an instance, so its ``shard`` is passed in.
+    """
+    new_state = consultation_state(consultation)
+    if new_state != old_state:
+        increment(ConsultationStateCount, -1, shard=shard, state=old_state)
+        increment(ConsultationStateCount, shard=shard, state=new_state)
+
+
+def summary(days=30):
+    """The rollups as JSON-ready data; bookings per day cover the last ``days`` days."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    def rollups():
+        # Each database counts its own rows; only the small rollups come back
+        daily = db.session.execute(
+            select(AppointmentDailyCount.day, AppointmentDailyCount.specialty, AppointmentDailyCount.appointments)
+            .where(AppointmentDailyCount.day >= since))
+        diseases = db.session.execute(select(DiseaseCount.disease, DiseaseCount.predictions))
+        states = db.session.execute(select(ConsultationStateCount.state, ConsultationStateCount.consultations))
+        workload = db.session.execute(
+            select(AshaWorkload.asha_worker_id, AshaWorkload.status, AshaWorkload.appointments))
+        return [tuple(row) for row in daily], [tuple(row) for row in diseases], \
+            [tuple(row) for row in states], [tuple(row) for row in workload]
+
+    daily_counts, disease_counts, state_counts, workload_counts = Counter(), Counter(), Counter(), Counter()
+    for daily, diseases, states, workload in shards.scatter(rollups).values():
+        for day, specialty, count in daily:
+            daily_counts[day, specialty] += count
+        for disease, count in diseases:
+            disease_counts[disease] += count
+        for name, count in states:
+            state_counts[name] += count
+        for asha_worker_id, status, count in workload:
+            workload_counts[asha_worker_id, status] += count
+
+    usernames = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_({asha_worker_id for asha_worker_id, _ in workload_counts}))
+    ).all()) if workload_counts else {}
+    workload = {}
+    for (asha_worker_id, status), appointments in sorted(workload_counts.items(), key=lambda item: item[0][0]):
+        if asha_worker_id not in usernames:
+            continue
+        entry = workload.setdefault(asha_worker_id, {'asha_worker_id': asha_worker_id,
+                                                     'username': usernames[asha_worker_id], 'appointments': {}})
+        entry['appointments'][status] = appointments
+    return {
+        'appointments_per_day': [{'day': day.isoformat(), 'specialty': specialty, 'appointments': count}
+                                 for (day, specialty), count in sorted(daily_counts.items())],
+        'predicted_diseases': [{'disease': disease, 'predictions': count}
+                               for disease, count in sorted(disease_counts.items(), key=lambda item: (-item[1], item[0] or ''))
+                               if count > 0],
+        'consultations': {state: state_counts.get(state, 0) for state in CONSULTATION_STATES},
+        'asha_workload': list(workload.values()),
+    }
+
+
+def rebuild():
+    """Recompute the consultation-state, ASHA-workload and disease rollups from the base tables.
+
+    Archived rows (see archive.py) still count. Each shard (see shards.py) rewrites
+    the rollups of its own rows in its own commit. Returns the number of appointments left out of the disease counts for having no
+    stored prediction.
+    """
+    consultations = union_all(
+        select(Consultation.patient_joined, Consultation.doctor_joined),
+        select(ArchivedConsultation.patient_joined, ArchivedConsultation.doctor_joined)).subquery()
+    state = case(
+        (consultations.c.patient_joined.is_(True) & consultations.c.doctor_joined.is_(True), 'completed'),
+        (consultations.c.patient_joined.is_(True), 'joined'),
+        else_='waiting')
+    appointments = union_all(
+        select(Appointment.asha_worker_id, Appointment.status),
+        select(ArchivedAppointment.asha_worker_id, ArchivedAppointment.status)).subquery()
+    predictions = union_all(
+        select(Appointment.predicted_disease),
+        select(ArchivedAppointment.predicted_disease)).subquery()
+
+    def recount():
+        # Grouped and rewritten in each database, next to the rows it counts
+        states = db.session.execute(select(state, func.count()).group_by(state)).all()
+        workload = db.session.execute(
+            select(appointments.c.asha_worker_id, appointments.c.status, func.count())
+            .where(appointments.c.asha_worker_id.is_not(None), appointments.c.status.is_not(None))
+            .group_by(appointments.c.asha_worker_id, appointments.c.status)).all()
+        diseases = dict(db.session.execute(
+            select(predictions.c.predicted_disease, func.count()).group_by(predictions.c.predicted_disease)).all())
+        unpredicted = diseases.pop(None, 0)
+
+        bind_arguments = shards.bind_arguments()
+        db.session.execute(delete(ConsultationStateCount), bind_arguments=bind_arguments)
+        if states:
+            db.session.execute(insert(ConsultationStateCount), [
+                {'state': name, 'consultations': count} for name, count in states], bind_arguments=bind_arguments)
+        db.session.execute(delete(AshaWorkload), bind_arguments=bind_arguments)
+        if workload:
+            db.session.execute(insert(AshaWorkload), [
+                {'asha_worker_id': asha_worker_id, 'status': status, 'appointments': count}
+                for asha_worker_id, status, count in workload], bind_arguments=bind_arguments)
+        db.session.execute(delete(DiseaseCount), bind_arguments=bind_arguments)
+        if diseases:
+            db.session.execute(insert(DiseaseCount), [
+                {'disease': disease, 'predictions': count} for disease, count in diseases.items()],
+                bind_arguments=bind_arguments)
+        db.session.commit()
+        return unpredicted
+
+    return sum(shards.scatter(recount).values())
+
+
+
+
+analytics_cli = AppGroup('analytics', help='Maintain the admin analytics rollups.')
+
+
+@analytics_cli.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recompute consultation states, ASHA workload and predicted diseases from the base tables."""
+    unpredicted = rebuild()
+    click.echo('Rebuilt consultation_state_counts, asha_workload and disease_counts')
+    if unpredicted:
+        click.echo(f'{unpredicted} appointments have no stored prediction and are not in disease_counts')
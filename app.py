@@ -1,166 +1,98 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-from flask_sqlalchemy import SQLAlchemy
+import serving
+# Patch the stdlib before anything below opens sockets or creates locks
+serving.monkey_patch()
+
+from flask import Flask, Blueprint, Response, render_template, request, redirect, url_for, session, flash, jsonify, send_file, current_app, abort
 from sqlalchemy.exc import IntegrityError
-from flask_mail import Mail, Message
-from flask_socketio import SocketIO, emit
+from flask_socketio import emit
+import gc
+import logging
 import random
 import string
 import os
-from dotenv import load_dotenv
-from twilio.rest import Client
+import time
+import uuid
 from datetime import datetime
-from flask_migrate import Migrate
 from werkzeug.utils import secure_filename
-app = Flask(__name__)
-socketio = SocketIO(app)
-
-load_dotenv()
-
-app.secret_key = 'MYSECRETKEY'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT') or 465)
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
-
-mail = Mail(app)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-class User(db.Model):
-    __tablename__ = 'users'
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
-    type_of_doctor = db.Column(db.String(120), nullable=True)
-    user_type = db.Column(db.String(20), nullable=True)  # 'doctor', 'patient', or 'asha_worker'
-    phone = db.Column(db.String(15), nullable=True)
-    address = db.Column(db.String(200), nullable=True)
-    date_of_birth = db.Column(db.Date, nullable=True)
-    gender = db.Column(db.String(10), nullable=True)
-    area_of_operation = db.Column(db.String(200), nullable=True)
-    worker_id = db.Column(db.String(50), nullable=True)
-    age = db.Column(db.Integer, nullable=True)
-    blood_group = db.Column(db.String(10), nullable=True)
-    appointments = db.relationship("Appointment", foreign_keys="Appointment.user_id", back_populates="user")
-    assigned_appointments = db.relationship("Appointment", foreign_keys="Appointment.asha_worker_id", back_populates="asha_worker")
-
-class Appointment(db.Model):
-    __tablename__ = 'appointments'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    asha_worker_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    name = db.Column(db.String(100), nullable=False)  # Patient name
-    time_slot = db.Column(db.String(50), nullable=False)
-    type_of_doctor = db.Column(db.String(120), nullable=False)
-    status = db.Column(db.String(20), default='Pending')
-    prescription_file = db.Column(db.String(255), nullable=True)
-    user = db.relationship("User", foreign_keys=[user_id], back_populates="appointments")
-    asha_worker = db.relationship("User", foreign_keys=[asha_worker_id], back_populates="assigned_appointments")
-
-class Doctor(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_doctor_user_id'), nullable=True)
-    name = db.Column(db.String(80), nullable=False)
-    specialty = db.Column(db.String(120), nullable=False)
-    video_call_link = db.Column(db.String(255), nullable=True)
-    phone_number = db.Column(db.String(15), nullable=True)
-    user = db.relationship('User', backref='doctor', uselist=False)
-
-class Consultation(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    doctor_name = db.Column(db.String(100), nullable=False)
-    patient_name = db.Column(db.String(100), nullable=False)
-    video_call_link = db.Column(db.String(255), nullable=True)
-    doctor_joined = db.Column(db.Boolean, default=False)
-    patient_joined = db.Column(db.Boolean, default=False)
-    consultation_date = db.Column(db.DateTime, default=datetime.utcnow)
-
-# Function to Generate Video Call Link
-def generate_video_call_link(doctor_name):
-    print(doctor_name, 'doctor_name')
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    room_name = f"{doctor_name.replace(' ', '')}_{timestamp}"
-    return f"https://meet.jit.si/{room_name}"
+from jinja2 import TemplateError
+from lazy_imports import lazy_import
+from config import Config
+from extensions import db, mail, socketio, migrate, sms, metrics, profiler, logs, assets, compression, rooms, presence, admission, replicas, shards
+from metrics import render_metrics
+from models import User, Appointment, Doctor, Consultation
+from auth import get_current_user, get_current_role, has_role, invalidate_user_role, login_required, role_required
+from fragment_cache import appointment_scopes, asha_scope, bump_version, cached_fragment, specialty_scope
+import analytics
+import archive
+import join_events
+import search_index
+from onboarding import onboard_command, users_cli
+from idempotency import idempotent, replays
+
+# Only needed on a few request paths; imported on first use to keep worker boot fast
+pdfkit = lazy_import('pdfkit', 'pdfkit')
+
+main = Blueprint('main', __name__)
+
+logger = logging.getLogger(__name__)
 
 notifications = []
 
 def send_sms_notification(doctor_phone, patient_name, video_link):
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
     doctor_phone = "+919946597321"
-    # Debug: Print values to check if they're loaded
-    print(f"TWILIO_ACCOUNT_SID: {account_sid}")
-    print(f"TWILIO_AUTH_TOKEN: {auth_token}")
-    print(f"TWILIO_PHONE_NUMBER: {twilio_phone}")
-    print(f"Doctor Phone: {doctor_phone}")
-
-    if not twilio_phone:
-        print("Error: TWILIO_PHONE_NUMBER not set in environment variables")
+
+    if not sms.is_configured():
+        logger.error("SMS not sent: TWILIO_PHONE_NUMBER not set in environment variables")
         return None
 
     try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(
-            body=f"Patient {patient_name} has joined the video call! Join here: {video_link}",
-            from_=twilio_phone,
-            to=doctor_phone
-        )
-        print("SMS Sent:", message.sid)
-        return message.sid
-    except Exception as e:
-        print(f"Failed to send SMS: {e}")
+        sid = sms.send(doctor_phone, f"Patient {patient_name} has joined the video call! Join here: {video_link}")
+        logger.info("SMS sent", extra={'sid': sid, 'notification': 'patient_joined'})
+        return sid
+    except Exception:
+        logger.exception("Failed to send SMS", extra={'notification': 'patient_joined'})
         return None
 
 def send_asha_sms_notification(asha_worker_phone, dr_name, patient_name):
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
     asha_worker_phone = "+919946597321"
-    # Debug: Print values to check if they're loaded
-    print(f"TWILIO_ACCOUNT_SID: {account_sid}")
-    print(f"TWILIO_AUTH_TOKEN: {auth_token}")
-    print(f"TWILIO_PHONE_NUMBER: {twilio_phone}")
 
-    if not twilio_phone:
-        print("Error: TWILIO_PHONE_NUMBER not set in environment variables")
+    if not sms.is_configured():
+        logger.error("SMS not sent: TWILIO_PHONE_NUMBER not set in environment variables")
         return None
 
     try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(
-            body=f"Prescription uploaded for ${patient_name} by ${dr_name}. Please check your account",
-            from_=twilio_phone,
-            to=asha_worker_phone
-        )
-        print("SMS Sent:", message.sid)
-        return message.sid
-    except Exception as e:
-        print(f"Failed to send SMS: {e}")
+        sid = sms.send(asha_worker_phone, f"Prescription uploaded for ${patient_name} by ${dr_name}. Please check your account")
+        logger.info("SMS sent", extra={'sid': sid, 'notification': 'prescription_uploaded'})
+        return sid
+    except Exception:
+        logger.exception("Failed to send SMS", extra={'notification': 'prescription_uploaded'})
         return None
 
 # WebSocket Events
 @socketio.on('connect', namespace='/doctor')
 def doctor_connect():
-    print('doctor connected')
+    logger.debug('Doctor connected')
+    doctor_heartbeat()
     emit('message', {'data': 'Connected to doctor dashboard'})
 
+@socketio.on('heartbeat', namespace='/doctor')
+def doctor_heartbeat():
+    role = get_current_role()
+    if role and role[1]:  # doctors are identified by their specialty
+        presence.heartbeat(session['user_id'], role[1], request.sid)
+
 @socketio.on('connect', namespace='/asha_worker')
 def asha_connect():
-    print('Asha worker connected')
+    logger.debug('Asha worker connected')
     emit('message', {'data': 'Connected to Asha worker dashboard'})
 
 @socketio.on('disconnect', namespace='/doctor')
 def doctor_disconnect():
-    print('Doctor disconnected')
+    logger.debug('Doctor disconnected')
+    if 'user_id' in session:
+        presence.disconnect(session['user_id'], request.sid)
 
-@app.route('/send_notification', methods=['POST'])
+@main.route('/send_notification', methods=['POST'])
 def send_notification():
     data = request.get_json()
     
@@ -168,21 +100,30 @@ def send_notification():
         return jsonify({"error": "No data received"}), 400
 
     notifications.append(data)
-    print("New Notification:", data)
+    logger.info("New notification", extra={'notification': data})
 
     return jsonify({"message": "Notification sent successfully!"}), 200
 
 
 # API for Patient to Check if Doctor is Online
-@app.route('/check-doctor-status/<int:consultation_id>', methods=['GET'])
+@main.route('/check-doctor-status/<int:consultation_id>', methods=['GET'])
+@replicas.read_only()
 def check_doctor_status(consultation_id):
-    consultation = Consultation.query.get(consultation_id)
+    consultation = archive.find_consultation(consultation_id)
     if consultation:
         return jsonify({"doctor_joined": consultation.doctor_joined})
     return jsonify({"error": "Consultation not found"}), 404
 
 
-def create_tables():
+@main.route('/metrics')
+def prometheus_metrics():
+    allowed = current_app.config.get('METRICS_ALLOW_FROM')
+    if allowed and request.remote_addr not in allowed:
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def create_tables(app):
     with app.app_context():
         db.create_all()
 
@@ -206,24 +147,26 @@ def convert_to_pdf(file_path, output_path):
     
 # ============================================================ model ============================================================ 
 
+# Expanded list of possible diseases and their associated symptoms. Built once at
+# import time so preloaded gunicorn workers share it instead of rebuilding it per call.
+possible_diseases = {
+    "fever,cough": ("Flu", 0.85, "General Physician"),
+    "headache,nausea": ("Migraine", 0.75, "Neurologist"),
+    "chest pain,shortness of breath": ("Heart Disease", 0.9, "Cardiologist"),
+    "fever,headache": ("Dengue", 0.8, "General Physician"),
+    "sore throat,fever": ("Strep Throat", 0.7, "ENT Specialist"),
+    "fatigue,muscle pain": ("COVID-19", 0.88, "General Physician"),
+    "abdominal pain,nausea": ("Gastritis", 0.7, "Gastroenterologist"),
+    "joint pain,swelling": ("Arthritis", 0.75, "Rheumatologist"),
+    "rash,itching": ("Allergy", 0.65, "Dermatologist"),
+    "back pain": ("Muscle Strain", 0.6, "Orthopedist"),
+}
+possible_disease_symptoms = [(frozenset(key.split(',')), value) for key, value in possible_diseases.items()]
+
 def predict(symptoms):
     symptoms = [s.strip().lower() for s in symptoms]
     symptom_key = ",".join(sorted(symptoms))
 
-    # Expanded list of possible diseases and their associated symptoms
-    possible_diseases = {
-        "fever,cough": ("Flu", 0.85, "General Physician"),
-        "headache,nausea": ("Migraine", 0.75, "Neurologist"),
-        "chest pain,shortness of breath": ("Heart Disease", 0.9, "Cardiologist"),
-        "fever,headache": ("Dengue", 0.8, "General Physician"),
-        "sore throat,fever": ("Strep Throat", 0.7, "ENT Specialist"),
-        "fatigue,muscle pain": ("COVID-19", 0.88, "General Physician"),
-        "abdominal pain,nausea": ("Gastritis", 0.7, "Gastroenterologist"),
-        "joint pain,swelling": ("Arthritis", 0.75, "Rheumatologist"),
-        "rash,itching": ("Allergy", 0.65, "Dermatologist"),
-        "back pain": ("Muscle Strain", 0.6, "Orthopedist"),
-    }
-
     # Try to find an exact match
     if symptom_key in possible_diseases:
         disease, confidence, specialty = possible_diseases[symptom_key]
@@ -231,9 +174,9 @@ def predict(symptoms):
         # Fallback: Find the best partial match
         best_match = None
         best_score = 0
-        for key, value in possible_diseases.items():
-            key_symptoms = key.split(',')
-            match_score = len(set(symptoms).intersection(key_symptoms)) / len(key_symptoms)
+        symptom_set = set(symptoms)
+        for key_symptoms, value in possible_disease_symptoms:
+            match_score = len(symptom_set.intersection(key_symptoms)) / len(key_symptoms)
             if match_score > best_score:
                 best_match = value
                 best_score = match_score
@@ -243,39 +186,51 @@ def predict(symptoms):
         else:
             disease, confidence, specialty = ("Unknown Disease", 0.5, "General Physician")
 
-    # Find a doctor with the matching specialty
-    doctor = Doctor.query.filter_by(specialty=specialty).first()
-    if doctor:
-        video_conference_link = generate_video_call_link(doctor.name)
-    else:
-        video_conference_link = generate_video_call_link("General Physician")
+    # Prefer a doctor of the matching specialty who is online right now
+    doctor = None
+    online_user_id = presence.pick(specialty)
+    if online_user_id is not None:
+        doctor = Doctor.query.filter_by(user_id=online_user_id).first()
+    if doctor is None:
+        doctor = Doctor.query.filter_by(specialty=specialty).first()
 
-    return disease, confidence, doctor, video_conference_link
+    return disease, confidence, doctor
 # ============================================================ routes ============================================================ 
 
-@app.route('/', methods=['GET', 'POST'])
+@main.route('/', methods=['GET', 'POST'])
+@replicas.read_only()
 def index():
     username = None
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
+    user = get_current_user()
+    if user:
         username = user.username
         if user.user_type == 'doctor':
-            appointments = Appointment.query.filter_by(type_of_doctor=user.type_of_doctor).all()
-            return render_template('doctor-dashboard.html', user=user, username=username, appointments=appointments)
+            appointment_requests = cached_fragment(
+                'doctor-appointment-requests', specialty_scope(user.type_of_doctor),
+                lambda: render_template('partials/doctor-appointment-requests.html',
+                                        appointments=shards.gather(
+                                            Appointment.query.filter_by(type_of_doctor=user.type_of_doctor).all)))
+            return render_template('doctor-dashboard.html', user=user, username=username, appointment_requests=appointment_requests)
         elif user.user_type == 'patient':
             user_appointments = user.appointments
             return render_template('patient-dashboard.html', username=username, user_appointments=user_appointments)
+        elif user.user_type == 'admin':
+            return redirect(url_for('main.admin'))
         else:
-            return render_template('ashaworker-dashboard.html', username=username, user=user)
+            assigned_appointments = cached_fragment(
+                'asha-assigned-appointments', asha_scope(user.id),
+                lambda: render_template('partials/asha-assigned-appointments.html',
+                                        appointments=user.assigned_appointments))
+            return render_template('ashaworker-dashboard.html', username=username, user=user,
+                                   assigned_appointments=assigned_appointments)
             
     return render_template('index.html')
 
-@app.route('/profile/<user_type>', methods=['GET', 'POST'])
+@main.route('/profile/<user_type>', methods=['GET', 'POST'])
+@login_required
+@replicas.read_only(methods=('GET',))
 def profile(user_type):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
+    user = get_current_user()
     
     if request.method == 'POST':
         # Update common fields
@@ -291,12 +246,15 @@ def profile(user_type):
                 user.date_of_birth = datetime.strptime(dob_str, '%Y-%m-%d').date()
             except ValueError:
                 flash('Invalid date format', 'error')
-                return redirect(url_for('profile', user_type=user_type))
+                return redirect(url_for('main.profile', user_type=user_type))
         
         # Update type-specific fields
         if user_type == 'asha_worker':
             user.area_of_operation = request.form.get('area_of_operation')
             user.worker_id = request.form.get('worker_id')
+        # Age and blood group appear in the doctors' appointment tables
+        bump_version(*(scope for appointment in user.appointments for scope in appointment_scopes(appointment)),
+                     shard=shards.shard_of(user))
         
         try:
             db.session.commit()
@@ -304,8 +262,10 @@ def profile(user_type):
         except:
             db.session.rollback()
             flash('Error updating profile', 'error')
+        finally:
+            invalidate_user_role(user.id)
         
-        return redirect(url_for('profile', user_type=user_type))
+        return redirect(url_for('main.profile', user_type=user_type))
     
     template_map = {
         'doctor': 'doctor-profile.html',
@@ -317,9 +277,9 @@ def profile(user_type):
                          user=user,
                          username=user.username,
                          Email=user.email,
-                         user_appointments=user.appointments)
+                         user_appointments=archive.patient_appointments(user))
 
-@app.route('/patient-register', methods=['GET', 'POST'])
+@main.route('/patient-register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -331,13 +291,13 @@ def register():
             db.session.add(user)
             db.session.commit()
             session['user_id'] = user.id
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         except IntegrityError:
             db.session.rollback()
             flash('Username already exists. Please choose a different username.', 'error')
     return render_template('patient-register.html')
 
-@app.route('/doctor_register', methods=['GET', 'POST'])
+@main.route('/doctor_register', methods=['GET', 'POST'])
 def doctor_register():
     if request.method == 'POST':
         username1 = request.form['username']
@@ -351,7 +311,7 @@ def doctor_register():
         existing_user = db.session.get(User, username1)
         if existing_user:
             flash('Username already exists. Please choose a different one.', 'danger')
-            return redirect(url_for('doctor_login'))
+            return redirect(url_for('main.doctor_login'))
 
         # Create new User
         new_user = User(
@@ -379,15 +339,15 @@ def doctor_register():
         try:
             db.session.commit()
             flash('Doctor registered successfully! Please login.', 'success')
-            return redirect(url_for('doctor_login'))
+            return redirect(url_for('main.doctor_login'))
         except Exception as e:
             db.session.rollback()
             flash(f'An error occurred during registration: {str(e)}', 'danger')
-            return redirect(url_for('doctor_register'))
+            return redirect(url_for('main.doctor_register'))
 
     return render_template('doctor-register.html')
 
-@app.route('/asha-register', methods=['GET', 'POST'])
+@main.route('/asha-register', methods=['GET', 'POST'])
 def asha_register():
     if request.method == 'POST':
         username = request.form['username']
@@ -401,24 +361,24 @@ def asha_register():
             db.session.add(user)
             db.session.commit()
             session['user_id'] = user.id
-            return redirect(url_for('asha_login'))
+            return redirect(url_for('main.asha_login'))
         except IntegrityError:
             db.session.rollback()
             flash('Username already exists. Please choose a different username.', 'error')
     return render_template('ashaworker-register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     return render_template('login.html')
 
-@app.route('/patient-dashboard')
+@main.route('/patient-dashboard')
 def patient_dashboard():
     if 'user_id' not in session:
-        return redirect(url_for('patient_login'))
+        return redirect(url_for('main.patient_login'))
     return render_template('patient-dashboard.html')
 
-@app.route('/patient-login', methods=['GET', 'POST'])
+@main.route('/patient-login', methods=['GET', 'POST'])
 def patient_login():
     if request.method == 'POST':
         username = request.form['username']
@@ -426,29 +386,26 @@ def patient_login():
         user = User.query.filter_by(username=username, password=password).first()
         if user:
             session['user_id'] = user.id
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         flash('Invalid credentials', 'error')
     return render_template('patient-login.html')
 
 
-@app.route('/approve_appointment/<int:appointment_id>', methods=['GET'])
+@main.route('/approve_appointment/<int:appointment_id>', methods=['GET'])
+@role_required('doctor')
 def approve_appointment(appointment_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
-    if not user or not user.type_of_doctor:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
+    _, type_of_doctor = get_current_role()
+    appointment = shards.get_or_404(Appointment, appointment_id)
     # Check if this doctor is authorized to approve (based on specialty)
-    if appointment.type_of_doctor != user.type_of_doctor:
+    if appointment.type_of_doctor != type_of_doctor:
         flash('You are not authorized to approve this appointment', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     # Update appointment status
+    old_status = appointment.status
     appointment.status = 'Approved'
+    bump_version(*appointment_scopes(appointment), shard=shards.shard_of(appointment))
+    analytics.record_status_change(appointment, old_status)
     try:
         db.session.commit()
         flash('Appointment approved successfully', 'success')
@@ -456,10 +413,10 @@ def approve_appointment(appointment_id):
         db.session.rollback()
         flash(f'Error approving appointment: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/doctor-login', methods=['GET', 'POST'])
+@main.route('/doctor-login', methods=['GET', 'POST'])
 def doctor_login():
     if request.method == 'POST':
         username1 = request.form['username']
@@ -474,16 +431,16 @@ def doctor_login():
 
             # Redirect doctor to doctor-dashboard
             if user.user_type == "doctor":
-                return redirect(url_for('index'))
+                return redirect(url_for('main.index'))
 
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
 
         flash('Invalid username or password', 'danger')
 
     return render_template('doctor-login.html')
 
 
-@app.route('/asha-login', methods=['GET', 'POST'])
+@main.route('/asha-login', methods=['GET', 'POST'])
 def asha_login():
     if request.method == 'POST':
         username = request.form['username']
@@ -491,44 +448,134 @@ def asha_login():
         user = User.query.filter_by(username=username, password=password, user_type='asha_worker').first()
         if user:
             session['user_id'] = user.id
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         flash('Invalid credentials', 'error')
     return render_template('asha-login.html')
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
-    session.pop('user_id', None)
-    return redirect(url_for('index'))
+    user_id = session.pop('user_id', None)
+    if user_id is not None:
+        invalidate_user_role(user_id)
+    return redirect(url_for('main.index'))
 
-@app.route('/policy')
+@main.route('/policy')
 def policy():
     return render_template('privacy-policy.html')
 
-@app.route('/admin')
+@main.route('/admin')
+@role_required('admin')
 def admin():
-    username = None
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        username = user.username
-        return render_template('admin.html',username=username)
-    return render_template('index.html')
-
-
-@app.route('/chatbot', methods=['GET', 'POST'])
+    return render_template('admin.html', username=get_current_user().username)
+
+@main.route('/admin/profiler')
+@role_required('admin')
+def admin_profiler():
+    return jsonify({
+        'slow_request_threshold': current_app.config.get('SLOW_REQUEST_THRESHOLD'),
+        'files': profiler.list_files(),
+    })
+
+@main.route('/admin/profiler/start', methods=['POST'])
+@role_required('admin')
+def admin_profiler_start():
+    seconds = request.args.get('seconds', 10, type=float)
+    seconds = max(1.0, min(seconds, current_app.config['PROFILE_MAX_SECONDS']))
+    name = profiler.start_profile(seconds)
+    if name is None:
+        return jsonify({"error": "A profile is already running in this worker"}), 409
+    return jsonify({
+        "file": name,
+        "seconds": seconds,
+        "url": url_for('main.admin_profiler_file', name=name),
+    }), 202
+
+@main.route('/admin/profiler/<name>')
+@role_required('admin')
+def admin_profiler_file(name):
+    path = profiler.path_for(name)
+    if path is None:
+        abort(404)
+    mimetype = 'application/json' if name.endswith('.json') else 'text/plain'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
+
+@main.route('/admin/presence')
+@role_required('admin')
+def admin_presence():
+    online = presence.online()
+    user_ids = [user_id for ids in online.values() for user_id in ids]
+    names = dict(db.session.execute(db.select(User.id, User.username).where(User.id.in_(user_ids))).all()) if user_ids else {}
+    return jsonify({
+        'online': sum(len(ids) for ids in online.values()),
+        'specialties': {specialty: [{'user_id': user_id, 'username': names.get(user_id)} for user_id in ids]
+                        for specialty, ids in sorted(online.items())},
+    })
+
+@main.route('/admin/shards')
+@role_required('admin')
+def admin_shards():
+    def counts():
+        by_status = db.session.execute(db.select(Appointment.status, db.func.count()).group_by(Appointment.status)).all()
+        return {
+            'appointments': {status or 'None': count for status, count in by_status},
+            'consultations': db.session.execute(db.select(db.func.count()).select_from(Consultation)).scalar(),
+        }
+    # Every shard counted in parallel
+    return jsonify({'shards': [{'shard': name or 'primary', 'districts': shards.districts_of(name), **result}
+                               for name, result in shards.scatter(counts).items()]})
+
+@main.route('/admin/analytics')
+@role_required('admin')
+@replicas.read_only()
+def admin_analytics():
+    days = request.args.get('days', 30, type=int)
+    return jsonify(analytics.summary(days=max(1, min(days, 366))))
+
+
+@main.route('/search')
+@login_required
+@replicas.read_only()
+def search():
+    # Doctors search their specialty's appointments and their own consultations; admins everything
+    if has_role('admin'):
+        kinds, filters = list(search_index.KINDS), {}
+    elif has_role('doctor'):
+        user = get_current_user()
+        kinds = ['appointment', 'consultation']
+        filters = {'appointment': {'type_of_doctor': user.type_of_doctor},
+                   'consultation': {'doctor_name': user.username}}
+    else:
+        return jsonify({"error": "Search is for doctors and admins"}), 403
+    requested = request.args.getlist('type')
+    if requested:
+        kinds = [kind for kind in kinds if kind in requested]
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    started = time.perf_counter()
+    results = search_index.search(query, kinds=kinds, limit=limit, filters=filters)
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@main.route('/chatbot', methods=['GET', 'POST'])
+@admission.limit('chatbot', methods=('POST',), exempt=replays('chatbot'))
+@idempotent('chatbot')
 def chatbot():
     if 'user_id' not in session:
         flash('Please log in to access the chatbot.', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
         
-    user = db.session.get(User, session['user_id'])
+    user = get_current_user()
     if not user:
         flash('User not found.', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     # Check if age or blood_group is missing
     if not user.age or not user.blood_group:
         flash('Please update your profile with age and blood group before using the chatbot.', 'warning')
-        return redirect(url_for('profile', user_type='patient'))
+        return redirect(url_for('main.profile', user_type='patient'))
     
     if request.method == 'POST':
         try:
@@ -540,7 +587,7 @@ def chatbot():
                 return jsonify({"error": "Missing 'user_input' field"}), 400
     
             symptoms = user_input.split(',')
-            predicted_disease, confidence_score, doctor, video_conference_link = predict(symptoms)
+            predicted_disease, confidence_score, doctor = predict(symptoms)
 
             if doctor:
                 doctor_name = doctor.name
@@ -551,20 +598,15 @@ def chatbot():
                 doctor_phone_number = "+919778229882"
                 specialty = "General Medicine"
 
-            if 'user_id' not in session:
-                return jsonify({"error": "User not logged in"}), 401
-            user = db.session.get(User, session['user_id'])
-            if not user:
-                return jsonify({"error": "User not found"}), 404
-            
-            asha_worker = User.query.filter_by(user_type='asha_worker').first()
+            # The appointment lives in the patient's district shard; so must its ASHA worker
+            asha_worker = User.query.filter_by(user_type='asha_worker').filter(
+                shards.district_filter(User.area_of_operation, shards.current())).first()
             if not asha_worker:
                 return jsonify({"error": "No ASHA worker available"}), 503
 
             consultation = Consultation(
                 doctor_name=doctor_name,
                 patient_name=user.username,
-                video_call_link=video_conference_link
             )
             db.session.add(consultation)
             db.session.flush()
@@ -575,12 +617,15 @@ def chatbot():
                 time_slot="Immediate",  # Adjust as needed
                 type_of_doctor=specialty,
                 status='Pending',
-                asha_worker_id=asha_worker.id  # Assign ASHA worker
+                asha_worker_id=asha_worker.id,  # Assign ASHA worker
+                predicted_disease=predicted_disease,
             )
             db.session.add(appointment)
+            bump_version(*appointment_scopes(appointment), shard=shards.shard_of(appointment))
+            analytics.record_booking(appointment, consultation, predicted_disease)
             db.session.commit()
 
-            join_url = url_for('join_video', consultation_id=consultation.id, _external=True)
+            join_url = url_for('main.join_video', consultation_id=consultation.id, _external=True)
             # Notify ASHA worker via SocketIO
             socketio.emit('appointment_assigned', {
                 'appointment_id': appointment.id,
@@ -594,25 +639,26 @@ def chatbot():
                 "message": f"Based on your symptoms, you might have {predicted_disease}. Please consult {doctor_name}.",
                 "video_link": join_url,
                 "doctor_name": doctor_name,
-                "consultation_id": consultation.id
+                "consultation_id": consultation.id,
+                "appointment_id": appointment.id
             }
             return jsonify(response)
-        except Exception as e:
-            print(f"Error in /chatbot route: {e}")
+        except Exception:
+            logger.exception("Error in /chatbot route")
             db.session.rollback()
             return jsonify({"error": "An error occurred"}), 500
     return render_template('chatbot.html')
 
 
-@app.route('/join_video/<int:consultation_id>')
+@main.route('/join_video/<int:consultation_id>')
+@admission.limit('join_video')
 def join_video(consultation_id):
-    consultation = Consultation.query.get_or_404(consultation_id)
-    print(consultation,'consultations')
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if not user.type_of_doctor:  # Patient
-            consultation.patient_joined = True  # Mark patient as joined
-            db.session.commit()
+    consultation = shards.get_or_404(Consultation, consultation_id)
+    user = get_current_user()
+    if user:
+        # Written, and the doctor notified, only the first time; reloads just redirect
+        if not user.type_of_doctor and join_events.record_join(consultation, 'patient'):  # Patient
+            logger.info('Patient joined consultation', extra={'consultation_id': consultation_id})
             # Notify doctor via WebSocket and SMS
             socketio.emit('patient_joined', {
                 'patient_name': user.username,
@@ -620,95 +666,67 @@ def join_video(consultation_id):
                 'consultation_id': consultation_id
             }, namespace='/doctor')
             doctor = Doctor.query.filter_by(name=consultation.doctor_name).first()
-            print(doctor, 'doctor')
             if doctor:
-                print(doctor.phone_number, 'phonenumber')
-                send_sms_notification(doctor.phone_number, user.username, consultation.video_call_link)
+                # Twilio can take seconds to answer; don't hold the request for it
+                socketio.start_background_task(send_sms_notification, doctor.phone_number, user.username, consultation.video_call_link)
         return redirect(consultation.video_call_link)  # Redirect to Jitsi URL
     
-    # For doctors, redirect to dashboard (they join via /doctor_join_consultation)
-    if user.type_of_doctor:
-        return redirect(url_for('index'))
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/doctor_join_consultation/<int:consultation_id>', methods=['GET'])
+@main.route('/doctor_join_consultation/<int:consultation_id>', methods=['GET'])
+@role_required('doctor')
 def doctor_join_consultation(consultation_id):
-    print('join function called')
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
-    if not user or not user.type_of_doctor:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('index'))
-    
-    consultation = Consultation.query.get_or_404(consultation_id)
+    user = get_current_user()
+    consultation = shards.get_or_404(Consultation, consultation_id)
     doctor = Doctor.query.filter_by(name=consultation.doctor_name).first()
     
     if not doctor or doctor.name != user.username:
         flash('You are not assigned to this consultation', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # Update consultation status
-    consultation.doctor_joined = True
-    try:
-        db.session.commit()
+    # Update consultation status; notify only on the first join, not on reloads
+    if join_events.record_join(consultation, 'doctor'):
+        logger.info('Doctor joined consultation', extra={'consultation_id': consultation_id})
         flash('Consultation started successfully', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Error starting consultation: {str(e)}', 'error')
-        return redirect(url_for('index'))
-    
-    # Notify ASHA workers
-    socketio.emit('doctor_joined', {
-        'doctor_name': user.username,
-        'video_link': consultation.video_call_link,
-        'consultation_id': consultation_id
-    }, namespace='/asha_worker')
-    
-    return redirect(consultation.video_call_link)
 
+        # Notify ASHA workers
+        socketio.emit('doctor_joined', {
+            'doctor_name': user.username,
+            'video_link': consultation.video_call_link,
+            'consultation_id': consultation_id
+        }, namespace='/asha_worker')
 
+    return redirect(consultation.video_call_link)
 
-import os
-from werkzeug.utils import secure_filename
 
-# Configure upload folder
-UPLOAD_FOLDER = 'static/prescriptions'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/doctor_patients', methods=['GET'])
+@main.route('/doctor_patients', methods=['GET'])
+@role_required('doctor')
+@replicas.read_only()
 def doctor_patients():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
-    if not user or not user.type_of_doctor:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('index'))
-    
+    user = get_current_user()
     # Fetch appointments for this doctor's specialty
-    appointments = Appointment.query.filter_by(type_of_doctor=user.type_of_doctor).all()
-    return render_template('doctor-patients.html', appointments=appointments, username=user.username)
-
-@app.route('/upload_prescription/<int:appointment_id>', methods=['GET', 'POST'])
+    patient_rows = cached_fragment(
+        'doctor-patients-rows', specialty_scope(user.type_of_doctor),
+        lambda: render_template('partials/doctor-patients-rows.html',
+                                appointments=shards.gather(
+                                    Appointment.query.filter_by(type_of_doctor=user.type_of_doctor).all)))
+    return render_template('doctor-patients.html', patient_rows=patient_rows, username=user.username)
+
+@main.route('/upload_prescription/<int:appointment_id>', methods=['GET', 'POST'])
+@role_required('doctor')
+@admission.limit('upload_prescription', methods=('POST',), exempt=replays('upload_prescription'))
+@idempotent('upload_prescription')
 def upload_prescription(appointment_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
-    if not user or not user.type_of_doctor:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
+    user = get_current_user()
+    appointment = shards.get_or_404(Appointment, appointment_id)
     if appointment.type_of_doctor != user.type_of_doctor:
         flash('You are not authorized to upload a prescription for this appointment', 'error')
-        return redirect(url_for('doctor_patients'))
+        return redirect(url_for('main.doctor_patients'))
     
     if request.method == 'POST':
         if 'file' not in request.files:
@@ -720,62 +738,141 @@ def upload_prescription(appointment_id):
             return redirect(request.url)
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
             appointment.prescription_file = file_path
+            old_status = appointment.status
             appointment.status = 'Prescribed'
+            bump_version(*appointment_scopes(appointment), shard=shards.shard_of(appointment))
+            analytics.record_status_change(appointment, old_status)
             db.session.commit()
             flash('Prescription uploaded successfully', 'success')
             asha_worker = appointment.asha_worker
             asha_worker_phone = asha_worker.phone
-            send_asha_sms_notification(asha_worker_phone, user.username, appointment.name)
+            socketio.start_background_task(send_asha_sms_notification, asha_worker_phone, user.username, appointment.name)
             socketio.emit('prescription_uploaded', {
                 'appointment_id': appointment_id,
                 'doctor_name': user.username,
                 'patient_name': appointment.name
             }, namespace='/asha_worker')
-            return redirect(url_for('doctor_patients'))
+            return redirect(url_for('main.doctor_patients'))
         else:
             flash('Invalid file type. Allowed: pdf, doc, docx', 'error')
     
-    return render_template('upload_prescription.html', appointment=appointment)
+    # A new key per rendered form: submitting it twice uploads once
+    return render_template('upload_prescription.html', appointment=appointment, idempotency_key=uuid.uuid4().hex)
 
 # Assuming this route exists for prescribing medicine
-@app.route('/prescribe_medicine/<int:appointment_id>')
+@main.route('/prescribe_medicine/<int:appointment_id>')
 def prescribe_medicine(appointment_id):
     # Redirect to upload_prescription for consistency
-    return redirect(url_for('upload_prescription', appointment_id=appointment_id))
+    return redirect(url_for('main.upload_prescription', appointment_id=appointment_id))
 
-@app.route('/view_prescription/<int:appointment_id>')
+@main.route('/view_prescription/<int:appointment_id>')
 def view_prescription(appointment_id):
-    appointment = Appointment.query.get_or_404(appointment_id)
+    appointment = archive.find_appointment(appointment_id)
     if not appointment.prescription_file:
         flash('No prescription available', 'error')
-        return redirect(url_for('doctor_patients'))
+        return redirect(url_for('main.doctor_patients'))
     return send_file(appointment.prescription_file, as_attachment=False)
-@app.route('/download_prescription/<int:appointment_id>')
-
+@main.route('/download_prescription/<int:appointment_id>')
+@role_required('asha_worker')
 def download_prescription(appointment_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
-    if not user or user.user_type != 'asha_worker':
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    if appointment.asha_worker_id != user.id:
+    appointment = archive.find_appointment(appointment_id)
+    if appointment.asha_worker_id != session['user_id']:
         flash('You are not assigned to this appointment', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     if not appointment.prescription_file:
         flash('No prescription available', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     return send_file(appointment.prescription_file, as_attachment=True, download_name=f"prescription_{appointment_id}.{appointment.prescription_file.split('.')[-1]}")
 
-if __name__ == '__main__':
+# ============================================================ app factory ============================================================ 
+
+def create_app(config=None):
+    """Build and configure an application instance.
+
+    ``config`` may be a config class/object or a mapping of overrides on top of
+    :class:`config.Config`.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    logs.init_app(app)
+
+    # Adds a bind per shard, so before db.init_app()
+    shards.init_app(app, current_user=get_current_user)
+    db.init_app(app)
+    mail.init_app(app)
+    sms.init_app(app)
+    migrate.init_app(app, db)
+    socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                      message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+    metrics.init_app(app, db=db, socketio=socketio)
+    profiler.init_app(app, db=db)
+    assets.init_app(app)
+    compression.init_app(app)
+    rooms.init_app(app)
+    presence.init_app(app)
+    admission.init_app(app)
+    replicas.init_app(app, db)
+    app.cli.add_command(analytics.analytics_cli)
+    app.cli.add_command(archive.archive_cli)
+    app.cli.add_command(search_index.search_cli)
+    app.cli.add_command(onboard_command)
+    app.cli.add_command(users_cli)
+    app.register_blueprint(main)
+
+    if app.config.get('PRELOAD_TEMPLATES'):
+        warm_up(app)
+    return app
+
+def warm_up(app):
+    """Build read-only state up front so forked workers share it copy-on-write."""
+    for template_name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(template_name)
+        except TemplateError as e:
+            # A broken template only fails the page that renders it, not worker boot
+            app.logger.warning('Skipping template %s during warm-up: %s', template_name, e)
+    # Compile the URL matcher now rather than on each worker's first request
+    app.url_map.update()
+
+def prepare_fork():
+    """Called in the gunicorn master right before workers are forked."""
+    # Move everything allocated so far into the permanent generation so the
+    # workers' garbage collector never writes to (and un-shares) those pages.
+    gc.collect()
+    gc.freeze()
+
+def reinit_after_fork(app):
+    """Reset per-process resources inherited from the gunicorn master."""
+    # Each worker needs its own random stream, not a copy of the master's
+    random.seed()
+    logs.reset_after_fork()
     with app.app_context():
-        db.create_all()  # Create all database tables
-    app.run(debug=True)
\ No newline at end of file
+        # Drop pooled connections opened in the master without closing them out from
+        # under the parent; each worker opens its own on first use.
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    profiler.reset_after_fork()
+    rooms.reset_after_fork()
+    presence.reset_after_fork()
+    join_events.reset_after_fork()
+    server = socketio.server
+    if server is not None:
+        # Rooms and any message-queue listener belong to a single process; let each
+        # worker initialise its own on its first connection.
+        server.manager_initialized = False
+
+# APP_CONFIG may name another config object, e.g. APP_CONFIG=config.TestConfig
+app = create_app(os.getenv('APP_CONFIG'))
+
+if __name__ == '__main__':
+    create_tables(app)  # Create all database tables
+    socketio.run(app, debug=True)
\ No newline at end of file
@@ -0,0 +1,125 @@
+# archive.py
+# Hot/cold split of appointments and consultations.
+#
+#   flask --app app archive run [--older-than-days 90] [--batch-size 500]
+#
+# moves Prescribed appointments untouched for ARCHIVE_AFTER_DAYS, and
+# consultations both sides joined that long ago, into appointments_archive and
+# consultations_archive. Each batch is one short transaction (copy, delete,
+# bump the fragment-cache scopes), so the job can run next to live traffic
+# and be stopped at any point. The dashboards then only ever filter the
+# recent rows. Patient history and prescription links read through to the
+# archive with find_appointment() / patient_appointments().
+from datetime import datetime, timedelta
+
+import click
+from flask import abort, current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import delete, insert, literal, select
+
+from extensions import db, shards
+from fragment_cache import appointment_scopes, bump_version
+from models import Appointment, ArchivedAppointment, ArchivedConsultation, Consultation
+
+CLOSED_STATUSES = ('Prescribed',)
+
+
+def _closed_appointments(cutoff):
+    return (Appointment.status.in_(CLOSED_STATUSES), Appointment.updated_at < cutoff)
+
+
+def _finished_consultations(cutoff):
+    return (Consultation.patient_joined.is_(True), Consultation.doctor_joined.is_(True),
+            Consultation.consultation_date < cutoff)
+
+
+def _move(model, archive_model, ids, archived_at):
+    columns = [column.name for column in model.__table__.columns]
+    db.session.execute(insert(archive_model).from_select(
+        columns + ['archived_at'],
+        select(*model.__table__.columns, literal(archived_at)).where(model.id.in_(ids))))
+    db.session.execute(delete(model).where(model.id.in_(ids)))
+
+
+def archive_appointments(cutoff, batch_size):
+    """Move one batch of closed appointments; return how many were moved."""
+    rows = db.session.execute(
+        select(Appointment.id, Appointment.type_of_doctor, Appointment.asha_worker_id)
+        .where(*_closed_appointments(cutoff)).order_by(Appointment.id).limit(batch_size)).all()
+    if not rows:
+        return 0
+    _move(Appointment, ArchivedAppointment, [row.id for row in rows], datetime.utcnow())
+    # The rows leave the doctor and ASHA tables
+    bump_version(*(scope for row in rows for scope in appointment_scopes(row)))
+    db.session.commit()
+    return len(rows)
+
+
+def archive_consultations(cutoff, batch_size):
+    """Move one batch of finished consultations; return how many were moved."""
+    ids = db.session.execute(
+        select(Consultation.id).where(*_finished_consultations(cutoff))
+        .order_by(Consultation.id).limit(batch_size)).scalars().all()
+    if not ids:
+        return 0
+    _move(Consultation, ArchivedConsultation, ids, datetime.utcnow())
+    db.session.commit()
+    return len(ids)
+
+
+def run(older_than_days=None, batch_size=None, max_batches=None):
+    """Archive everything old enough, batch by batch; return the counts moved."""
+    config = current_app.config
+    older_than_days = older_than_days or config['ARCHIVE_AFTER_DAYS']
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = {'appointments': 0, 'consultations': 0}
+    # Each shard holds its own archive tables
+    for shard in shards.all():
+        with shards.use(shard):
+            for key, archive_batch in (('appointments', archive_appointments),
+                                       ('consultations', archive_consultations)):
+                batches = 0
+                while max_batches is None or batches < max_batches:
+                    count = archive_batch(cutoff, batch_size)
+                    moved[key] += count
+                    batches += 1
+                    if count < batch_size:
+                        break
+    return moved
+
+
+def find_appointment(appointment_id):
+    """The appointment, hot or archived; 404 if neither has it."""
+    appointment = shards.get(Appointment, appointment_id) or shards.get(ArchivedAppointment, appointment_id)
+    if appointment is None:
+        abort(404)
+    return appointment
+
+
+def find_consultation(consultation_id):
+    """The consultation, hot or archived, or None."""
+    return shards.get(Consultation, consultation_id) or shards.get(ArchivedConsultation, consultation_id)
+
+
+def patient_appointments(user):
+    """All of ``user``'s appointments, archived ones first (they are the oldest)."""
+    with shards.use(shards.shard_of_user(user)):
+        archived = db.session.execute(
+            select(ArchivedAppointment).where(ArchivedAppointment.user_id == user.id)
+            .order_by(ArchivedAppointment.id)).scalars().all()
+        return archived + list(user.appointments)
+
+
+archive_cli = AppGroup('archive', help='Move old appointments and consultations to the archive tables.')
+
+
+@archive_cli.command('run')
+@click.option('--older-than-days', type=int, default=None, help='Defaults to ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', type=int, default=None, help='Rows per transaction; defaults to ARCHIVE_BATCH_SIZE.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches per table.')
+@with_appcontext
+def run_command(older_than_days, batch_size, max_batches):
+    """Archive Prescribed appointments and finished consultations."""
+    moved = run(older_than_days, batch_size, max_batches)
+    click.echo(f"Archived {moved['appointments']} appointments and {moved['consultations']} consultations")
@@ -0,0 +1,256 @@
+# assets.py
+# Build step and serving for fingerprinted CSS/JS.
+#
+#   flask --app app assets build
+#
+# minifies every stylesheet and script under static/css and static/js, writes
+# each as <name>.<hash>.<ext> into ASSETS_DIR together with .gz and .br
+# variants, and records the mapping in manifest.json. Templates link them with
+# {{ asset_url('css/style.css') }}; the hashed URLs are served from /assets/
+# with a one-year immutable Cache-Control, so repeat visits fetch nothing.
+# Without a build (local runs), asset_url() falls back to the plain static file.
+# The same build generates the responsive images (see image_derivatives.py).
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from flask.cli import AppGroup, with_appcontext
+
+from image_derivatives import IMAGES_MANIFEST_NAME, MODERN_FORMATS, build_images, load_images_manifest
+from lazy_imports import is_available, lazy_import
+
+brotli = lazy_import('brotli', 'brotli')
+rcssmin = lazy_import('rcssmin', 'rcssmin')
+rjsmin = lazy_import('rjsmin', 'rjsmin')
+
+SOURCE_DIRS = {'css': '.css', 'js': '.js'}
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Variants in order of preference, by Accept-Encoding token
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Outputs worth precompressing; images are already compressed, except SVG
+COMPRESSIBLE = ('.css', '.js', '.svg')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+# Not known to every Python's mimetypes table
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(text):
+    if is_available('rcssmin'):
+        return rcssmin.cssmin(text)
+    text = _CSS_COMMENT.sub('', text)
+    text = _CSS_SPACE.sub(' ', text)
+    # ':' is left alone: it is significant inside selectors ("a :hover" != "a:hover")
+    text = _CSS_PUNCTUATION.sub(r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    if is_available('rjsmin'):
+        return rjsmin.jsmin(text)
+    # Without a real tokenizer only whole-line changes are safe: drop indentation,
+    # blank lines and lines that are nothing but a // comment.
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def _rewrite_css_urls(text, source_name, manifest, static_url_path, assets_url_path):
+    """Point relative url() references at their final location.
+
+    The built file is served from another path than its source, so
+    '../images/x.jpg' has to become '/static/images/x.jpg'.
+    """
+    def replace(match):
+        ref = match.group(2).strip()
+        if re.match(r'^([a-z]+:|/|#)', ref, re.I):
+            return match.group(0)
+        path, sep, suffix = ref.partition('?')
+        target = os.path.normpath(os.path.join(os.path.dirname(source_name), path)).replace(os.sep, '/')
+        if target in manifest:
+            url = f'{assets_url_path}/{manifest[target]}'
+        else:
+            url = f'{static_url_path}/{target}'
+        return f"url('{url}{sep}{suffix}')"
+    return _CSS_URL.sub(replace, text)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_folder, out_dir, static_url_path='/static', assets_url_path='/assets'):
+    """Minify, fingerprint and precompress every CSS/JS source and image; return the manifest."""
+    written = {MANIFEST_NAME, IMAGES_MANIFEST_NAME}
+
+    def write(name, data):
+        target = os.path.join(out_dir, name)
+        _write(target, data)
+        written.add(name)
+        if not name.endswith(COMPRESSIBLE):
+            return
+        # mtime=0 keeps the .gz byte-identical between builds of the same input
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if is_available('brotli'):
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(data):
+                _write(target + suffix, compressed)
+                written.add(name + suffix)
+
+    # Images first, so the stylesheets can point at their hashed names
+    manifest, images = build_images(static_folder, write)
+
+    sources = []
+    for subdir, extension in SOURCE_DIRS.items():
+        for root, _, files in os.walk(os.path.join(static_folder, subdir)):
+            for name in sorted(files):
+                if name.endswith(extension):
+                    path = os.path.join(root, name)
+                    sources.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+
+    # Scripts before stylesheets, for the same reason
+    for name in sorted(sources, key=lambda n: (n.endswith('.css'), n)):
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith('.css'):
+            text = _rewrite_css_urls(minify_css(text), name, manifest, static_url_path, assets_url_path)
+        else:
+            text = minify_js(text)
+        data = text.encode('utf-8')
+        stem, extension = os.path.splitext(name)
+        hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        manifest[name] = hashed
+        write(hashed, data)
+
+    # Drop outputs of earlier builds
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), out_dir).replace(os.sep, '/')
+            if relative not in written:
+                os.remove(os.path.join(root, name))
+
+    for name, contents in ((MANIFEST_NAME, manifest), (IMAGES_MANIFEST_NAME, images)):
+        with open(os.path.join(out_dir, name), 'w') as f:
+            json.dump(contents, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return manifest
+
+
+class Assets:
+    """Flask extension providing asset_url(), image_sources() and the /assets/ route."""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.url_path = '/assets'
+        self.manifest = {}
+        self.images = {}  # plain image name -> <picture> data, see image_sources()
+        self.encodings = {}  # hashed name -> precompressed variants present on disk
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('ASSETS_DIR') or os.path.join(app.static_folder, 'dist')
+        self.url_path = app.config.get('ASSETS_URL_PATH', self.url_path)
+        self.load_manifest()
+        app.add_url_rule(f'{self.url_path}/<path:filename>', endpoint='assets', view_func=self.serve)
+        app.add_template_global(self.asset_url, 'asset_url')
+        app.add_template_global(self.image_sources, 'image_sources')
+        app.cli.add_command(assets_cli)
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        files = set(self.manifest.values())
+        self.images = {}
+        for name, entry in load_images_manifest(self.directory).items():
+            self.images[name] = self._picture(entry)
+            files.update(hashed for variants in entry['sources'].values() for _, hashed in variants)
+        self.encodings = {
+            hashed: tuple(token for token, suffix in ENCODINGS
+                          if os.path.exists(os.path.join(self.directory, hashed + suffix)))
+            for hashed in files
+        }
+
+    def _picture(self, entry):
+        # Built once per process: srcset strings for every format, relative to the app root
+        def srcset(fmt):
+            return ', '.join(f'{self.url_path}/{hashed} {width}w' for width, hashed in entry['sources'][fmt])
+        fallback = entry['fallback']
+        return {
+            'width': entry['width'],
+            'height': entry['height'],
+            'src': f"{self.url_path}/{entry['sources'][fallback][-1][1]}",
+            'srcset': srcset(fallback),
+            'sources': [(MIME_TYPES[fmt], srcset(fmt)) for fmt in MODERN_FORMATS if fmt in entry['sources']],
+        }
+
+    def asset_url(self, name):
+        hashed = self.manifest.get(name)
+        if hashed is None:
+            return url_for('static', filename=name)
+        return url_for('assets', filename=hashed)
+
+    def image_sources(self, name):
+        """<picture> data for an image under static/, or None if it has no derivatives."""
+        picture = self.images.get(name)
+        if picture is None or not request.script_root:
+            return picture
+        root = request.script_root
+        return dict(picture, src=root + picture['src'],
+                    srcset=picture['srcset'].replace(f'{self.url_path}/', f'{root}{self.url_path}/'),
+                    sources=[(mime, srcset.replace(f'{self.url_path}/', f'{root}{self.url_path}/'))
+                             for mime, srcset in picture['sources']])
+
+    def serve(self, filename):
+        variants = self.encodings.get(filename)
+        if variants is None:
+            abort(404)
+        encoding = next((token for token in variants if request.accept_encodings[token] > 0), None)
+        path = os.path.join(self.directory, filename)
+        if encoding is not None:
+            path += dict(ENCODINGS)[encoding]
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+
+@assets_cli.command('build')
+@with_appcontext
+def build_command():
+    """Minify, fingerprint and precompress static/css and static/js; derive static/images."""
+    extension = current_app.extensions['assets']
+    manifest = build(current_app.static_folder, extension.directory,
+                     static_url_path=current_app.static_url_path,
+                     assets_url_path=current_app.config.get('ASSETS_URL_PATH', '/assets'))
+    extension.load_manifest()
+    if not is_available('brotli'):
+        click.echo('brotli is not installed; only .gz variants were written')
+    if not is_available('PIL'):
+        click.echo('Pillow is not installed; raster images were not resized or converted')
+    click.echo(f'Built {len(manifest)} assets into {extension.directory}')
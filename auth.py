@@ -0,0 +1,95 @@
+# auth.py
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, session, redirect, url_for, flash
+from extensions import db
+from models import User
+
+# Role fields rarely change after registration, so each worker keeps a small
+# TTL cache of them and has_role() can skip the users table, e.g. for views
+# that only branch on the role. role_required() does not use the cache: it
+# loads the user (which the guarded view needs anyway) and authorizes from
+# that row, so a promotion (`flask users promote`) or a deleted account takes
+# effect on the next request.
+ROLE_CACHE_TTL = 300
+ROLE_CACHE_MAX_SIZE = 4096
+_role_cache = OrderedDict()  # user_id -> (expires_at, user_type, type_of_doctor)
+_role_cache_lock = threading.Lock()
+
+def cache_user_role(user):
+    with _role_cache_lock:
+        _role_cache[user.id] = (time.monotonic() + ROLE_CACHE_TTL, user.user_type, user.type_of_doctor)
+        _role_cache.move_to_end(user.id)
+        while len(_role_cache) > ROLE_CACHE_MAX_SIZE:
+            _role_cache.popitem(last=False)
+
+def invalidate_user_role(user_id):
+    with _role_cache_lock:
+        _role_cache.pop(user_id, None)
+
+def get_current_user():
+    """Load the logged-in user once per request and memoize it on g.current_user."""
+    if 'current_user' not in g:
+        user = None
+        if 'user_id' in session:
+            user = db.session.get(User, session['user_id'])
+            if user:
+                cache_user_role(user)
+        g.current_user = user
+    return g.current_user
+
+def get_current_role():
+    """Return (user_type, type_of_doctor) for the session user, or None if logged out."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    if 'current_user' not in g:
+        with _role_cache_lock:
+            entry = _role_cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1], entry[2]
+    user = get_current_user()
+    if not user:
+        return None
+    return user.user_type, user.type_of_doctor
+
+def _matches(role, user_type, type_of_doctor):
+    if role == 'doctor':
+        # Doctors are identified by their specialty throughout the app
+        return bool(type_of_doctor)
+    return user_type == role
+
+def has_role(role):
+    current_role = get_current_role()
+    if not current_role:
+        return False
+    return _matches(role, *current_role)
+
+def login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('main.login'))
+        return view(*args, **kwargs)
+    return wrapped
+
+def role_required(role):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if 'user_id' not in session:
+                return redirect(url_for('main.login'))
+            user = get_current_user()
+            if user is None:
+                # The account is gone
+                invalidate_user_role(session['user_id'])
+                session.clear()
+                return redirect(url_for('main.login'))
+            if not _matches(role, user.user_type, user.type_of_doctor):
+                flash('Unauthorized access', 'error')
+                return redirect(url_for('main.index'))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
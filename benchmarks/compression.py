@@ -0,0 +1,82 @@
+"""CPU cost versus bytes saved of response compression, per template.
+
+Renders each page offline (config.TestConfig, see hotpaths.py) and compresses
+its body at several gzip levels and brotli qualities:
+
+    python benchmarks/compression.py                   # 1000 appointments per dashboard
+    python benchmarks/compression.py --appointments 10000
+
+Prints raw and compressed size, the share of bytes saved and the time one
+compression takes. Use it to pick COMPRESS_GZIP_LEVEL / COMPRESS_BROTLI_QUALITY:
+past a point each extra level costs a lot of CPU for very few bytes.
+"""
+import argparse
+import gzip
+import sys
+
+# hotpaths puts the repository root on sys.path
+from hotpaths import build_app, logged_in_client, measure
+from lazy_imports import is_available, lazy_import
+
+brotli = lazy_import('brotli', 'brotli')
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 6, 11)
+
+
+def settings():
+    for level in GZIP_LEVELS:
+        yield f'gzip-{level}', lambda data, level=level: gzip.compress(data, compresslevel=level)
+    if is_available('brotli'):
+        for quality in BROTLI_QUALITIES:
+            yield f'br-{quality}', lambda data, quality=quality: brotli.compress(data, quality=quality)
+
+
+def collect_bodies(appointments):
+    flask_app, ids = build_app(appointments)
+    anonymous = flask_app.test_client()
+    patient = logged_in_client(flask_app, ids['patient'])
+    doctor = logged_in_client(flask_app, ids['doctor'])
+    asha = logged_in_client(flask_app, ids['asha'])
+    headers = {'Accept-Encoding': 'identity'}
+
+    def body(client, path):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, (path, response.status_code)
+        return response.get_data()
+
+    bodies = {
+        'index.html': body(anonymous, '/'),
+        'patient-dashboard.html': body(patient, '/'),
+        'doctor-dashboard.html': body(doctor, '/'),
+        'doctor-patients.html': body(doctor, '/doctor_patients'),
+        'ashaworker-dashboard.html': body(asha, '/'),
+        'privacy-policy.html': body(anonymous, '/policy'),
+    }
+    response = patient.post('/chatbot', json={'user_input': 'fever,cough'}, headers=headers)
+    assert response.status_code == 200, response.status_code
+    bodies['/chatbot (JSON)'] = response.get_data()
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--appointments', type=int, default=1000,
+                        help='appointments behind the dashboards (default 1000)')
+    args = parser.parse_args()
+
+    bodies = collect_bodies(args.appointments)
+    print(f"{'page':<28}{'setting':>9}{'bytes':>10}{'saved':>8}{'ms':>9}{'us/KB':>8}")
+    for page, data in bodies.items():
+        print(f'{page:<28}{"raw":>9}{len(data):>10}')
+        for name, compress in settings():
+            size = len(compress(data))
+            seconds = measure(lambda: compress(data), min_time=0.2)
+            saved = 1 - size / len(data)
+            print(f"{'':<28}{name:>9}{size:>10}{saved:>8.1%}{seconds * 1000:>9.3f}"
+                  f"{seconds * 1e6 / (len(data) / 1024):>8.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
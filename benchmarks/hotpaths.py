@@ -0,0 +1,216 @@
+"""Micro-benchmarks for the hot paths, checked against a stored baseline.
+
+Runs offline against an in-memory SQLite database (config.TestConfig, fake SMS):
+
+- predict() on exact and partial symptom matches
+- allocating a consultation room link
+- the /chatbot POST handler
+- doctor-dashboard.html (/ as a doctor), doctor-patients.html (/doctor_patients)
+  and ashaworker-dashboard.html (/ as an ASHA worker) with 10, 1k and 10k appointments,
+  served from the fragment cache (render.<page>.<size>) and rendered after a
+  write invalidated it (render.<page>.cold.<size>)
+
+    python benchmarks/hotpaths.py                    # compare with benchmarks/baseline.json
+    python benchmarks/hotpaths.py --threshold 15     # fail above +15% instead of the default
+    python benchmarks/hotpaths.py --update-baseline  # record new numbers (best of 3) after an intended change
+
+Timings are normalised by a fixed pure-Python calibration loop, so a baseline
+recorded on one machine can be checked on another.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from sqlalchemy import insert  # noqa: E402
+
+import app as medicare  # noqa: E402
+import fragment_cache  # noqa: E402
+from config import TestConfig  # noqa: E402
+from extensions import db  # noqa: E402
+from models import User, Appointment, Doctor  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DASHBOARD_SIZES = (10, 1000, 10000)
+DEFAULT_THRESHOLD = 25.0  # percent
+
+
+def calibrate():
+    """Seconds taken by a fixed CPU-bound workload; used to compare across machines."""
+    def workload():
+        total = 0
+        for i in range(200000):
+            total += len(str(i)) * (i % 7)
+        return total
+    # The fastest run is the least disturbed by frequency scaling and noisy neighbours
+    samples = []
+    for _ in range(15):
+        start = time.perf_counter()
+        workload()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def measure(fn, min_time=0.3, min_runs=5, max_runs=2000):
+    """Fastest wall time of one call of ``fn``, in seconds.
+
+    As with timeit, the minimum is the most repeatable figure; slower runs
+    mostly measure interference from the rest of the machine.
+    """
+    samples = []
+    # Like timeit, keep collector pauses (which depend on whatever else is alive) out of the numbers
+    gc.collect()
+    gc.disable()
+    try:
+        began = time.perf_counter()
+        while len(samples) < min_runs or (time.perf_counter() - began < min_time and len(samples) < max_runs):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(samples)
+
+
+def build_app(appointments):
+    # Fragments are cached per process, and every app starts at the same data versions
+    fragment_cache.clear()
+    flask_app = medicare.create_app(TestConfig)
+    with flask_app.app_context():
+        db.create_all()
+        doctor = User(username='bench_doctor', email='doctor@bench', password='pw',
+                      user_type='doctor', type_of_doctor='General Physician', phone='+10000000000')
+        asha = User(username='bench_asha', email='asha@bench', password='pw',
+                    user_type='asha_worker', phone='+10000000001', area_of_operation='Bench', worker_id='B1')
+        patient = User(username='bench_patient', email='patient@bench', password='pw',
+                       user_type='patient', age=30, blood_group='O+')
+        db.session.add_all([doctor, asha, patient])
+        db.session.flush()
+        db.session.add(Doctor(user_id=doctor.id, name=doctor.username, specialty='General Physician',
+                              phone_number=doctor.phone))
+        if appointments:
+            db.session.execute(insert(Appointment), [
+                {'user_id': patient.id, 'asha_worker_id': asha.id, 'name': patient.username,
+                 'time_slot': 'Immediate', 'type_of_doctor': 'General Physician',
+                 'status': ('Pending', 'Approved', 'Prescribed')[i % 3],
+                 'prescription_file': 'static/prescriptions/prescription_1.txt' if i % 3 == 2 else None}
+                for i in range(appointments)
+            ])
+        db.session.commit()
+        ids = {'doctor': doctor.id, 'asha': asha.id, 'patient': patient.id}
+    return flask_app, ids
+
+
+def logged_in_client(flask_app, user_id):
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+def checked_get(client, path):
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    return response
+
+
+def run_benchmarks():
+    results = {}
+    flask_app, ids = build_app(10)
+    with flask_app.app_context():
+        results['predict.exact'] = measure(lambda: medicare.predict(['fever', 'cough']))
+        results['predict.partial'] = measure(lambda: medicare.predict(['fever', 'rash', 'dizziness']))
+        results['rooms.video_call_link'] = measure(medicare.rooms.video_call_link)
+
+    patient = logged_in_client(flask_app, ids['patient'])
+
+    def chatbot():
+        response = patient.post('/chatbot', json={'user_input': 'fever,cough'})
+        assert response.status_code == 200, response.status_code
+    results['chatbot.post'] = measure(chatbot)
+
+    for size in DASHBOARD_SIZES:
+        flask_app, ids = build_app(size)
+        doctor = logged_in_client(flask_app, ids['doctor'])
+        asha = logged_in_client(flask_app, ids['asha'])
+        min_time = 0.3 if size < 10000 else 1.5
+        pages = {'doctor-dashboard': (doctor, '/'), 'doctor-patients': (doctor, '/doctor_patients'),
+                 'ashaworker-dashboard': (asha, '/')}
+        for page, (client, path) in pages.items():
+            results[f'render.{page}.{size}'] = measure(lambda: checked_get(client, path), min_time=min_time)
+
+            def cold():
+                # As after a write that bumped the data version: the table is rendered again
+                fragment_cache.clear()
+                checked_get(client, path)
+            results[f'render.{page}.cold.{size}'] = measure(cold, min_time=min_time)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown in percent before a case counts as a regression')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--rounds', type=int, default=None,
+                        help='run the suite N times and keep the best time per case '
+                             '(default 1, or 3 with --update-baseline)')
+    args = parser.parse_args()
+    rounds = args.rounds or (3 if args.update_baseline else 1)
+
+    calibration = calibrate()
+    results = {}
+    for _ in range(rounds):
+        # Keep any stray output from the handlers out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, seconds in run_benchmarks().items():
+                results[name] = min(seconds, results.get(name, seconds))
+    calibration = min(calibration, calibrate())
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'calibration': calibration, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {os.path.relpath(args.baseline, ROOT)}')
+
+    baseline = {}
+    scale = 1.0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored['results']
+        scale = calibration / stored['calibration']
+
+    regressions = []
+    print(f"{'case':<38}{'current':>12}{'baseline':>12}{'change':>10}")
+    for name, seconds in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            print(f'{name:<38}{seconds * 1000:>10.3f}ms{"-":>12}{"new":>10}')
+            continue
+        expected *= scale
+        change = (seconds / expected - 1) * 100
+        flag = ''
+        if change > args.threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<38}{seconds * 1000:>10.3f}ms{expected * 1000:>10.3f}ms{change:>+9.1f}%{flag}')
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold}%: "
+              + ', '.join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
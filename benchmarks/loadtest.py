@@ -0,0 +1,290 @@
+"""End-to-end load test of the consultation workflow.
+
+Simulates a mix of patients, doctors and ASHA workers against a local instance:
+
+    patient:  register -> login -> profile -> POST /chatbot -> /join_video
+    doctor:   /doctor_join_consultation -> /doctor_patients -> /upload_prescription
+    asha:     /download_prescription
+
+Doctors and ASHA workers keep Socket.IO connections open on /doctor and
+/asha_worker while the test runs, like the dashboards do. Unless --url is
+given, a gunicorn instance is started on a throw-away SQLite database with the
+fake SMS transport, so nothing reaches Twilio.
+
+    python benchmarks/loadtest.py --patients 50 --doctors 5 --asha 5 --duration 60
+
+Reports p50/p95/p99 latency and throughput per route.
+"""
+import argparse
+import os
+import queue
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Symptom inputs and the specialty predict() routes them to
+SYMPTOMS = {
+    'fever,cough': 'General Physician',
+    'fever,headache': 'General Physician',
+    'fatigue,muscle pain': 'General Physician',
+    'headache,nausea': 'Neurologist',
+    'chest pain,shortness of breath': 'Cardiologist',
+    'rash,itching': 'Dermatologist',
+}
+PRESCRIPTION = b'%PDF-1.4\n% load test prescription\n' + b'0' * 4096
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.events = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def event(self, name):
+        with self.lock:
+            self.events[name] += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Client:
+    """A logged-in browser session that times every request by route name."""
+
+    def __init__(self, base_url, stats):
+        self.base_url = base_url
+        self.stats = stats
+        self.http = requests.Session()
+
+    def request(self, route, method, path, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('timeout', 30)
+        began = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException:
+            self.stats.record(route, time.perf_counter() - began, False)
+            return None
+        self.stats.record(route, time.perf_counter() - began, response.status_code < 400)
+        return response
+
+    def listen(self, namespace, events):
+        cookie = '; '.join(f'{k}={v}' for k, v in self.http.cookies.items())
+        sio = socketio.Client(reconnection=False)
+        for name in events:
+            sio.on(name, namespace=namespace, handler=lambda data, name=name: self.stats.event(name))
+        sio.connect(self.base_url, namespaces=[namespace], headers={'Cookie': cookie}, wait_timeout=10)
+        return sio
+
+
+def register_doctor(base_url, stats, specialty, tag):
+    client = Client(base_url, stats)
+    username = f'dr_{tag}'
+    client.request('POST /doctor_register', 'POST', '/doctor_register', data={
+        'username': username, 'email': f'{username}@load.test', 'password': 'pw',
+        'type_of_doctor': specialty, 'phonenumber': '+10000000000'})
+    client.request('POST /doctor-login', 'POST', '/doctor-login', data={'username': username, 'password': 'pw'})
+    return client
+
+
+def register_asha(base_url, stats, tag):
+    client = Client(base_url, stats)
+    username = f'asha_{tag}'
+    client.request('POST /asha-register', 'POST', '/asha-register', data={
+        'username': username, 'email': f'{username}@load.test', 'password': 'pw',
+        'worker_id': tag, 'area_of_operation': 'Load Test District'})
+    client.request('POST /asha-login', 'POST', '/asha-login', data={'username': username, 'password': 'pw'})
+    client.request('POST /profile/asha_worker', 'POST', '/profile/asha_worker', data={
+        'phone': '+10000000001', 'area_of_operation': 'Load Test District', 'worker_id': tag})
+    return client
+
+
+def patient_loop(base_url, stats, deadline, consultations):
+    client = Client(base_url, stats)
+    username = f'pt_{uuid.uuid4().hex[:12]}'
+    client.request('POST /patient-register', 'POST', '/patient-register', data={
+        'username': username, 'email': f'{username}@load.test', 'password': 'pw'})
+    client.request('POST /patient-login', 'POST', '/patient-login', data={'username': username, 'password': 'pw'})
+    client.request('POST /profile/patient', 'POST', '/profile/patient', data={'age': '30', 'blood_group': 'O+'})
+    while time.monotonic() < deadline:
+        client.request('GET /', 'GET', '/')
+        symptoms = random.choice(list(SYMPTOMS))
+        response = client.request('POST /chatbot', 'POST', '/chatbot', json={'user_input': symptoms})
+        if response is None or response.status_code != 200:
+            continue
+        result = response.json()
+        client.request('GET /join_video/<id>', 'GET', f"/join_video/{result['consultation_id']}")
+        consultations[SYMPTOMS[symptoms]].put((result['consultation_id'], result['appointment_id']))
+        time.sleep(random.uniform(0.1, 0.5))  # think time
+
+
+def doctor_loop(client, deadline, inbox, prescribed):
+    while time.monotonic() < deadline:
+        try:
+            consultation_id, appointment_id = inbox.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        client.request('GET /doctor_join_consultation/<id>', 'GET', f'/doctor_join_consultation/{consultation_id}')
+        client.request('GET /doctor_patients', 'GET', '/doctor_patients')
+        client.request('POST /upload_prescription/<id>', 'POST', f'/upload_prescription/{appointment_id}',
+                       files={'file': (f'rx_{appointment_id}.pdf', PRESCRIPTION, 'application/pdf')})
+        prescribed.put(appointment_id)
+
+
+def asha_loop(client, deadline, prescribed):
+    while time.monotonic() < deadline:
+        try:
+            appointment_id = prescribed.get(timeout=0.5)
+        except queue.Empty:
+            client.request('GET /', 'GET', '/')
+            continue
+        client.request('GET /download_prescription/<id>', 'GET', f'/download_prescription/{appointment_id}')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_local_instance(workdir, args):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        UPLOAD_FOLDER=os.path.join(workdir, 'prescriptions'),
+        SMS_TRANSPORT='fake',
+        SMS_FAKE_LATENCY=str(args.sms_latency),
+        ASYNC_MODE=args.async_mode,
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        ADMISSION_ENABLED='1' if args.admission else '0',
+    )
+    os.makedirs(env['UPLOAD_FOLDER'])
+    subprocess.run([sys.executable, '-c', 'from app import app, create_tables; create_tables(app)'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server did not start, see {log.name}")
+
+
+def report(stats, elapsed):
+    print(f"\n{'route':<36}{'count':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    for route in sorted(stats.latencies):
+        values = stats.latencies[route]
+        total += len(values)
+        print(f"{route:<36}{len(values):>8}{stats.errors[route]:>6}{len(values) / elapsed:>9.1f}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}{percentile(values, 99) * 1000:>9.1f}")
+    print(f"{'total':<36}{total:>8}{sum(stats.errors.values()):>6}{total / elapsed:>9.1f}")
+    if stats.events:
+        print('socket events received: ' + ', '.join(f'{name}={count}' for name, count in sorted(stats.events.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='target an already running instance instead of starting one')
+    parser.add_argument('--patients', type=int, default=20)
+    parser.add_argument('--doctors', type=int, default=4, help='doctors per specialty')
+    parser.add_argument('--asha', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--async-mode', default='gevent', choices=['sync', 'gevent', 'eventlet'])
+    parser.add_argument('--sms-latency', type=float, default=0.3, help='simulated Twilio latency (s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--admission', action='store_true',
+                        help='keep admission control on; by default it is off so the test measures capacity')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix='medicare-load-')
+    proc = None
+    listeners = []
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            proc, base_url = start_local_instance(workdir, args)
+        setup_stats, stats = Stats(), Stats()
+        run_tag = uuid.uuid4().hex[:6]
+
+        # Only the first doctor registered for a specialty is assigned its triages,
+        # so the rest only generate dashboard traffic on their sockets.
+        doctors = {}
+        for specialty in set(SYMPTOMS.values()):
+            for n in range(args.doctors):
+                doctor = register_doctor(base_url, setup_stats, specialty, f'{run_tag}_{specialty[:4]}{n}')
+                doctor.stats = stats
+                doctors.setdefault(specialty, doctor)
+                listeners.append(doctor.listen('/doctor', ['message', 'patient_joined']))
+        # Triage assigns every appointment to the first ASHA worker
+        ashas = [register_asha(base_url, setup_stats, f'{run_tag}{n}') for n in range(args.asha)]
+        for asha in ashas:
+            asha.stats = stats
+            listeners.append(asha.listen('/asha_worker', ['message', 'appointment_assigned', 'doctor_joined', 'prescription_uploaded']))
+
+        consultations = {specialty: queue.Queue() for specialty in doctors}
+        prescribed = queue.Queue()
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=patient_loop, args=(base_url, stats, deadline, consultations))
+                   for _ in range(args.patients)]
+        threads += [threading.Thread(target=doctor_loop, args=(doctors[s], deadline, consultations[s], prescribed))
+                    for s in doctors]
+        threads.append(threading.Thread(target=asha_loop, args=(ashas[0], deadline, prescribed)))
+        threads += [threading.Thread(target=asha_loop, args=(asha, deadline, queue.Queue())) for asha in ashas[1:]]
+
+        began = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report(stats, time.monotonic() - began)
+    finally:
+        for listener in listeners:
+            listener.disconnect()
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
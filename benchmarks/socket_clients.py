@@ -0,0 +1,135 @@
+"""Concurrent Socket.IO clients per worker, sync vs async serving mode.
+
+Starts a single gunicorn worker in each ASYNC_MODE, connects N Socket.IO
+clients to the /doctor namespace at once and keeps them open, then measures
+plain HTTP latency while those connections are held.
+
+    python benchmarks/socket_clients.py --clients 200 --modes sync gevent
+
+Needs python-socketio's client extras (requests, websocket-client).
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port):
+    env = dict(os.environ, ASYNC_MODE=mode, GUNICORN_WORKERS='1', GUNICORN_BIND=f'127.0.0.1:{port}')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'gunicorn did not start in {mode} mode')
+
+
+def connect_clients(url, count, timeout):
+    clients, connected, lock = [], [], threading.Lock()
+    start = threading.Barrier(count + 1)
+
+    def run():
+        client = socketio.Client(reconnection=False)
+        start.wait()
+        began = time.perf_counter()
+        try:
+            client.connect(url, namespaces=['/doctor'], wait_timeout=timeout)
+        except Exception:
+            return
+        with lock:
+            clients.append(client)
+            connected.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=run, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    for thread in threads:
+        thread.join(timeout + 5)
+    return clients, connected
+
+
+def http_latency(url, samples):
+    latencies = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        try:
+            urllib.request.urlopen(url, timeout=10).read()
+            latencies.append(time.perf_counter() - began)
+        except OSError:
+            latencies.append(float('inf'))
+    return latencies
+
+
+def run_mode(mode, count, timeout, hold):
+    port = free_port()
+    proc = start_server(mode, port)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        clients, connect_times = connect_clients(url, count, timeout)
+        time.sleep(hold)
+        still_open = sum(1 for client in clients if client.connected)
+        latencies = http_latency(url + '/', 20)
+        for client in clients:
+            client.disconnect()
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    ok = [l for l in latencies if l != float('inf')]
+    return {
+        'mode': mode,
+        'connected': len(connect_times),
+        'still_open': still_open,
+        'connect_p50_ms': statistics.median(connect_times) * 1000 if connect_times else None,
+        'http_p50_ms': statistics.median(ok) * 1000 if ok else None,
+        'http_failures': len(latencies) - len(ok),
+    }
+
+
+def fmt(value):
+    return '-' if value is None else f'{value:.1f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gevent'])
+    parser.add_argument('--connect-timeout', type=float, default=10)
+    parser.add_argument('--hold', type=float, default=5, help='seconds to keep the clients connected')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'connected':>12}{'open after hold':>18}{'connect p50 ms':>16}{'HTTP p50 ms':>14}{'HTTP failed':>13}")
+    for mode in args.modes:
+        result = run_mode(mode, args.clients, args.connect_timeout, args.hold)
+        print(f"{result['mode']:<10}{result['connected']:>8}/{args.clients:<3}{result['still_open']:>18}"
+              f"{fmt(result['connect_p50_ms']):>16}{fmt(result['http_p50_ms']):>14}{result['http_failures']:>13}")
+
+
+if __name__ == '__main__':
+    main()
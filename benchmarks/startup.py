@@ -0,0 +1,101 @@
+"""Worker cold-start benchmark.
+
+Imports the app in fresh interpreters (the same thing every gunicorn worker
+does on boot) and reports import time and peak RSS per process. Exits with a
+non-zero status when the limits are exceeded so CI catches regressions.
+
+    python benchmarks/startup.py --runs 5 --max-import-seconds 3 --max-rss-mb 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in ('tensorflow', 'keras', 'pandas', 'plotly', 'scipy', 'twilio.rest', 'pdfkit') if m in sys.modules)
+# ru_maxrss is reported in KiB on Linux
+print(json.dumps({{"import_seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "heavy_modules": heavy}}))
+"""
+
+
+def run_probe(module):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    # The app may print during import; the probe result is always the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_time_breakdown(module, top):
+    """Return the slowest imports (cumulative microseconds) as reported by -X importtime."""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|', 2)
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-seconds', type=float, default=None)
+    parser.add_argument('--max-rss-mb', type=float, default=None)
+    parser.add_argument('--breakdown', type=int, default=0, metavar='N', help='show the N slowest imports')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    # First run warms the bytecode/page cache, like a worker after the master has booted
+    run_probe(args.module)
+    samples = [run_probe(args.module) for _ in range(args.runs)]
+    times = [s['import_seconds'] for s in samples]
+    rss_mb = [s['max_rss_kb'] / 1024 for s in samples]
+    summary = {
+        'module': args.module,
+        'runs': args.runs,
+        'import_seconds_median': statistics.median(times),
+        'import_seconds_max': max(times),
+        'max_rss_mb_median': statistics.median(rss_mb),
+        'max_rss_mb_max': max(rss_mb),
+        'heavy_modules_loaded': samples[-1]['heavy_modules'],
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"import {args.module}: median {summary['import_seconds_median'] * 1000:.1f} ms, "
+              f"max {summary['import_seconds_max'] * 1000:.1f} ms over {args.runs} runs")
+        print(f"peak RSS per worker: median {summary['max_rss_mb_median']:.1f} MB, max {summary['max_rss_mb_max']:.1f} MB")
+        print(f"heavy modules loaded at import: {', '.join(summary['heavy_modules_loaded']) or 'none'}")
+    if args.breakdown:
+        for cumulative_us, name in import_time_breakdown(args.module, args.breakdown):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if args.max_import_seconds is not None and summary['import_seconds_median'] > args.max_import_seconds:
+        failures.append(f"import time {summary['import_seconds_median']:.3f}s exceeds {args.max_import_seconds}s")
+    if args.max_rss_mb is not None and summary['max_rss_mb_median'] > args.max_rss_mb:
+        failures.append(f"peak RSS {summary['max_rss_mb_median']:.1f} MB exceeds {args.max_rss_mb} MB")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
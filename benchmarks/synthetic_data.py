@@ -0,0 +1,274 @@
+"""Deterministic synthetic dataset at production scale.
+
+Fills users, doctor, appointments and consultation with realistic,
+reproducible rows:
+
+    python benchmarks/synthetic_data.py --database sqlite:///scale.db --appointments 1000000
+    python benchmarks/synthetic_data.py --database postgresql://... --appointments 5000000 --seed 7
+
+The same --seed, --appointments and --end-date always produce the same rows,
+so query plans and benchmark numbers can be compared between branches.
+
+- specialties follow the diseases predict() maps to, Zipf-skewed so General
+  Physician gets the bulk of the bookings
+- patients, ASHA workers and bookings are spread over districts (in
+  area_of_operation) with skewed populations; every booking goes to an ASHA
+  worker of the patient's district, a few of whom carry most of the load
+- appointments are spread over --days days up to --end-date; older ones are
+  mostly Prescribed and point at a prescription file, recent ones are still
+  Pending or Approved
+- every appointment has the consultation /chatbot would have created, with
+  the joined flags its status implies
+
+The target tables must be empty. Rows go in with explicit ids through
+executemany batches, and the analytics rollups are rebuilt at the end.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from sqlalchemy import event, func, insert, select  # noqa: E402
+
+import analytics  # noqa: E402
+import app as medicare  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Appointment, Consultation, Doctor, User  # noqa: E402
+
+DEFAULT_END_DATE = date(2026, 1, 1)
+BATCH_SIZE = 10000
+DISTRICTS = ('Thiruvananthapuram', 'Kollam', 'Pathanamthitta', 'Alappuzha', 'Kottayam', 'Idukki',
+             'Ernakulam', 'Thrissur', 'Palakkad', 'Malappuram', 'Kozhikode', 'Wayanad', 'Kannur', 'Kasaragod')
+BLOOD_GROUPS = (('O+', 37), ('B+', 31), ('A+', 21), ('AB+', 7), ('O-', 2), ('B-', 1), ('A-', 0.5), ('AB-', 0.5))
+GENDERS = ('female', 'male')
+TIME_SLOTS = ('Immediate', '09:00-10:00', '10:00-11:00', '11:00-12:00', '14:00-15:00', '15:00-16:00')
+# Rows per appointment
+PATIENTS_PER_APPOINTMENT = 0.25
+DOCTORS_PER_APPOINTMENT = 1 / 2000
+ASHA_WORKERS_PER_APPOINTMENT = 1 / 500
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def cumulative(weights):
+    # random.choices() re-sums plain weights on every call; millions of calls add up
+    return list(itertools.accumulate(weights))
+
+
+def specialties():
+    """(specialty, weight): the specialties predict() routes to, the most common first."""
+    counts = {}
+    for _, _, specialty in medicare.possible_diseases.values():
+        counts[specialty] = counts.get(specialty, 0) + 1
+    ranked = sorted(counts, key=lambda s: (-counts[s], s))
+    return list(zip(ranked, zipf_weights(len(ranked))))
+
+
+class Generator:
+    """Row factory; everything random comes from one seeded ``random.Random``."""
+
+    def __init__(self, appointments, seed=0, days=730, end_date=DEFAULT_END_DATE):
+        self.rng = random.Random(seed)
+        self.appointments = appointments
+        self.days = days
+        self.end = datetime.combine(end_date, datetime.min.time())
+        self.patients = max(1, int(appointments * PATIENTS_PER_APPOINTMENT))
+        self.specialties = specialties()
+        self.doctor_count = max(len(self.specialties), int(appointments * DOCTORS_PER_APPOINTMENT))
+        self.asha_count = max(len(DISTRICTS), int(appointments * ASHA_WORKERS_PER_APPOINTMENT))
+        self.district_weights = cumulative(zipf_weights(len(DISTRICTS), exponent=0.6))
+        self.diseases_by_specialty = {}  # specialty -> [disease]
+        for disease, _, specialty in sorted(medicare.possible_diseases.values()):
+            self.diseases_by_specialty.setdefault(specialty, []).append(disease)
+        self.doctors_by_specialty = {}  # specialty -> [username]
+        self.asha_by_district = {}  # district -> ([user id], weights)
+        self.patient_district = []  # index = patient number
+        self.next_user_id = 1
+
+    def _take_id(self):
+        user_id = self.next_user_id
+        self.next_user_id += 1
+        return user_id
+
+    def _phone(self):
+        return f'+91{self.rng.randrange(6000000000, 9999999999)}'
+
+    def doctors(self):
+        """(users row, doctor row) per doctor; every specialty gets at least one."""
+        names = [s for s, _ in self.specialties]
+        weights = [w for _, w in self.specialties]
+        assigned = names + self.rng.choices(names, weights, k=self.doctor_count - len(names))
+        for number, specialty in enumerate(assigned, 1):
+            user_id = self._take_id()
+            username = f'dr_{number:06d}'
+            phone = self._phone()
+            self.doctors_by_specialty.setdefault(specialty, []).append(username)
+            yield ({'id': user_id, 'username': username, 'email': f'{username}@doctors.example', 'password': 'password',
+                    'user_type': 'doctor', 'type_of_doctor': specialty, 'phone': phone},
+                   {'id': number, 'user_id': user_id, 'name': username, 'specialty': specialty,
+                    'phone_number': phone})
+
+    def asha_workers(self):
+        districts = list(DISTRICTS) + self.rng.choices(DISTRICTS, cum_weights=self.district_weights,
+                                                        k=self.asha_count - len(DISTRICTS))
+        for number, district in enumerate(districts, 1):
+            user_id = self._take_id()
+            username = f'asha_{number:06d}'
+            ids, _ = self.asha_by_district.setdefault(district, ([], []))
+            ids.append(user_id)
+            yield {'id': user_id, 'username': username, 'email': f'{username}@asha.example', 'password': 'password',
+                   'user_type': 'asha_worker', 'phone': self._phone(), 'area_of_operation': district,
+                   'worker_id': f'ASHA{number:06d}'}
+        # Within a district a few workers carry most of the bookings
+        for district, (ids, weights) in self.asha_by_district.items():
+            weights.extend(cumulative(zipf_weights(len(ids), exponent=0.8)))
+
+    def patients_rows(self):
+        blood_groups = [g for g, _ in BLOOD_GROUPS]
+        blood_weights = cumulative(w for _, w in BLOOD_GROUPS)
+        for number in range(1, self.patients + 1):
+            username = f'patient_{number:08d}'
+            district = self.rng.choices(DISTRICTS, cum_weights=self.district_weights)[0]
+            self.patient_district.append(district)
+            age = min(95, max(1, int(self.rng.gauss(38, 18))))
+            born = self.end.date() - timedelta(days=age * 365 + self.rng.randrange(365))
+            yield {'id': self._take_id(), 'username': username, 'email': f'{username}@patients.example',
+                   'password': 'password', 'user_type': 'patient', 'phone': self._phone(),
+                   'address': f'{self.rng.randrange(1, 500)}, Ward {self.rng.randrange(1, 40)}, {district}',
+                   'date_of_birth': born, 'gender': self.rng.choice(GENDERS), 'area_of_operation': district,
+                   'age': age, 'blood_group': self.rng.choices(blood_groups, cum_weights=blood_weights)[0]}
+
+    def bookings(self):
+        """(appointment row, consultation row) pairs."""
+        first_patient_id = self.next_user_id - self.patients
+        names = [s for s, _ in self.specialties]
+        weights = cumulative(w for _, w in self.specialties)
+        # Frequent visitors: 30% of the bookings come from the first 1000 patients, Zipf-skewed
+        regulars = range(min(self.patients, 1000))
+        regular_weights = cumulative(zipf_weights(len(regulars), exponent=0.5))
+        for number in range(1, self.appointments + 1):
+            if self.rng.random() < 0.3:
+                patient = self.rng.choices(regulars, cum_weights=regular_weights)[0]
+            else:
+                patient = self.rng.randrange(self.patients)
+            district = self.patient_district[patient]
+            asha_ids, asha_weights = self.asha_by_district[district]
+            specialty = self.rng.choices(names, cum_weights=weights)[0]
+            diseases = self.diseases_by_specialty[specialty]
+            username = f'patient_{patient + 1:08d}'
+            # Uniform over time, newest last, so ids grow with dates like in production
+            booked = self.end - timedelta(seconds=(self.appointments - number) * self.days * 86400 / self.appointments)
+            age_days = (self.end - booked).days
+            roll = self.rng.random()
+            if age_days > 14 or roll < 0.5:
+                status = 'Prescribed' if roll < 0.95 else 'Approved'
+            else:
+                status = 'Pending' if roll < 0.75 else 'Approved'
+            patient_joined = status == 'Prescribed' or (status == 'Approved' and roll < 0.9)
+            yield ({'id': number, 'user_id': first_patient_id + patient,
+                    'asha_worker_id': self.rng.choices(asha_ids, cum_weights=asha_weights)[0], 'name': username,
+                    'time_slot': self.rng.choice(TIME_SLOTS), 'type_of_doctor': specialty, 'status': status,
+                    'prescription_file': f'static/prescriptions/prescription_{number}.pdf'
+                    if status == 'Prescribed' else None,
+                    # Cycled, not drawn, so a seed still generates the same other rows
+                    'predicted_disease': diseases[number % len(diseases)],
+                    'updated_at': booked + timedelta(hours=self.rng.randrange(1, 72)) if status != 'Pending' else booked},
+                   {'id': number, 'doctor_name': self.rng.choice(self.doctors_by_specialty[specialty]),
+                    'patient_name': username,
+                    'video_call_link': f'https://meet.jit.si/medicare-{self.rng.getrandbits(64):016x}',
+                    'doctor_joined': status == 'Prescribed', 'patient_joined': patient_joined,
+                    'consultation_date': booked,
+                    # Fixed offsets, not drawn, so a seed still generates the same other rows
+                    'patient_joined_at': booked + timedelta(minutes=5) if patient_joined else None,
+                    'doctor_joined_at': booked + timedelta(minutes=8) if status == 'Prescribed' else None})
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(table, rows, user_columns):
+    # Every row of a batch must have the same keys for one executemany
+    for batch in _batches(rows):
+        db.session.execute(insert(table), [dict.fromkeys(user_columns) | row for row in batch])
+
+
+def generate(appointments, seed=0, days=730, end_date=DEFAULT_END_DATE, progress=print):
+    generator = Generator(appointments, seed=seed, days=days, end_date=end_date)
+    users = User.__table__
+    user_columns = [column.name for column in users.columns]
+
+    started = time.perf_counter()
+    doctors = list(generator.doctors())
+    _insert(users, (user for user, _ in doctors), user_columns)
+    _insert(Doctor.__table__, (doctor for _, doctor in doctors), [column.name for column in Doctor.__table__.columns])
+    _insert(users, generator.asha_workers(), user_columns)
+    _insert(users, generator.patients_rows(), user_columns)
+    db.session.commit()
+    progress(f'{generator.next_user_id - 1} users ({generator.doctor_count} doctors, '
+             f'{generator.asha_count} ASHA workers) in {time.perf_counter() - started:.1f}s')
+
+    appointment_columns = [column.name for column in Appointment.__table__.columns]
+    consultation_columns = [column.name for column in Consultation.__table__.columns]
+    done = 0
+    for batch in _batches(generator.bookings()):
+        _insert(Appointment.__table__, (appointment for appointment, _ in batch), appointment_columns)
+        _insert(Consultation.__table__, (consultation for _, consultation in batch), consultation_columns)
+        db.session.commit()
+        done += len(batch)
+        if done % (BATCH_SIZE * 50) == 0:
+            progress(f'{done} appointments in {time.perf_counter() - started:.1f}s')
+    progress(f'{done} appointments and consultations in {time.perf_counter() - started:.1f}s')
+
+    analytics.rebuild()
+    progress(f'Analytics rollups rebuilt; done in {time.perf_counter() - started:.1f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=os.getenv('DATABASE_URL', 'sqlite:///synthetic.db'),
+                        help='SQLAlchemy URL of the database to fill (default $DATABASE_URL or sqlite:///synthetic.db)')
+    parser.add_argument('--appointments', type=int, default=100000,
+                        help='target size; users and doctors scale with it (default 100000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=730, help='history covered by the appointments')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help=f'date of the newest appointment (default {DEFAULT_END_DATE})')
+    args = parser.parse_args()
+
+    flask_app = medicare.create_app({'SQLALCHEMY_DATABASE_URI': args.database, 'PRELOAD_TEMPLATES': False})
+    with flask_app.app_context():
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            # A throw-away bulk load: no need to survive a crash half way
+            @event.listens_for(db.engine, 'connect')
+            def _fast_sqlite(connection, _):
+                connection.execute('PRAGMA journal_mode=MEMORY')
+                connection.execute('PRAGMA synchronous=OFF')
+            db.engine.dispose()
+        for model in (User, Doctor, Appointment, Consultation):
+            if db.session.execute(select(func.count()).select_from(model)).scalar():
+                print(f'{model.__tablename__} is not empty; use a fresh database', file=sys.stderr)
+                return 1
+        generate(args.appointments, seed=args.seed, days=args.days, end_date=args.end_date)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Per-worker memory with and without gunicorn --preload.
+
+Starts gunicorn twice with the same worker count, once preloading the app in
+the master and once importing it in each worker, sends a few requests so every
+worker has served traffic, then reads /proc/<pid>/smaps_rollup for each worker.
+PSS (proportional set size) splits shared pages between the processes that
+map them, so it is the number to compare.
+
+    python benchmarks/worker_memory.py --workers 4
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def smaps_rollup(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])  # kB
+    return values
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def measure(preload, workers, requests_per_worker):
+    port = free_port()
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0',
+               GUNICORN_WORKERS=str(workers), GUNICORN_BIND=f'127.0.0.1:{port}')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+                if len(worker_pids(proc.pid)) == workers:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.2)
+        else:
+            raise RuntimeError('gunicorn did not start')
+        for _ in range(workers * requests_per_worker):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5).read()
+        return [smaps_rollup(pid) for pid in worker_pids(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def summarize(label, samples):
+    count = len(samples)
+    avg = {field: sum(s.get(field, 0) for s in samples) / count / 1024 for field in FIELDS}
+    private = avg['Private_Clean'] + avg['Private_Dirty']
+    shared = avg['Shared_Clean'] + avg['Shared_Dirty']
+    print(f"{label:<10} workers={count}  RSS {avg['Rss']:7.1f} MB  PSS {avg['Pss']:7.1f} MB  "
+          f"private {private:7.1f} MB  shared {shared:7.1f} MB  (per worker)")
+    return avg['Pss']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests-per-worker', type=int, default=20)
+    args = parser.parse_args()
+
+    pss_lazy = summarize('no-preload', measure(False, args.workers, args.requests_per_worker))
+    pss_preload = summarize('preload', measure(True, args.workers, args.requests_per_worker))
+    saved = pss_lazy - pss_preload
+    print(f"preload saves {saved:.1f} MB PSS per worker ({saved * args.workers:.1f} MB for {args.workers} workers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# config.py
+import os
+from dotenv import load_dotenv
+from serving import socketio_async_mode
+from shards import parse_mapping
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Config:
+    SECRET_KEY = 'MYSECRETKEY'
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///database.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read-only routes query this copy while it is fresh enough (see replicas.py): a
+    # PostgreSQL streaming replica, or a SQLite snapshot kept by `flask replica snapshot`
+    REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG') or 30)
+    REPLICA_LAG_CHECK_INTERVAL = 2
+
+    # District shards for appointments and consultations (see shards.py), e.g.
+    # SHARDS='kerala=postgresql://...,tn=postgresql://...' and
+    # SHARD_DISTRICTS='Kottayam=kerala,Chennai=tn'. Only ever append to SHARDS:
+    # a shard's position fixes its id range. Unmapped districts use
+    # SHARD_DEFAULT, or the primary when it is unset.
+    SHARDS = parse_mapping(os.getenv('SHARDS'))
+    SHARD_DISTRICTS = parse_mapping(os.getenv('SHARD_DISTRICTS'))
+    SHARD_DEFAULT = os.getenv('SHARD_DEFAULT') or None
+    SHARD_ID_SPAN = 2 ** 40
+
+    MAIL_SERVER = os.getenv('MAIL_SERVER')
+    MAIL_PORT = int(os.getenv('MAIL_PORT') or 465)
+    MAIL_USE_TLS = False
+    MAIL_USE_SSL = True
+    MAIL_USERNAME = os.getenv('MAIL_USERNAME')
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER')
+
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'static/prescriptions')
+
+    # 'twilio' sends real messages; 'fake' keeps them in memory (load tests, local runs)
+    SMS_TRANSPORT = os.getenv('SMS_TRANSPORT', 'twilio')
+    SMS_FAKE_LATENCY = float(os.getenv('SMS_FAKE_LATENCY') or 0)
+    TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
+    TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
+    TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+
+    # 'threading' for sync workers, 'gevent'/'eventlet' for cooperative ones (see serving.py)
+    SOCKETIO_ASYNC_MODE = socketio_async_mode()
+    # Needed when more than one worker or task serves Socket.IO, e.g. redis://host:6379/0
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+
+    # Online doctors (see presence.py): dashboards send a heartbeat every
+    # PRESENCE_HEARTBEAT_INTERVAL seconds and count as gone after PRESENCE_TTL
+    # without one. Redis shares the registry between workers.
+    PRESENCE_TTL = int(os.getenv('PRESENCE_TTL') or 60)
+    PRESENCE_HEARTBEAT_INTERVAL = int(os.getenv('PRESENCE_HEARTBEAT_INTERVAL') or 20)
+    PRESENCE_REDIS_URL = os.getenv('PRESENCE_REDIS_URL') or (
+        SOCKETIO_MESSAGE_QUEUE if (SOCKETIO_MESSAGE_QUEUE or '').startswith(('redis://', 'rediss://')) else None)
+
+    # Token buckets in front of the routes that insert rows or send SMS (see
+    # admission.py): (requests per second, burst) per user and per route, and
+    # ADMISSION_GLOBAL across all of them. Over the limit means an immediate 429.
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') != '0'
+    ADMISSION_LIMITS = {
+        'chatbot': {'user': (1 / 30, 5), 'route': (20, 40)},
+        # Every patient join texts the doctor
+        'join_video': {'user': (0.2, 10), 'route': (5, 30)},
+        'upload_prescription': {'user': (0.2, 5), 'route': (5, 20)},
+    }
+    ADMISSION_GLOBAL = (30, 60)
+    ADMISSION_SLOTS = 4096
+
+    # Responses replayed for a repeated Idempotency-Key on /chatbot and
+    # /upload_prescription are kept IDEMPOTENCY_TTL seconds. A key whose first
+    # attempt has not finished after IDEMPOTENCY_LOCK_TIMEOUT seconds is given up.
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL') or 24 * 3600)
+    IDEMPOTENCY_LOCK_TIMEOUT = 60
+    IDEMPOTENCY_PURGE_INTERVAL = 300
+    IDEMPOTENCY_CACHE_SIZE = 1024
+
+    # Consultation joins are queued and written in batches every
+    # JOIN_FLUSH_INTERVAL seconds (see join_events.py); off, each is written
+    # in its request
+    JOIN_WRITE_BEHIND = os.getenv('JOIN_WRITE_BEHIND', '1') != '0'
+    JOIN_FLUSH_INTERVAL = 0.25
+    JOIN_FLUSH_BATCH = 200
+
+    # Clients allowed to scrape /metrics; empty allows everyone (e.g. behind a private network)
+    METRICS_ALLOW_FROM = [ip.strip() for ip in os.getenv('METRICS_ALLOW_FROM', '127.0.0.1,::1').split(',') if ip.strip()]
+    # Samples (one per counter label set, histogram bucket or sum) shared by the workers of an instance
+    METRICS_SLOTS = int(os.getenv('METRICS_SLOTS') or 8192)
+
+    # Logging goes through a background writer (see structured_logging.py).
+    # LOG_LEVELS overrides single loggers, e.g. 'sms=DEBUG,werkzeug=WARNING'.
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', 'werkzeug=WARNING,engineio=WARNING,socketio=WARNING')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' lines, or 'text' for local runs
+
+    # On-demand profiles and slow-request captures (see profiling.py)
+    PROFILING_DIR = os.getenv('PROFILING_DIR')
+    # Seconds; requests slower than this are captured with their stacks and SQL.
+    # Off unless set: capturing times every SQL statement and samples the
+    # requests in flight from a thread in each worker.
+    SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD') or 0) or None
+    SLOW_REQUEST_KEEP = 100
+    PROFILE_KEEP = 20
+    PROFILE_SAMPLE_INTERVAL = 0.01
+    PROFILE_MAX_SECONDS = 120
+
+    # Output of `flask --app app assets build`, served with immutable caching from ASSETS_URL_PATH
+    ASSETS_DIR = os.getenv('ASSETS_DIR', os.path.join(BASE_DIR, 'static', 'dist'))
+    ASSETS_URL_PATH = '/assets'
+
+    # gzip/brotli for dynamic responses (see compression.py); benchmarks/compression.py
+    # shows the CPU/size trade-off of each level per template
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '1') != '0'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE') or 500)
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL') or 6)
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY') or 4)
+
+    # Consultation rooms (see room_ids.py). VIDEO_ROOM_WORKER_TAG pins the 16-bit
+    # worker tag in the ids; by default it is hashed from host name and pid.
+    VIDEO_CALL_BASE_URL = os.getenv('VIDEO_CALL_BASE_URL', 'https://meet.jit.si/')
+    VIDEO_ROOM_PREFIX = 'medicare-'
+    VIDEO_ROOM_WORKER_TAG = os.getenv('VIDEO_ROOM_WORKER_TAG')
+
+    # `flask --app app archive run` moves Prescribed appointments and finished
+    # consultations older than this out of the hot tables (see archive.py)
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS') or 90)
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE') or 500)
+
+    # /search ranks at most this many of the newest matches per table and shard
+    # (see search_index.py), which bounds its cost for short, common prefixes
+    SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES') or 1000)
+
+    # Compile every template and the URL map while building the app, so that with
+    # gunicorn --preload the workers inherit them copy-on-write instead of each
+    # building their own copy on the first requests.
+    PRELOAD_TEMPLATES = True
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PRELOAD_TEMPLATES = False
+    SMS_TRANSPORT = 'fake'
+    ADMISSION_ENABLED = False
+    SQLALCHEMY_BINDS = {}
+    SHARDS = {}
+    JOIN_WRITE_BEHIND = False
@@ -0,0 +1,34 @@
+# extensions.py
+# Extensions are created unbound and attached to an app in create_app(), so the
+# models and routes can import them without needing an application instance.
+from flask_sqlalchemy import SQLAlchemy
+from flask_mail import Mail
+from flask_socketio import SocketIO
+from flask_migrate import Migrate
+from sms import SMS
+from metrics import Metrics
+from profiling import Profiler
+from structured_logging import StructuredLogging
+from assets import Assets
+from compression import Compression
+from room_ids import RoomIds
+from presence import Presence
+from admission import Admission
+from replicas import Replicas, RoutingSession
+from shards import Shards
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+mail = Mail()
+socketio = SocketIO()
+migrate = Migrate()
+sms = SMS()
+metrics = Metrics()
+profiler = Profiler()
+logs = StructuredLogging()
+assets = Assets()
+compression = Compression()
+rooms = RoomIds()
+presence = Presence()
+admission = Admission()
+replicas = Replicas()
+shards = Shards()
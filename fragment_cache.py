@@ -0,0 +1,105 @@
+# fragment_cache.py
+# Rendered dashboard tables, cached per worker and keyed by
+# (block, scope, data version).
+#
+# A scope names the rows a table shows: 'specialty:<type_of_doctor>' for the
+# doctor tables, 'asha:<user id>' for an ASHA worker's assigned appointments.
+# Every write path that changes those rows calls bump_version() for the
+# scopes it touches, inside its own transaction, so the new version becomes
+# visible to all workers exactly when the data does. A page view then costs
+# one primary-key lookup instead of the appointment query and the Jinja loop.
+#
+# With SHARDS each database keeps the versions of its own rows (see
+# shards.py), so a version still commits with its data; the version of a
+# scope is the sum over the databases, one lookup in each.
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+from sqlalchemy import insert, select, text, update
+
+from extensions import db, shards
+from models import DataVersion
+from shards import CURRENT
+
+FRAGMENT_CACHE_MAX_SIZE = 1024
+_fragments = OrderedDict()  # (block, scope) -> (version, html)
+_fragments_lock = threading.Lock()
+
+
+def specialty_scope(type_of_doctor):
+    return f'specialty:{type_of_doctor}'
+
+
+def asha_scope(asha_worker_id):
+    return f'asha:{asha_worker_id}'
+
+
+def appointment_scopes(appointment):
+    """Scopes whose tables show ``appointment``."""
+    scopes = [specialty_scope(appointment.type_of_doctor)]
+    if appointment.asha_worker_id is not None:
+        scopes.append(asha_scope(appointment.asha_worker_id))
+    return scopes
+
+
+def _stored_version(scope):
+    return db.session.execute(select(DataVersion.version).where(DataVersion.scope == scope)).scalar() or 0
+
+
+def get_version(scope):
+    # Each database only ever adds to its count, so the sum moves on every bump
+    return sum(shards.gather(lambda: [_stored_version(scope)]))
+
+
+# Same syntax on SQLite and PostgreSQL. A single statement, so concurrent first
+# bumps of a scope cannot collide; plain text because SQLAlchemy does not cache
+# the compiled form of its on_conflict_do_update() construct.
+_UPSERT = text('INSERT INTO data_versions (scope, version) VALUES (:scope, 1) '
+               'ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1')
+_UPSERT_DIALECTS = ('sqlite', 'postgresql')
+
+
+def bump_version(*scopes, shard=CURRENT):
+    """Invalidate the fragments of ``scopes``; call before the write's commit.
+
+    ``shard`` is the database of the changed rows (shards.shard_of()).
+    """
+    scopes = list(dict.fromkeys(scopes))
+    if not scopes:
+        return
+    bind_arguments = shards.bind_arguments(shard)
+    if db.session.get_bind().dialect.name in _UPSERT_DIALECTS:
+        db.session.execute(_UPSERT, [{'scope': scope} for scope in scopes], bind_arguments=bind_arguments)
+        return
+    for scope in scopes:
+        result = db.session.execute(
+            update(DataVersion).where(DataVersion.scope == scope).values(version=DataVersion.version + 1),
+            bind_arguments=bind_arguments)
+        if not result.rowcount:
+            db.session.execute(insert(DataVersion).values(scope=scope, version=1), bind_arguments=bind_arguments)
+
+
+def cached_fragment(block, scope, render):
+    """Return the cached HTML of ``block`` for ``scope``, calling ``render()`` on a miss."""
+    # Read the version before the data: a concurrent write can then only make the
+    # stored fragment newer than its version, never older.
+    version = get_version(scope)
+    key = (block, scope)
+    with _fragments_lock:
+        entry = _fragments.get(key)
+        if entry is not None and entry[0] == version:
+            _fragments.move_to_end(key)
+            return entry[1]
+    html = Markup(render())
+    with _fragments_lock:
+        _fragments[key] = (version, html)
+        _fragments.move_to_end(key)
+        while len(_fragments) > FRAGMENT_CACHE_MAX_SIZE:
+            _fragments.popitem(last=False)
+    return html
+
+
+def clear():
+    with _fragments_lock:
+        _fragments.clear()
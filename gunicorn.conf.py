@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+# The app is imported once in the master (preload_app) and workers are forked
+# from it, so read-only state built in create_app() is shared copy-on-write.
+import os
+
+import serving
+
+# Cooperative workers need the stdlib patched before the preloaded app is imported
+serving.monkey_patch()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+worker_class = serving.gunicorn_worker_class()
+# Upper bound on concurrent connections (sockets included) per cooperative worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import prepare_fork
+        prepare_fork()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import app, reinit_after_fork
+        reinit_after_fork(app)
@@ -0,0 +1,253 @@
+# idempotency.py
+# Idempotency-Key support for the POSTs that mobile clients retry.
+#
+# A client sends the same Idempotency-Key header on every attempt of one
+# logical request. The first attempt claims the key by inserting a pending
+# row into idempotency_keys and committing. It then runs the view and, if
+# the view committed any write, stores the response on that row. A retry
+# with the key replays the stored response without running the view:
+#   - no second Consultation/Appointment
+#   - no second socket broadcast or SMS
+#   - no second file write
+# A retry that arrives while the first attempt is still running gets a 409
+# with Retry-After. Reusing a key for a different request body gets a 422.
+# Replays are exempt from admission control (admission.py): they cost no
+# token, so a retry storm on a weak network is answered, not throttled.
+#
+# HTML forms, which cannot set headers, may send the key as an
+# idempotency_key field instead; the upload form renders a fresh one, so
+# a double submit is also replayed.
+#
+# Keys are scoped to the route and the logged-in user and stored as a 16-byte
+# digest. Rows expire after IDEMPOTENCY_TTL and are purged opportunistically.
+# Completed responses are also kept in a small per-worker LRU, so a retry
+# storm is answered without touching the database.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, has_request_context, jsonify, request, session
+from sqlalchemy import and_, delete, event, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+_FORM_MIMETYPES = ('multipart/form-data', 'application/x-www-form-urlencoded')
+MAX_KEY_LENGTH = 255
+_cache = OrderedDict()  # key digest -> (expires at, fingerprint, status, content type, location, body)
+_cache_lock = threading.Lock()
+_next_purge = 0.0
+
+
+@event.listens_for(db.session, 'after_commit')
+def _count_commit(session):
+    # Tells idempotent() whether the view wrote anything worth replaying
+    if has_request_context():
+        g.idempotency_commits = g.get('idempotency_commits', 0) + 1
+
+
+def _digest(*parts):
+    blake = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        blake.update(part if isinstance(part, bytes) else str(part).encode())
+        blake.update(b'\0')
+    return blake.digest()
+
+
+def _fingerprint():
+    """Digest of the request, the same for every attempt of it."""
+    if request.mimetype not in _FORM_MIMETYPES:
+        return _digest(request.method, request.path, request.get_data())
+    # Browsers pick a new multipart boundary per submit; digest the parsed fields instead
+    parts = [request.method, request.path]
+    for name, value in sorted(request.form.items(multi=True)):
+        parts += [name, value]
+    for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        parts += [name, file.filename or '', _digest(file.stream.read())]
+        file.stream.seek(0)
+    return _digest(*parts)
+
+
+def _cached(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1:]
+
+
+def _remember(key, expires_at, stored):
+    with _cache_lock:
+        _cache[key] = (expires_at, *stored)
+        _cache.move_to_end(key)
+        while len(_cache) > current_app.config.get('IDEMPOTENCY_CACHE_SIZE', 1024):
+            _cache.popitem(last=False)
+
+
+def _lookup(key):
+    """The stored (fingerprint, status, ...) of ``key``, 'pending', or None if it is free."""
+    stored = _cached(key)
+    if stored is not None:
+        return stored
+    row = db.session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.status, IdempotencyKey.content_type,
+               IdempotencyKey.location, IdempotencyKey.body, IdempotencyKey.created_at)
+        .where(IdempotencyKey.key == key)).one_or_none()
+    if row is None:
+        return None
+    age = (datetime.utcnow() - row.created_at).total_seconds()
+    if age >= current_app.config['IDEMPOTENCY_TTL']:
+        return None
+    if row.status is None:
+        # A worker that died mid-request never releases its claim
+        return 'pending' if age < current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'] else None
+    stored = (row.fingerprint, row.status, row.content_type, row.location, row.body)
+    expires_at = time.time() + current_app.config['IDEMPOTENCY_TTL'] - age
+    _remember(key, expires_at, stored)
+    return stored
+
+
+def _claim(key, fingerprint):
+    """Insert the pending row for ``key``; False if another request got there first."""
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    lock_timeout = timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    try:
+        # An expired or abandoned row may still hold the key
+        db.session.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.key == key,
+            or_(IdempotencyKey.created_at < now - ttl,
+                and_(IdempotencyKey.status.is_(None), IdempotencyKey.created_at < now - lock_timeout))))
+        db.session.execute(insert(IdempotencyKey).values(key=key, fingerprint=fingerprint, created_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def _release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status.is_(None)))
+    db.session.commit()
+
+
+def _store(key, fingerprint, response):
+    stored = (fingerprint, response.status_code, response.content_type, response.headers.get('Location'),
+              response.get_data())
+    db.session.rollback()
+    db.session.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(
+        status=stored[1], content_type=stored[2], location=stored[3], body=stored[4]))
+    purge_expired()
+    db.session.commit()
+    _remember(key, time.time() + current_app.config['IDEMPOTENCY_TTL'], stored)
+
+
+def purge_expired(force=False):
+    """Delete expired keys; runs at most once per IDEMPOTENCY_PURGE_INTERVAL per worker unless ``force``."""
+    global _next_purge
+    now = time.time()
+    if not force and now < _next_purge:
+        return 0
+    _next_purge = now + current_app.config['IDEMPOTENCY_PURGE_INTERVAL']
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    return db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)).rowcount
+
+
+def _error(message, status, retry_after=None):
+    response = jsonify({'error': message})
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status, content_type, location, body = stored
+    if stored_fingerprint != fingerprint:
+        return _error(f'{HEADER} was already used for a different request', 422)
+    response = current_app.response_class(body, status=status, content_type=content_type)
+    if location:
+        response.headers['Location'] = location
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _client_key(methods):
+    """The Idempotency-Key of this request, or None if it runs without one."""
+    if request.method not in methods or 'user_id' not in session:
+        return None
+    client_key = request.headers.get(HEADER)
+    if not client_key and request.mimetype in _FORM_MIMETYPES:
+        client_key = request.form.get(FORM_FIELD)
+    return client_key or None
+
+
+def replays(route, methods=('POST',)):
+    """Predicate telling whether this request will be answered from a stored response.
+
+    For admission.limit(exempt=...): a retry that is replayed runs no view, so
+    it should not cost a token, nor be turned away while the first attempt's
+    response waits for it.
+    """
+    def replayed():
+        client_key = _client_key(methods)
+        if client_key is None or len(client_key) > MAX_KEY_LENGTH:
+            return False
+        stored = _lookup(_digest(route, session['user_id'], client_key))
+        return stored is not None and stored != 'pending'
+    return replayed
+
+
+def idempotent(route, methods=('POST',)):
+    """Decorator replaying the stored response of a repeated ``Idempotency-Key``.
+
+    Requests without the header, other methods and anonymous users run the view
+    as usual. Only responses of attempts that committed a write are stored;
+    anything else (a validation error, a crash) frees the key for the retry.
+    Put it inside admission.limit() with ``exempt=replays(route)``, so rejected
+    requests never claim a key and replays never take a token.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            client_key = _client_key(methods)
+            if client_key is None:
+                return view(*args, **kwargs)
+            if len(client_key) > MAX_KEY_LENGTH:
+                return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 400)
+            key = _digest(route, session['user_id'], client_key)
+            fingerprint = _fingerprint()
+
+            stored = _lookup(key)
+            if stored is None and not _claim(key, fingerprint):
+                stored = _lookup(key)
+            elif stored is None:
+                commits = g.get('idempotency_commits', 0)
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except BaseException:
+                    _release(key)
+                    raise
+                if g.get('idempotency_commits', 0) > commits and response.status_code < 500 \
+                        and not response.is_streamed:
+                    _store(key, fingerprint, response)
+                else:
+                    _release(key)
+                return response
+
+            if stored == 'pending' or stored is None:
+                return _error('A request with this Idempotency-Key is still being processed', 409, retry_after=1)
+            return _replay(stored, fingerprint)
+        return wrapped
+    return decorator
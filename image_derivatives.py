@@ -0,0 +1,156 @@
+# image_derivatives.py
+# Offline responsive-image generation for static/images, run as part of
+# `flask --app app assets build` (see assets.py).
+#
+# Every JPEG/PNG is re-encoded at several widths as AVIF, WebP and its own
+# format (the fallback for browsers that support neither); every SVG is
+# minified. Outputs are fingerprinted like the CSS/JS. The widths, sizes and
+# URLs of the raster images go into images.json, which the
+# responsive_image() macro in templates/macros.html turns into a <picture>
+# with srcset, so a phone on 2G downloads a 320px WebP instead of a
+# 6000px JPEG.
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+
+from lazy_imports import is_available, lazy_import
+
+Image = lazy_import('PIL.Image', 'Pillow')
+
+IMAGES_MANIFEST_NAME = 'images.json'
+RASTER_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = (320, 640, 960, 1280, 1920)
+# Preferred first; the browser takes the first <source> type it supports
+MODERN_FORMATS = ('avif', 'webp')
+ENCODE_OPTIONS = {
+    'avif': {'quality': 50, 'speed': 6},
+    'webp': {'quality': 75, 'method': 6},
+    'jpeg': {'quality': 80, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+}
+EXTENSIONS = {'avif': '.avif', 'webp': '.webp', 'jpeg': '.jpg', 'png': '.png'}
+
+_SVG_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_SVG_BETWEEN_TAGS = re.compile(r'>\s+<')
+_SVG_SPACE = re.compile(r'\s{2,}')
+_SVG_GEOMETRY = re.compile(r'\s(d|points)="([^"]*)"')
+_LONG_DECIMAL = re.compile(r'(\d+\.\d{2})\d+')
+
+
+def minify_svg(text):
+    """Strip comments and whitespace and round path coordinates to two decimals."""
+    text = _SVG_COMMENT.sub('', text)
+    text = re.sub(r'<\?xml[^>]*\?>', '', text)
+    text = _SVG_BETWEEN_TAGS.sub('><', text)
+    text = _SVG_SPACE.sub(' ', text)
+    # Sub-pixel precision beyond 1/100 of a user unit is invisible at any size these are shown
+    text = _SVG_GEOMETRY.sub(_round_geometry, text)
+    return text.strip()
+
+
+def _round_geometry(match):
+    rounded = _LONG_DECIMAL.sub(r'\1', match.group(2))
+    return f' {match.group(1)}="{rounded}"'
+
+
+def available_formats():
+    """Modern formats this Pillow build can encode."""
+    if is_available('pillow_avif'):
+        # Registers the AVIF plugin with Pillow
+        importlib.import_module('pillow_avif')
+    Image.init()
+    return tuple(fmt for fmt in MODERN_FORMATS if fmt.upper() in Image.SAVE)
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), **ENCODE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def _widths(original_width):
+    # Skip steps within 10% of the original; they would save next to nothing
+    widths = [w for w in IMAGE_WIDTHS if w < original_width * 0.9]
+    if original_width <= IMAGE_WIDTHS[-1]:
+        widths.append(original_width)
+    return widths
+
+
+def build_raster(source_path, name, formats, write):
+    """Write the derivatives of one raster image; return its images.json entry."""
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem = os.path.splitext(name)[0]
+    fallback = 'png' if name.lower().endswith('.png') else 'jpeg'
+
+    encoded = {}  # format -> [(width, bytes)]
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        width, height = original.size
+        for target_width in _widths(width):
+            resized = original
+            if target_width != width:
+                target_height = round(height * target_width / width)
+                resized = original.resize((target_width, target_height), Image.LANCZOS)
+            for fmt in formats + (fallback,):
+                encoded.setdefault(fmt, []).append((target_width, _encode(resized, fmt)))
+
+    # A modern format only earns a <source> if it beats every format after it;
+    # AVIF in particular can lose to WebP on small, flat images
+    total = {fmt: sum(len(blob) for _, blob in variants) for fmt, variants in encoded.items()}
+    order = formats + (fallback,)
+    kept = [fmt for i, fmt in enumerate(order)
+            if fmt == fallback or all(total[fmt] < total[later] for later in order[i + 1:])]
+
+    entry = {'width': width, 'height': height, 'fallback': fallback, 'sources': {}}
+    for fmt in kept:
+        variants = []
+        for target_width, blob in encoded[fmt]:
+            hashed = f'{stem}.{digest}-{target_width}{EXTENSIONS[fmt]}'
+            write(hashed, blob)
+            variants.append([target_width, hashed])
+        entry['sources'][fmt] = variants
+    return entry
+
+
+def build_images(static_folder, write):
+    """Generate every derivative under static/images.
+
+    ``write(name, data)`` stores one output file. Returns (manifest, images):
+    the plain name -> hashed name entries (the SVGs and the largest fallback
+    of each raster, for asset_url()) and the images.json contents.
+    """
+    manifest = {}
+    images = {}
+    formats = available_formats() if is_available('PIL') else None
+    for root, _, files in os.walk(os.path.join(static_folder, 'images')):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            lowered = filename.lower()
+            if lowered.endswith('.svg'):
+                with open(path, encoding='utf-8') as f:
+                    data = minify_svg(f.read()).encode('utf-8')
+                stem = os.path.splitext(name)[0]
+                hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}.svg'
+                write(hashed, data)
+                manifest[name] = hashed
+            elif lowered.endswith(RASTER_EXTENSIONS) and formats is not None:
+                entry = build_raster(path, name, formats, write)
+                images[name] = entry
+                manifest[name] = entry['sources'][entry['fallback']][-1][1]
+    return manifest, images
+
+
+def load_images_manifest(directory):
+    try:
+        with open(os.path.join(directory, IMAGES_MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
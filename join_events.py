@@ -0,0 +1,196 @@
+# join_events.py
+# Write-behind recorder for the consultation joined flags.
+#
+# join_video and doctor_join_consultation used to set patient_joined /
+# doctor_joined and commit on every hit, reloads included. Now:
+#   - A hit on a consultation whose flag is already set writes nothing.
+#   - Otherwise the join is queued in the worker with its timestamp, and
+#     repeats while it is queued are dropped.
+#   - A background task flushes the queue every JOIN_FLUSH_INTERVAL seconds.
+#     Each batch of up to JOIN_FLUSH_BATCH joins is one transaction. If it
+#     fails, its joins are retried one per transaction; a join that keeps
+#     failing is dropped after MAX_ATTEMPTS and logged at ERROR by id.
+#
+# Each join is applied with a conditional UPDATE ... WHERE <flag> IS NOT 1.
+# Only the first transition sets the flag and its *_joined_at timestamp and
+# moves the analytics rollups; a join already applied by another worker
+# matches no row. Readers (check-doctor-status, the dashboards) see a join
+# at most one flush interval late.
+#
+# record_join() returns whether the hit was that first transition as far as
+# this worker can tell (not set, not already queued here), so the routes
+# notify the other side once rather than on every reload.
+#
+# With JOIN_WRITE_BEHIND off the same UPDATE runs and commits inside the
+# request, which keeps tests and benchmarks deterministic. Queued joins are
+# flushed at exit; a worker killed with SIGKILL loses at most one interval
+# of them.
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import update
+
+import analytics
+from extensions import db, shards, socketio
+from models import Consultation
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('patient', 'doctor')
+MAX_ATTEMPTS = 3
+
+_pending = OrderedDict()  # (consultation id, role) -> (joined at, failed attempts)
+_lock = threading.Lock()
+_flushing = False
+_app = None
+
+
+def _columns(role):
+    return getattr(Consultation, f'{role}_joined'), getattr(Consultation, f'{role}_joined_at')
+
+
+def apply_join(consultation_id, role, joined_at):
+    """Set the ``role`` flag of a consultation unless it is set already; True if this changed it."""
+    flag, stamp = _columns(role)
+    shard = shards.shard_of_id(consultation_id) if shards.configured else None
+    row = db.session.execute(
+        update(Consultation)
+        .where(Consultation.id == consultation_id, flag.isnot(True))
+        .values({flag: True, stamp: joined_at})
+        .returning(Consultation.patient_joined, Consultation.doctor_joined)
+        .execution_options(synchronize_session=False),
+        bind_arguments=shards.bind_arguments(shard)).first()
+    if row is None:
+        return False
+    before = SimpleNamespace(patient_joined=row.patient_joined, doctor_joined=row.doctor_joined)
+    setattr(before, f'{role}_joined', False)
+    analytics.record_consultation_change(row, analytics.consultation_state(before), shard=shard)
+    return True
+
+
+def record_join(consultation, role):
+    """``role`` ('patient' or 'doctor') joined ``consultation``; call from the join routes.
+
+    Returns True if this hit is the join, False for a repeat: the flag was set
+    already, or the join is still queued.
+    """
+    if getattr(consultation, f'{role}_joined'):
+        return False
+    joined_at = datetime.utcnow()
+    if not current_app.config.get('JOIN_WRITE_BEHIND', True):
+        if not apply_join(consultation.id, role, joined_at):
+            return False
+        db.session.commit()
+        return True
+    global _app, _flushing
+    key = (consultation.id, role)
+    with _lock:
+        if key in _pending:
+            return False
+        # The first hit's time is the join time
+        _pending[key] = (joined_at, 0)
+        if _flushing:
+            return True
+        _flushing = True
+        _app = current_app._get_current_object()
+    socketio.start_background_task(_flush_loop)
+    return True
+
+
+def _take_batch(size):
+    with _lock:
+        batch = []
+        while _pending and len(batch) < size:
+            batch.append(_pending.popitem(last=False))
+        return batch
+
+
+def _apply(batch):
+    for (consultation_id, role), (joined_at, _) in batch:
+        apply_join(consultation_id, role, joined_at)
+    db.session.commit()
+
+
+def _flush_batch(batch):
+    """Apply ``batch`` in one transaction; return False if any join in it failed.
+
+    If the transaction fails, each join is retried in a transaction of its own,
+    so one bad row does not hold back the others. Joins that still fail are
+    queued again, and dropped after MAX_ATTEMPTS.
+    """
+    try:
+        _apply(batch)
+        return True
+    except Exception:
+        db.session.rollback()
+        logger.exception('Failed to flush %d consultation joins', len(batch))
+    failed = []
+    if len(batch) > 1:
+        for entry in batch:
+            try:
+                _apply([entry])
+            except Exception:
+                db.session.rollback()
+                (consultation_id, role), _ = entry
+                logger.exception('Failed to apply the %s join of consultation %s', role, consultation_id)
+                failed.append(entry)
+    else:
+        failed = batch
+    with _lock:
+        for key, (joined_at, attempts) in failed:
+            if attempts + 1 < MAX_ATTEMPTS:
+                _pending.setdefault(key, (joined_at, attempts + 1))
+            else:
+                logger.error('Dropping the %s join of consultation %s (joined at %s) after %d attempts',
+                             key[1], key[0], joined_at.isoformat(), MAX_ATTEMPTS)
+    return not failed
+
+
+def flush():
+    """Apply every queued join now; needs an app context."""
+    batch_size = current_app.config.get('JOIN_FLUSH_BATCH', 200)
+    while True:
+        batch = _take_batch(batch_size)
+        if not batch or not _flush_batch(batch):
+            return
+
+
+def _flush_loop():
+    # Runs only while there is something to flush, so an idle worker has no task
+    global _flushing
+    app = _app
+    interval = app.config.get('JOIN_FLUSH_INTERVAL', 0.25)
+    batch_size = app.config.get('JOIN_FLUSH_BATCH', 200)
+    while True:
+        socketio.sleep(interval)
+        with _lock:
+            if not _pending:
+                _flushing = False
+                return
+        with app.app_context():
+            # After a failure, wait an interval before the retry
+            while True:
+                batch = _take_batch(batch_size)
+                if not batch or not _flush_batch(batch):
+                    break
+
+
+@atexit.register
+def _flush_at_exit():
+    if _app is not None and _pending:
+        with _app.app_context():
+            flush()
+
+
+def reset_after_fork():
+    # Joins queued in the master are the master's to flush, and its task is not running here
+    global _lock, _flushing, _app
+    _lock = threading.Lock()
+    _pending.clear()
+    _flushing = False
+    _app = None
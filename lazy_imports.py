@@ -0,0 +1,58 @@
+# lazy_imports.py
+import importlib
+import importlib.util
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that performs the real import on first attribute access.
+
+    Heavy or optional dependencies (Twilio, pdfkit, ...) are only needed by a
+    few request paths, so importing them up front just slows down worker boot.
+    """
+
+    def __init__(self, name, install_hint=None):
+        super().__init__(name)
+        self.__dict__['_lazy_install_hint'] = install_hint
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    try:
+                        module = importlib.import_module(self.__name__)
+                    except ImportError as e:
+                        hint = self.__dict__['_lazy_install_hint']
+                        if hint:
+                            raise ImportError(f"{self.__name__} is required for this feature (pip install {hint})") from e
+                        raise
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name, install_hint=None):
+    """Return a proxy for ``name`` that is imported the first time it is used."""
+    return LazyModule(name, install_hint)
+
+
+def is_available(name):
+    """Check whether an optional dependency can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
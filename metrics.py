@@ -0,0 +1,313 @@
+# metrics.py
+# Metrics rendered in the Prometheus text format on /metrics.
+#
+# Every sample lives in one anonymous shared memory map created when the app
+# is built (Metrics.init_app), like admission.py's buckets. With gunicorn
+# --preload every worker inherits it and adds to the same counters, so any
+# worker answering a scrape reports the totals of the whole instance and the
+# rates no longer jump between workers' counts. Without --preload each
+# worker has its own map again; scrape every worker on its own port then,
+# or the series are per-worker.
+#
+# Writing to the map hashes every key and takes a process-shared lock that
+# blocks the gevent hub, so the hot paths batch: a request counts its SQL
+# statements in g and adds them with its other samples in one update(), and
+# statements outside requests are added every SQL_BATCH of them.
+import bisect
+import hashlib
+import multiprocessing
+import mmap
+import struct
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+SQL_BATCH = 100
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# key hash, value, key (metric name, label values and sample part, NUL-padded)
+_SLOT = struct.Struct('<Qd240s')
+_SEPARATOR, _LABEL_SEPARATOR = '\x1f', '\x1e'
+
+
+class SharedSamples:
+    """Fixed-size open-addressing table of sample values in shared memory.
+
+    Keys are stored next to their value, so a scrape can list them. A key
+    that finds the table full is dropped and counted in ``dropped``.
+    """
+
+    def __init__(self, slots=8192):
+        self.slots = slots
+        self.dropped = 0
+        self._map = mmap.mmap(-1, slots * _SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    @staticmethod
+    def _encode(name, labelvalues, part):
+        key = _SEPARATOR.join((name, _LABEL_SEPARATOR.join(str(value) for value in labelvalues), part)).encode()
+        # Never 0, which marks a free slot
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1, key[:_SLOT.size - 16]
+
+    def _find(self, key_hash):
+        """Offset of the slot for ``key_hash`` and whether it is new; None if the table is full."""
+        start = key_hash % self.slots
+        for probe in range(self.slots):
+            offset = ((start + probe) % self.slots) * _SLOT.size
+            stored_hash = _SLOT.unpack_from(self._map, offset)[0]
+            if stored_hash == key_hash:
+                return offset, False
+            if stored_hash == 0:
+                return offset, True
+        return None, True
+
+    def update(self, changes, replace=False):
+        """Add (or with ``replace``, set) each ((name, labelvalues, part), amount) of ``changes``."""
+        encoded = [(self._encode(*key), amount) for key, amount in changes]
+        with self._lock:
+            for (key_hash, key), amount in encoded:
+                offset, new = self._find(key_hash)
+                if offset is None:
+                    self.dropped += 1
+                    continue
+                value = 0.0 if new or replace else _SLOT.unpack_from(self._map, offset)[1]
+                _SLOT.pack_into(self._map, offset, key_hash, value + amount, key)
+
+    def items(self):
+        """{name: {labelvalues: {part: value}}} of every stored sample."""
+        with self._lock:
+            data = bytes(self._map)
+        samples = {}
+        for key_hash, value, key in _SLOT.iter_unpack(data):
+            if not key_hash:
+                continue
+            fields = key.rstrip(b'\0').decode(errors='ignore').split(_SEPARATOR)
+            if len(fields) != 3:
+                # A key cut short by the slot size
+                continue
+            name, labels, part = fields
+            labelvalues = tuple(labels.split(_LABEL_SEPARATOR)) if labels else ()
+            samples.setdefault(name, {}).setdefault(labelvalues, {})[part] = value
+        return samples
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _shared():
+    # Metrics.init_app() normally creates it before the workers fork
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedSamples()
+    return _store
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labelvalues, amount=1):
+        update(self.changes(*labelvalues, amount=amount))
+
+    def changes(self, *labelvalues, amount=1):
+        """The changes inc() makes, for update() together with others."""
+        return [((self.name, labelvalues, ''), amount)]
+
+    def samples(self, values):
+        for labelvalues, parts in sorted(values.items()):
+            yield self.name + _format_labels(self.labelnames, labelvalues), _as_number(parts[''])
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, *labelvalues, value):
+        _shared().update([((self.name, labelvalues, ''), value)], replace=True)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labelvalues, value):
+        update(self.changes(*labelvalues, value=value))
+
+    def changes(self, *labelvalues, value):
+        """The changes observe() makes, for update() together with others."""
+        index = bisect.bisect_left(self.buckets, value)
+        return [((self.name, labelvalues, str(index)), 1), ((self.name, labelvalues, 'sum'), value)]
+
+    def samples(self, values):
+        for labelvalues, parts in sorted(values.items()):
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += _as_number(parts.get(str(index), 0))
+                le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+                yield self.name + '_bucket' + _format_labels(self.labelnames, labelvalues, ('le', le)), cumulative
+            yield self.name + '_sum' + _format_labels(self.labelnames, labelvalues), float(parts.get('sum', 0.0))
+            yield self.name + '_count' + _format_labels(self.labelnames, labelvalues), cumulative
+
+
+def update(changes):
+    """Apply the changes of several metrics in one write to the shared map."""
+    if changes:
+        _shared().update(changes)
+
+
+def _as_number(value):
+    # Values are stored as doubles; counts render as integers
+    return int(value) if float(value).is_integer() else value
+
+
+REQUEST_LATENCY = Histogram(
+    'medicare_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+REQUEST_SQL_STATEMENTS = Histogram(
+    'medicare_request_sql_statements', 'SQL statements executed per request.', ('endpoint',), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram(
+    'medicare_request_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',))
+SQL_STATEMENTS = Counter(
+    'medicare_sql_statements_total', 'SQL statements executed, including outside requests.')
+SOCKETIO_EMITS = Counter(
+    'medicare_socketio_emits_total', 'Socket.IO events emitted by namespace.', ('namespace', 'event'))
+SMS_SEND_SECONDS = Histogram(
+    'medicare_sms_send_duration_seconds', 'SMS send latency by transport and outcome.', ('transport', 'outcome'))
+ADMISSION_REJECTED = Counter(
+    'medicare_admission_rejected_total', 'Requests turned away with 429 by admission control.', ('route',))
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, SQL_STATEMENTS,
+            SOCKETIO_EMITS, SMS_SEND_SECONDS, ADMISSION_REJECTED]
+
+
+def render_metrics():
+    _flush_sql_statements()
+    store = _shared()
+    values = store.items()
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        samples = metric.samples(values.get(metric.name, {}))
+        lines.extend(f'{sample} {_format_value(value)}' for sample, value in samples)
+    lines.append('# HELP medicare_metrics_dropped_samples Samples this worker could not store: the shared table '
+                 'is full (raise METRICS_SLOTS).')
+    lines.append('# TYPE medicare_metrics_dropped_samples gauge')
+    lines.append(f'medicare_metrics_dropped_samples {store.dropped}')
+    return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+# Statements run outside requests (CLI, background tasks) not yet in the map
+_unreported_sql = 0
+_unreported_lock = threading.Lock()
+
+
+def _flush_sql_statements(at_least=1):
+    global _unreported_sql
+    with _unreported_lock:
+        if _unreported_sql < at_least:
+            return
+        amount, _unreported_sql = _unreported_sql, 0
+    SQL_STATEMENTS.inc(amount=amount)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global _unreported_sql
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        # Added to the map once, by _finish_request
+        g.sql_statements = g.get('sql_statements', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+        return
+    with _unreported_lock:
+        _unreported_sql += 1
+    _flush_sql_statements(at_least=SQL_BATCH)
+
+
+class Metrics:
+    """Flask extension wiring request, SQL and Socket.IO instrumentation."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, db=None, socketio=None):
+        global _store
+        # Created here, before gunicorn forks, so every worker adds to the same samples
+        _store = SharedSamples(app.config.get('METRICS_SLOTS', 8192))
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if db is not None:
+            with app.app_context():
+                for engine in db.engines.values():
+                    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        if socketio is not None and socketio.server is not None:
+            self._count_emits(socketio.server)
+        app.extensions['metrics'] = self
+
+    @staticmethod
+    def _count_emits(server):
+        if getattr(server.emit, '_counts_emits', False):
+            return
+        original_emit = server.emit
+
+        @wraps(original_emit)
+        def emit(event_name, *args, namespace=None, **kwargs):
+            SOCKETIO_EMITS.inc(namespace or '/', event_name)
+            return original_emit(event_name, *args, namespace=namespace, **kwargs)
+        emit._counts_emits = True
+        server.emit = emit
+
+    @staticmethod
+    def _start_request():
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @staticmethod
+    def _finish_request(response):
+        statements = g.get('sql_statements', 0)
+        changes = SQL_STATEMENTS.changes(amount=statements) if statements else []
+        started = g.get('request_started')
+        if started is not None and request.path != '/metrics':
+            endpoint = request.endpoint or 'unmatched'
+            changes += REQUEST_LATENCY.changes(endpoint, request.method, value=time.perf_counter() - started)
+            changes += REQUEST_SQL_STATEMENTS.changes(endpoint, value=statements)
+            changes += REQUEST_SQL_SECONDS.changes(endpoint, value=g.get('sql_seconds', 0.0))
+        update(changes)
+        return response
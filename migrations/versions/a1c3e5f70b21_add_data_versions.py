@@ -0,0 +1,28 @@
+"""Add data_versions for the dashboard fragment cache
+
+Revision ID: a1c3e5f70b21
+Revises: 4d54b808e917
+Create Date: 2026-10-19 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70b21'
+down_revision = '4d54b808e917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_versions',
+    sa.Column('scope', sa.String(length=160), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade():
+    op.drop_table('data_versions')
@@ -0,0 +1,49 @@
+"""Add rollup tables for the admin analytics endpoint
+
+Revision ID: b7d2f4a61c38
+Revises: a1c3e5f70b21
+Create Date: 2026-10-19 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f4a61c38'
+down_revision = 'a1c3e5f70b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('appointment_daily_counts',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('specialty', sa.String(length=120), nullable=False),
+    sa.Column('appointments', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'specialty')
+    )
+    op.create_table('disease_counts',
+    sa.Column('disease', sa.String(length=120), nullable=False),
+    sa.Column('predictions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('disease')
+    )
+    op.create_table('consultation_state_counts',
+    sa.Column('state', sa.String(length=20), nullable=False),
+    sa.Column('consultations', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('state')
+    )
+    op.create_table('asha_workload',
+    sa.Column('asha_worker_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('appointments', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['asha_worker_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('asha_worker_id', 'status')
+    )
+
+
+def downgrade():
+    op.drop_table('asha_workload')
+    op.drop_table('consultation_state_counts')
+    op.drop_table('disease_counts')
+    op.drop_table('appointment_daily_counts')
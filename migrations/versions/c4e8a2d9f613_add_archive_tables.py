@@ -0,0 +1,61 @@
+"""Add appointments.updated_at and the archive tables
+
+Revision ID: c4e8a2d9f613
+Revises: b7d2f4a61c38
+Create Date: 2026-10-19 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2d9f613'
+down_revision = 'b7d2f4a61c38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # Existing rows start ageing from the upgrade, not from an unknown past
+    op.execute("UPDATE appointments SET updated_at = CURRENT_TIMESTAMP")
+
+    op.create_table('appointments_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('asha_worker_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('time_slot', sa.String(length=50), nullable=False),
+    sa.Column('type_of_doctor', sa.String(length=120), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('prescription_file', sa.String(length=255), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('appointments_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_appointments_archive_user_id'), ['user_id'], unique=False)
+
+    op.create_table('consultations_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('doctor_name', sa.String(length=100), nullable=False),
+    sa.Column('patient_name', sa.String(length=100), nullable=False),
+    sa.Column('video_call_link', sa.String(length=255), nullable=True),
+    sa.Column('doctor_joined', sa.Boolean(), nullable=True),
+    sa.Column('patient_joined', sa.Boolean(), nullable=True),
+    sa.Column('consultation_date', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('consultations_archive')
+    with op.batch_alter_table('appointments_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_appointments_archive_user_id'))
+
+    op.drop_table('appointments_archive')
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,38 @@
+"""Add idempotency_keys
+
+Revision ID: d5f1b3a8e247
+Revises: c4e8a2d9f613
+Create Date: 2026-10-19 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1b3a8e247'
+down_revision = 'c4e8a2d9f613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_keys',
+    sa.Column('key', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('fingerprint', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('status', sa.SmallInteger(), nullable=True),
+    sa.Column('content_type', sa.String(length=100), nullable=True),
+    sa.Column('location', sa.String(length=255), nullable=True),
+    sa.Column('body', sa.LargeBinary(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_keys_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_keys_created_at'))
+
+    op.drop_table('idempotency_keys')
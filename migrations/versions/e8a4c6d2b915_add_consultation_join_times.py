@@ -0,0 +1,36 @@
+"""Add consultation join timestamps
+
+Revision ID: e8a4c6d2b915
+Revises: d5f1b3a8e247
+Create Date: 2026-10-19 22:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a4c6d2b915'
+down_revision = 'd5f1b3a8e247'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('consultation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('doctor_joined_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('patient_joined_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('consultations_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('doctor_joined_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('patient_joined_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('consultations_archive', schema=None) as batch_op:
+        batch_op.drop_column('patient_joined_at')
+        batch_op.drop_column('doctor_joined_at')
+
+    with op.batch_alter_table('consultation', schema=None) as batch_op:
+        batch_op.drop_column('patient_joined_at')
+        batch_op.drop_column('doctor_joined_at')
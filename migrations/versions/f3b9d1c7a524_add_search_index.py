@@ -0,0 +1,80 @@
+"""Add predicted disease and the full-text search index
+
+Revision ID: f3b9d1c7a524
+Revises: e8a4c6d2b915
+Create Date: 2026-10-20 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d1c7a524'
+down_revision = 'e8a4c6d2b915'
+branch_labels = None
+depends_on = None
+
+# Same objects as search_index.py creates with the tables
+INDEXED = {
+    'users': ('username',),
+    'appointments': ('name', 'type_of_doctor', 'predicted_disease'),
+    'consultation': ('patient_name', 'doctor_name'),
+}
+
+
+def _create_sqlite(table, columns):
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{name}' for name in columns)
+    old = ', '.join(f'old.{name}' for name in columns)
+    insert_new = f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});'
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+               f"content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')")
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert_new} END')
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete_old} END')
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} '
+               f'BEGIN {delete_old} {insert_new} END')
+    # Index the existing rows
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _create_postgresql(table, columns):
+    document = " || ' ' || ".join(f"coalesce({name}, '')" for name in columns)
+    op.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+               f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED")
+    op.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)')
+
+
+def upgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('predicted_disease', sa.String(length=120), nullable=True))
+
+    with op.batch_alter_table('appointments_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('predicted_disease', sa.String(length=120), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    for table, columns in INDEXED.items():
+        if dialect == 'sqlite':
+            _create_sqlite(table, columns)
+        elif dialect == 'postgresql':
+            _create_postgresql(table, columns)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in INDEXED:
+        if dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_search_vector')
+            op.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+    with op.batch_alter_table('appointments_archive', schema=None) as batch_op:
+        batch_op.drop_column('predicted_disease')
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_column('predicted_disease')
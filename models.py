@@ -0,0 +1,130 @@
+# models.py
+from datetime import datetime
+from extensions import db, rooms
+
+class User(db.Model):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(120), nullable=False)
+    type_of_doctor = db.Column(db.String(120), nullable=True)
+    user_type = db.Column(db.String(20), nullable=True)  # 'doctor', 'patient', or 'asha_worker'
+    phone = db.Column(db.String(15), nullable=True)
+    address = db.Column(db.String(200), nullable=True)
+    date_of_birth = db.Column(db.Date, nullable=True)
+    gender = db.Column(db.String(10), nullable=True)
+    area_of_operation = db.Column(db.String(200), nullable=True)
+    worker_id = db.Column(db.String(50), nullable=True)
+    age = db.Column(db.Integer, nullable=True)
+    blood_group = db.Column(db.String(10), nullable=True)
+    appointments = db.relationship("Appointment", foreign_keys="Appointment.user_id", back_populates="user")
+    assigned_appointments = db.relationship("Appointment", foreign_keys="Appointment.asha_worker_id", back_populates="asha_worker")
+
+class Appointment(db.Model):
+    __tablename__ = 'appointments'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    asha_worker_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    name = db.Column(db.String(100), nullable=False)  # Patient name
+    time_slot = db.Column(db.String(50), nullable=False)
+    type_of_doctor = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), default='Pending')
+    prescription_file = db.Column(db.String(255), nullable=True)
+    predicted_disease = db.Column(db.String(120), nullable=True)  # from the chatbot triage; searchable
+    # Last change; archive.py moves closed appointments out once this is old enough
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    user = db.relationship("User", foreign_keys=[user_id], back_populates="appointments")
+    asha_worker = db.relationship("User", foreign_keys=[asha_worker_id], back_populates="assigned_appointments")
+
+class Doctor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_doctor_user_id'), nullable=True)
+    name = db.Column(db.String(80), nullable=False)
+    specialty = db.Column(db.String(120), nullable=False)
+    video_call_link = db.Column(db.String(255), nullable=True)
+    phone_number = db.Column(db.String(15), nullable=True)
+    user = db.relationship('User', backref='doctor', uselist=False)
+
+class Consultation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_name = db.Column(db.String(100), nullable=False)
+    patient_name = db.Column(db.String(100), nullable=False)
+    # A fresh room is allocated only when the row is inserted (see room_ids.py)
+    video_call_link = db.Column(db.String(255), nullable=True, default=rooms.video_call_link)
+    doctor_joined = db.Column(db.Boolean, default=False)
+    patient_joined = db.Column(db.Boolean, default=False)
+    consultation_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set with the flags, once, by join_events.py
+    doctor_joined_at = db.Column(db.DateTime, nullable=True)
+    patient_joined_at = db.Column(db.DateTime, nullable=True)
+
+class DataVersion(db.Model):
+    """Per-scope change counter behind the dashboard fragment cache (see fragment_cache.py)."""
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(160), primary_key=True)  # e.g. 'specialty:Cardiologist', 'asha:12'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Rollups behind /admin/analytics, kept current by analytics.py in the same
+# transaction as the writes they count
+class AppointmentDailyCount(db.Model):
+    __tablename__ = 'appointment_daily_counts'
+    day = db.Column(db.Date, primary_key=True)
+    specialty = db.Column(db.String(120), primary_key=True)
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+
+class DiseaseCount(db.Model):
+    __tablename__ = 'disease_counts'
+    disease = db.Column(db.String(120), primary_key=True)
+    predictions = db.Column(db.Integer, nullable=False, default=0)
+
+class ConsultationStateCount(db.Model):
+    __tablename__ = 'consultation_state_counts'
+    state = db.Column(db.String(20), primary_key=True)  # 'waiting', 'joined' or 'completed'
+    consultations = db.Column(db.Integer, nullable=False, default=0)
+
+class AshaWorkload(db.Model):
+    __tablename__ = 'asha_workload'
+    asha_worker_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)  # Appointment.status
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+
+# Cold copies of closed appointments and finished consultations, moved out of the
+# hot tables by archive.py. Ids are kept, so links to them stay valid.
+class ArchivedAppointment(db.Model):
+    __tablename__ = 'appointments_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, index=True)
+    asha_worker_id = db.Column(db.Integer, nullable=True)
+    name = db.Column(db.String(100), nullable=False)
+    time_slot = db.Column(db.String(50), nullable=False)
+    type_of_doctor = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20))
+    prescription_file = db.Column(db.String(255), nullable=True)
+    predicted_disease = db.Column(db.String(120), nullable=True)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class ArchivedConsultation(db.Model):
+    __tablename__ = 'consultations_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    doctor_name = db.Column(db.String(100), nullable=False)
+    patient_name = db.Column(db.String(100), nullable=False)
+    video_call_link = db.Column(db.String(255), nullable=True)
+    doctor_joined = db.Column(db.Boolean)
+    patient_joined = db.Column(db.Boolean)
+    consultation_date = db.Column(db.DateTime)
+    doctor_joined_at = db.Column(db.DateTime)
+    patient_joined_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """A claimed Idempotency-Key and the response to replay for it (see idempotency.py)."""
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.LargeBinary(16), primary_key=True)  # digest of route, user id and the client's key
+    fingerprint = db.Column(db.LargeBinary(16), nullable=False)  # digest of method, path and body
+    status = db.Column(db.SmallInteger, nullable=True)  # None while the first attempt runs
+    content_type = db.Column(db.String(100), nullable=True)
+    location = db.Column(db.String(255), nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
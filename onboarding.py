@@ -0,0 +1,265 @@
+# onboarding.py
+# Bulk onboarding of doctors, ASHA workers, patients and admins.
+#
+#   flask --app app onboard doctors.csv
+#   flask --app app onboard district.jsonl --user-type asha_worker --errors rejected.csv
+#   flask --app app users promote <username>
+#
+# Streams a CSV (header row) or JSON Lines file, validates every row and
+# inserts the valid ones in batches: one executemany INSERT for the users,
+# one for the Doctor rows linked to them, one commit per batch. Invalid rows
+# are reported with their line number and skipped; they never abort the
+# import. Rows are stored exactly as the register forms store them.
+#
+# Admins (user_type 'admin', who reach /admin and its tools) cannot
+# register through the site: onboard them with user_type admin, or promote
+# an existing account. A promoted doctor keeps its specialty and so stays a
+# doctor too. Admin pages check the role on every request, so it applies
+# at once; other role checks may use a cached role for up to
+# auth.ROLE_CACHE_TTL seconds.
+import csv
+import json
+import re
+import sys
+from datetime import date
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Doctor, User
+
+USER_TYPES = ('doctor', 'asha_worker', 'patient', 'admin')
+USER_FIELDS = ('username', 'email', 'password', 'user_type', 'type_of_doctor', 'phone', 'address',
+               'date_of_birth', 'gender', 'area_of_operation', 'worker_id', 'age', 'blood_group')
+# Beyond username, email and password
+REQUIRED_FIELDS = {
+    'doctor': ('type_of_doctor', 'phone'),
+    'asha_worker': ('worker_id', 'area_of_operation'),
+    'patient': (),
+    'admin': (),
+}
+# Column names used by the register forms and the Doctor model
+FIELD_ALIASES = {'phonenumber': 'phone', 'phone_number': 'phone', 'specialty': 'type_of_doctor'}
+BLOOD_GROUPS = frozenset(('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'))
+DEFAULT_BATCH_SIZE = 1000
+
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_PHONE = re.compile(r'^\+?[0-9][0-9 -]{5,13}$')
+
+
+class RowError(ValueError):
+    pass
+
+
+def _max_lengths():
+    return {column.name: column.type.length for column in User.__table__.columns
+            if getattr(column.type, 'length', None)}
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) for every record of a CSV or JSON Lines stream."""
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f'invalid JSON: {e}')
+                continue
+            yield line_number, record if isinstance(record, dict) else RowError('not a JSON object')
+        return
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def validate(record, default_user_type=None, max_lengths=None):
+    """Return the User column values for ``record``; raise RowError if it is not usable."""
+    if isinstance(record, RowError):
+        raise record
+    max_lengths = max_lengths or _max_lengths()
+    values = {}
+    for key, value in record.items():
+        if key is None:
+            raise RowError('more values than header columns')
+        key = FIELD_ALIASES.get(key.strip().lower(), key.strip().lower())
+        if key in USER_FIELDS and value is not None and str(value).strip():
+            values[key] = str(value).strip()
+
+    values['user_type'] = values.get('user_type', default_user_type)
+    if values['user_type'] not in USER_TYPES:
+        raise RowError(f"user_type must be one of {', '.join(USER_TYPES)}")
+    missing = [field for field in ('username', 'email', 'password') + REQUIRED_FIELDS[values['user_type']]
+               if field not in values]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    for field, value in values.items():
+        if field in max_lengths and len(value) > max_lengths[field]:
+            raise RowError(f'{field} is longer than {max_lengths[field]} characters')
+    if not _EMAIL.match(values['email']):
+        raise RowError('invalid email')
+    if 'phone' in values and not _PHONE.match(values['phone']):
+        raise RowError('invalid phone')
+    if 'age' in values:
+        if not values['age'].isdigit() or not 0 < int(values['age']) < 130:
+            raise RowError('age must be a whole number between 1 and 129')
+        values['age'] = int(values['age'])
+    if 'blood_group' in values:
+        values['blood_group'] = values['blood_group'].upper()
+        if values['blood_group'] not in BLOOD_GROUPS:
+            raise RowError('invalid blood_group')
+    if 'date_of_birth' in values:
+        try:
+            values['date_of_birth'] = date.fromisoformat(values['date_of_birth'])
+        except ValueError:
+            raise RowError('date_of_birth must be YYYY-MM-DD') from None
+    return values
+
+
+def _existing(batch):
+    usernames = [values['username'] for _, values in batch]
+    emails = [values['email'] for _, values in batch]
+    rows = db.session.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails))))
+    taken_usernames, taken_emails = set(), set()
+    for username, email in rows:
+        taken_usernames.add(username)
+        taken_emails.add(email)
+    return taken_usernames, taken_emails
+
+
+def _insert(batch):
+    """Insert the users of ``batch`` and the Doctor rows of the doctors among them."""
+    # Core inserts on the tables: the ORM bulk path would split a RETURNING
+    # executemany into one statement per row
+    users_table = User.__table__
+    users = [dict.fromkeys(USER_FIELDS) | values for _, values in batch]
+    ids = db.session.execute(
+        insert(users_table).returning(users_table.c.id, sort_by_parameter_order=True), users).scalars().all()
+    doctors = [{'user_id': user_id, 'name': user['username'], 'specialty': user['type_of_doctor'],
+                'phone_number': user['phone']}
+               for user_id, user in zip(ids, users) if user['user_type'] == 'doctor']
+    if doctors:
+        db.session.execute(insert(Doctor.__table__), doctors)
+
+
+def load_batch(batch, report):
+    """Insert one batch of validated rows; return how many were inserted."""
+    taken_usernames, taken_emails = _existing(batch)
+    fresh = []
+    for line_number, values in batch:
+        if values['username'] in taken_usernames:
+            report(line_number, values['username'], 'username already exists')
+        elif values['email'] in taken_emails:
+            report(line_number, values['username'], 'email already exists')
+        else:
+            fresh.append((line_number, values))
+    if not fresh:
+        return 0
+    try:
+        _insert(fresh)
+        db.session.commit()
+        return len(fresh)
+    except IntegrityError:
+        # Someone registered one of these meanwhile; find it row by row
+        db.session.rollback()
+    inserted = 0
+    for line_number, values in fresh:
+        try:
+            _insert([(line_number, values)])
+            db.session.commit()
+            inserted += 1
+        except IntegrityError as e:
+            db.session.rollback()
+            report(line_number, values['username'], f'rejected by the database: {e.orig}')
+    return inserted
+
+
+def onboard(rows, report, default_user_type=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Validate and insert ``rows`` ((line number, record) pairs); return the number inserted.
+
+    ``report(line_number, username, message)`` is called for every row that is skipped.
+    """
+    max_lengths = _max_lengths()
+    seen_usernames, seen_emails = set(), set()
+    batch, inserted = [], 0
+    for line_number, record in rows:
+        try:
+            values = validate(record, default_user_type, max_lengths)
+        except RowError as e:
+            username = record.get('username') if isinstance(record, dict) else None
+            report(line_number, username, str(e))
+            continue
+        # Duplicates inside the file itself: the first occurrence wins
+        if values['username'] in seen_usernames:
+            report(line_number, values['username'], 'duplicate username in file')
+            continue
+        if values['email'] in seen_emails:
+            report(line_number, values['username'], 'duplicate email in file')
+            continue
+        seen_usernames.add(values['username'])
+        seen_emails.add(values['email'])
+        batch.append((line_number, values))
+        if len(batch) >= batch_size:
+            inserted += load_batch(batch, report)
+            batch = []
+    if batch:
+        inserted += load_batch(batch, report)
+    return inserted
+
+
+@click.command('onboard')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to the file extension (.jsonl/.ndjson, otherwise CSV).')
+@click.option('--user-type', type=click.Choice(USER_TYPES), default=None,
+              help='For rows without a user_type column.')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write rejected rows here as CSV instead of to stderr.')
+@with_appcontext
+def onboard_command(path, fmt, user_type, batch_size, errors_path):
+    """Bulk-create doctors, ASHA workers, patients and admins from a CSV or JSON Lines file."""
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    errors_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    errors = csv.writer(errors_file or sys.stderr)
+    errors.writerow(('line', 'username', 'error'))
+    rejected = 0
+
+    def report(line_number, username, message):
+        nonlocal rejected
+        rejected += 1
+        errors.writerow((line_number, username or '', message))
+
+    try:
+        # newline='' lets the csv module handle line breaks inside quoted fields
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            inserted = onboard(read_rows(stream, fmt), report, user_type, batch_size)
+    finally:
+        if errors_file is not None:
+            errors_file.close()
+    click.echo(f'Onboarded {inserted} users, rejected {rejected} rows')
+
+
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+
+@users_cli.command('promote')
+@click.argument('username')
+@with_appcontext
+def promote_command(username):
+    """Make USERNAME an admin."""
+    user = db.session.execute(select(User).where(User.username == username)).scalar_one_or_none()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    if user.user_type == 'admin':
+        click.echo(f'{username} is already an admin')
+        return
+    previous, user.user_type = user.user_type, 'admin'
+    db.session.commit()
+    click.echo(f'Promoted {username} from {previous} to admin')
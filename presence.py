@@ -0,0 +1,182 @@
+# presence.py
+# Which doctors are online, per specialty.
+#
+# The doctor dashboards hold a Socket.IO connection on /doctor and emit a
+# 'heartbeat' every PRESENCE_HEARTBEAT_INTERVAL seconds. connect/heartbeat
+# mark the doctor online until PRESENCE_TTL seconds from now; disconnecting
+# the last tab, or missing heartbeats (a crashed browser, a dead worker),
+# takes them offline. Triage asks pick(specialty) for an online doctor in
+# O(1), with no database query.
+#
+# With several workers the registry has to be shared: set PRESENCE_REDIS_URL
+# (defaults to SOCKETIO_MESSAGE_QUEUE when that is a Redis URL). Without it
+# each worker only knows the doctors connected to itself.
+import threading
+import time
+from collections import OrderedDict
+
+from lazy_imports import lazy_import
+
+redis = lazy_import('redis', 'redis')
+
+# RedisBackend.leave() in one step. Run as separate commands, a connect that
+# lands between them could see its sid counted and then the doctor removed,
+# or two last tabs closing at once could both find the other's sid still
+# there and leave the doctor online until the TTL.
+# KEYS: sids set, doctor key; ARGV: sid, user id, specialty key prefix.
+_LEAVE = """
+redis.call('SREM', KEYS[1], ARGV[1])
+if redis.call('SCARD', KEYS[1]) > 0 then
+    return 0
+end
+local specialty = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[2])
+if specialty then
+    redis.call('SREM', ARGV[3] .. specialty, ARGV[2])
+end
+return 1
+"""
+
+
+class MemoryBackend:
+    """Per-process registry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_specialty = {}  # specialty -> OrderedDict(user id -> expires at), in pick order
+        self._doctors = {}  # user id -> (specialty, set of sids)
+
+    def touch(self, user_id, specialty, sid, expires_at):
+        with self._lock:
+            current = self._doctors.get(user_id)
+            if current is not None and current[0] != specialty:
+                self._by_specialty.get(current[0], {}).pop(user_id, None)
+                current = None
+            sids = current[1] if current is not None else set()
+            sids.add(sid)
+            self._doctors[user_id] = (specialty, sids)
+            self._by_specialty.setdefault(specialty, OrderedDict())[user_id] = expires_at
+
+    def leave(self, user_id, sid):
+        with self._lock:
+            current = self._doctors.get(user_id)
+            if current is None:
+                return
+            specialty, sids = current
+            sids.discard(sid)
+            if not sids:
+                del self._doctors[user_id]
+                self._by_specialty.get(specialty, {}).pop(user_id, None)
+
+    def pick(self, specialty, now):
+        with self._lock:
+            online = self._by_specialty.get(specialty)
+            while online:
+                user_id, expires_at = next(iter(online.items()))
+                if expires_at > now:
+                    # Round robin: the next caller gets the next doctor
+                    online.move_to_end(user_id)
+                    return user_id
+                del online[user_id]
+                self._doctors.pop(user_id, None)
+            return None
+
+    def online(self, now):
+        with self._lock:
+            return {specialty: [user_id for user_id, expires_at in doctors.items() if expires_at > now]
+                    for specialty, doctors in self._by_specialty.items()}
+
+
+class RedisBackend:
+    """Registry shared by every worker and node through Redis.
+
+    ``presence:doctor:<id>`` (the specialty, with a TTL) says a doctor is
+    online; ``presence:sids:<id>`` counts their connections and
+    ``presence:specialty:<name>`` indexes them for pick().
+    """
+
+    def __init__(self, url, prefix='presence:'):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._leave = self.client.register_script(_LEAVE)
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def touch(self, user_id, specialty, sid, expires_at):
+        ttl = max(1, int(expires_at - time.time()))
+        pipe = self.client.pipeline()
+        pipe.set(self._key('doctor', user_id), specialty, ex=ttl)
+        pipe.sadd(self._key('sids', user_id), sid)
+        pipe.expire(self._key('sids', user_id), ttl)
+        pipe.sadd(self._key('specialty', specialty), user_id)
+        pipe.sadd(self._key('specialties'), specialty)
+        pipe.execute()
+
+    def leave(self, user_id, sid):
+        self._leave(keys=[self._key('sids', user_id), self._key('doctor', user_id)],
+                    args=[sid, user_id, self._key('specialty', '')])
+
+    def pick(self, specialty, now):
+        key = self._key('specialty', specialty)
+        # A member whose doctor key has expired missed its heartbeats; drop it and draw again
+        while True:
+            member = self.client.srandmember(key)
+            if member is None:
+                return None
+            if self.client.get(self._key('doctor', member)) == specialty:
+                return int(member)
+            self.client.srem(key, member)
+
+    def online(self, now):
+        result = {}
+        for specialty in self.client.smembers(self._key('specialties')):
+            members = sorted(self.client.smembers(self._key('specialty', specialty)), key=int)
+            alive = self.client.mget([self._key('doctor', member) for member in members]) if members else []
+            result[specialty] = [int(member) for member, value in zip(members, alive) if value is not None]
+        return result
+
+
+class Presence:
+    """Flask extension tracking online doctors.
+
+    Settings: PRESENCE_TTL, PRESENCE_HEARTBEAT_INTERVAL (seconds) and
+    PRESENCE_REDIS_URL.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.heartbeat_interval = 20
+        self.backend = MemoryBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PRESENCE_TTL', self.ttl)
+        self.heartbeat_interval = app.config.get('PRESENCE_HEARTBEAT_INTERVAL', self.heartbeat_interval)
+        url = app.config.get('PRESENCE_REDIS_URL')
+        self.backend = RedisBackend(url) if url else MemoryBackend()
+        app.add_template_global(self.heartbeat_interval, 'presence_heartbeat_interval')
+        app.extensions['presence'] = self
+
+    def reset_after_fork(self):
+        # Connections belong to the worker that accepted them; the master has none
+        if isinstance(self.backend, MemoryBackend):
+            self.backend = MemoryBackend()
+
+    def connect(self, user_id, specialty, sid):
+        """A doctor's socket connected, or sent a heartbeat."""
+        self.backend.touch(user_id, specialty, sid, time.time() + self.ttl)
+
+    heartbeat = connect
+
+    def disconnect(self, user_id, sid):
+        self.backend.leave(user_id, sid)
+
+    def pick(self, specialty):
+        """User id of an online doctor of ``specialty``, or None; rotates between them."""
+        return self.backend.pick(specialty, time.time())
+
+    def online(self):
+        """{specialty: [user id, ...]} of the doctors online right now."""
+        return {specialty: ids for specialty, ids in self.backend.online(time.time()).items() if ids}
@@ -0,0 +1,295 @@
+# profiling.py
+# Low-overhead sampling profiler and slow-request capture for the admin pages.
+#
+# Both write into PROFILING_DIR, shared by every worker on the host, so a
+# profile started on one worker can be fetched through any other:
+#   profile-<timestamp>-<pid>.collapsed   on-demand profile, one "frame;frame;frame count"
+#                                         line per stack (flamegraph.pl / speedscope input)
+#   slow-<timestamp>-<pid>.json           request slower than SLOW_REQUEST_THRESHOLD, with
+#                                         its sampled stacks and SQL trace
+#
+# A slow request only queues its capture; a native writer thread, started
+# when there is something to write, serializes it, writes the file and trims
+# the ring, so the response of an already slow request does not wait on disk.
+import atexit
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from serving import native_threading
+
+SAMPLER_IDLE_SECONDS = 1.0
+
+
+def _current_greenlet():
+    greenlet = sys.modules.get('greenlet')
+    return greenlet.getcurrent() if greenlet is not None else None
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _trim(directory, prefix, keep):
+    """Keep only the newest ``keep`` files starting with ``prefix`` (the on-disk ring)."""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+    except FileNotFoundError:
+        return
+    for name in names[:-keep] if keep else names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass  # another worker trimmed it first
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _timestamp():
+    return time.strftime('%Y%m%dT%H%M%S') + f'{time.time() % 1:.3f}'[1:]
+
+
+class Profiler:
+    """Flask extension for on-demand profiles and slow-request captures."""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.profile_keep = 20
+        self.slow_threshold = None
+        self.slow_keep = 100
+        self.sample_interval = 0.01
+        self.max_sql_statements = 500
+        self._in_flight = {}  # request key -> (native thread id, greenlet, Counter of stacks)
+        self._start_thread, self._sleep, self._get_ident, self._allocate_lock = native_threading()
+        # Shared with the native sampler thread, so it must be a real lock, not a patched one
+        self._lock = self._allocate_lock()
+        self._sampler_running = False
+        self._sampler_ident = None
+        self._profile_running = False
+        self._slow_captures = deque()  # (file name, capture) waiting for the writer thread
+        self._writer_running = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, db=None):
+        self.directory = app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.profile_keep = app.config.get('PROFILE_KEEP', self.profile_keep)
+        self.slow_threshold = app.config.get('SLOW_REQUEST_THRESHOLD')
+        self.slow_keep = app.config.get('SLOW_REQUEST_KEEP', self.slow_keep)
+        self.sample_interval = app.config.get('PROFILE_SAMPLE_INTERVAL', self.sample_interval)
+        os.makedirs(self.directory, exist_ok=True)
+        if self.slow_threshold:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            app.teardown_request(self._teardown_request)
+            atexit.unregister(self.write_pending)  # once, however many apps use this instance
+            atexit.register(self.write_pending)
+            if db is not None:
+                with app.app_context():
+                    for engine in db.engines.values():
+                        if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.extensions['profiler'] = self
+
+    def reset_after_fork(self):
+        # The sampler thread does not survive fork; it restarts on the next request
+        self._lock = self._allocate_lock()
+        self._in_flight = {}
+        self._sampler_running = False
+        self._sampler_ident = None
+        self._profile_running = False
+        self._slow_captures = deque()
+        self._writer_running = False
+
+    # ---------------------------------------------------------------- on demand
+
+    def start_profile(self, seconds):
+        """Sample every thread of this worker for ``seconds`` in the background.
+
+        Returns the file name the collapsed stacks will be written to, or None if
+        a profile is already running in this worker.
+        """
+        with self._lock:
+            if self._profile_running:
+                return None
+            self._profile_running = True
+        name = f'profile-{_timestamp()}-{os.getpid()}.collapsed'
+        self._start_thread(self._run_profile, (seconds, name))
+        return name
+
+    def _run_profile(self, seconds, name):
+        try:
+            skip = {self._get_ident(), self._sampler_ident}
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident not in skip:
+                        stacks[collapse_stack(frame)] += 1
+                self._sleep(self.sample_interval)
+            lines = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            _write_atomic(os.path.join(self.directory, name), lines)
+            _trim(self.directory, 'profile-', self.profile_keep)
+        finally:
+            self._profile_running = False
+
+    # ---------------------------------------------------------------- slow requests
+
+    def _ensure_sampler(self):
+        if self._sampler_running:
+            return
+        with self._lock:
+            if self._sampler_running:
+                return
+            self._sampler_running = True
+        self._start_thread(self._run_sampler, ())
+
+    def _run_sampler(self):
+        # Only requests in flight are sampled; after a second without any the
+        # thread exits, and the next request starts it again
+        self._sampler_ident = self._get_ident()
+        idle = 0
+        while True:
+            self._sleep(self.sample_interval)
+            with self._lock:
+                if not self._in_flight:
+                    idle += 1
+                    if idle * self.sample_interval >= SAMPLER_IDLE_SECONDS:
+                        self._sampler_running = False
+                        self._sampler_ident = None
+                        return
+                    continue
+                idle = 0
+                frames = sys._current_frames()
+                for native_ident, greenlet, stacks in self._in_flight.values():
+                    frame = greenlet.gr_frame if greenlet is not None else None
+                    if frame is None:
+                        # Running (or plain-thread) request: its frame is the thread's current one
+                        frame = frames.get(native_ident)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+    def _start_request(self):
+        greenlet = _current_greenlet()
+        if greenlet is not None and greenlet.parent is None:
+            greenlet = None  # main greenlet of a plain thread; use the thread's frame
+        key = object()
+        g.profile_key = key
+        g.profile_started = time.perf_counter()
+        g.sql_trace = []
+        with self._lock:
+            self._in_flight[key] = (self._get_ident(), greenlet, Counter())
+        # After registering, so a sampler that sees no request in flight and exits is restarted
+        self._ensure_sampler()
+
+    def _finish_request(self, response):
+        key = g.get('profile_key')
+        if key is None:
+            return response
+        with self._lock:
+            entry = self._in_flight.pop(key, None)
+        elapsed = time.perf_counter() - g.profile_started
+        if entry is not None and elapsed >= self.slow_threshold:
+            self._save_slow_request(elapsed, response.status_code, entry[2], g.sql_trace)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when a view raises; don't leave the entry behind
+        key = g.get('profile_key')
+        if key is not None:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _save_slow_request(self, elapsed, status, stacks, sql_trace):
+        """Queue the capture of this request for the writer thread."""
+        endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unmatched')
+        name = f'slow-{_timestamp()}-{os.getpid()}-{endpoint}.json'
+        capture = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'duration_seconds': round(elapsed, 6),
+            'pid': os.getpid(),
+            'sample_interval_seconds': self.sample_interval,
+            'sql_statement_count': len(sql_trace),
+            'sql_seconds': round(sum(entry['seconds'] for entry in sql_trace), 6),
+            'sql': sql_trace,
+            'stacks': stacks,
+        }
+        with self._lock:
+            self._slow_captures.append((name, capture))
+            if self._writer_running:
+                return
+            self._writer_running = True
+        self._start_thread(self._run_writer, ())
+
+    def _run_writer(self):
+        # Exits once the queue is empty; checked under the lock that guards the
+        # queue, so a capture queued meanwhile starts the next writer
+        while True:
+            with self._lock:
+                if not self._slow_captures:
+                    self._writer_running = False
+                    return
+                name, capture = self._slow_captures.popleft()
+            self._write_slow_request(name, capture)
+
+    def _write_slow_request(self, name, capture):
+        capture['stacks'] = [f'{stack} {count}' for stack, count in capture['stacks'].most_common()]
+        _write_atomic(os.path.join(self.directory, name), json.dumps(capture, indent=1))
+        _trim(self.directory, 'slow-', self.slow_keep)
+
+    def write_pending(self):
+        """Write the queued captures now, in this thread; registered to run at exit."""
+        while True:
+            with self._lock:
+                if not self._slow_captures:
+                    return
+                name, capture = self._slow_captures.popleft()
+            self._write_slow_request(name, capture)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('trace_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['trace_start'].pop()
+        trace = g.get('sql_trace') if has_request_context() else None
+        if trace is not None and len(trace) < self.max_sql_statements:
+            trace.append({'statement': statement, 'seconds': round(time.perf_counter() - started, 6),
+                          'executemany': executemany})
+
+    # ---------------------------------------------------------------- listing
+
+    def list_files(self):
+        entries = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith('.tmp'):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+        return entries
+
+    def path_for(self, name):
+        """Absolute path of a stored file, or None if ``name`` is not one of ours."""
+        if not re.fullmatch(r'(profile|slow)-[A-Za-z0-9_.-]+', name) or name.endswith('.tmp'):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,228 @@
+# replicas.py
+# Read/write splitting between the primary database and a read replica.
+#
+# Views and query helpers that only read are wrapped in
+# @replicas.read_only(). While one runs, the session sends its SELECTs to
+# the 'replica' bind (REPLICA_DATABASE_URL). Flushes, INSERT/UPDATE/DELETE
+# and text() statements still go to the primary. Dashboard traffic then
+# queues on the replica instead of in front of /chatbot's writes.
+#
+# The replica is used only while it is fresh enough, otherwise reads fall
+# back to the primary:
+#   - Its lag is checked at most every REPLICA_LAG_CHECK_INTERVAL seconds
+#     per worker, and must be under REPLICA_MAX_LAG.
+#   - It must be at least as new as the caller's own last write. A request
+#     that commits stamps the session cookie, so a patient who just booked
+#     sees the booking on the next page.
+#
+# A replica can be:
+#   - a PostgreSQL streaming replica, whose lag comes from its WAL replay
+#     position and time;
+#   - a SQLite snapshot of a SQLite primary, refreshed by
+#       flask --app app replica snapshot --every 10
+#     Its lag is the age of the snapshot.
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask.cli import AppGroup, with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+REPLICA_BIND = 'replica'
+# Unix time the snapshot was taken, written into every SQLite snapshot
+SNAPSHOT_TABLE = 'replica_snapshot'
+_WRITE_STAMP = '_db_write_at'
+
+_PG_FRESH_AS_OF = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN extract(epoch FROM now()) '
+    'ELSE extract(epoch FROM pg_last_xact_replay_timestamp()) END')
+_SQLITE_FRESH_AS_OF = text(f'SELECT taken_at FROM {SNAPSHOT_TABLE}')
+
+
+class RoutingSession(Session):
+    """Session sending the sharded tables to their shard (see shards.py) and
+    the SELECTs of read-only code to the replica."""
+
+    def _flush(self, objects=None):
+        shards = current_app.extensions.get('shards') if has_app_context() else None
+        if shards is None or not shards.configured:
+            return super()._flush(objects)
+        # Ask for a connection per instance, so each row goes to its own shard. Only
+        # while flushing: bulk insert() statements refuse a session that has one.
+        self.connection_callable = self._connection_for_instance
+        try:
+            return super()._flush(objects)
+        finally:
+            self.connection_callable = None
+
+    def _connection_for_instance(self, mapper, instance):
+        return self.connection(bind_arguments={'mapper': mapper, 'instance': instance})
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        shards = current_app.extensions.get('shards') if has_app_context() else None
+        if shards is not None:
+            sharded, shard = shards.route(mapper, clause, kwargs)
+            if sharded and shard is not None:
+                return shards.engine(shard)
+        if not self._flushing and getattr(clause, 'is_select', False) \
+                and has_request_context() and g.get('db_read_only'):
+            replica = current_app.extensions['replicas'].engine_for_reads()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _route_load(orm_execute_state):
+    shards = current_app.extensions.get('shards') if has_app_context() else None
+    if shards is not None:
+        return shards.route_load(orm_execute_state)
+
+
+class Replicas:
+    """Flask extension deciding when reads may use the replica.
+
+    Settings: REPLICA_DATABASE_URL (also the 'replica' entry of
+    SQLALCHEMY_BINDS), REPLICA_MAX_LAG and REPLICA_LAG_CHECK_INTERVAL (seconds).
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.max_lag = 30
+        self.check_interval = 2
+        self.configured = False
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._fresh_as_of = None  # Unix time the replica has caught up to; None while unusable
+        self._snapshot_inode = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        self.configured = REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+        if self.configured and not event.contains(db.session, 'after_commit', _stamp_write):
+            event.listen(db.session, 'after_commit', _stamp_write)
+        app.cli.add_command(replica_cli)
+        app.extensions['replicas'] = self
+
+    def read_only(self, methods=None):
+        """Decorator routing the reads of a view or helper to the replica.
+
+        With ``methods``, only requests with those methods are routed (say the
+        GET of a form whose POST writes). Do not call a wrapped helper after
+        uncommitted writes in the same request: the replica cannot see them.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                if methods is not None and request.method not in methods:
+                    return func(*args, **kwargs)
+                outer = g.get('db_read_only', False)
+                g.db_read_only = True
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    g.db_read_only = outer
+            return wrapped
+        return decorator
+
+    def engine_for_reads(self):
+        """The replica engine if this request may read from it, else None."""
+        if not self.configured:
+            return None
+        fresh_as_of = self.fresh_as_of()
+        if fresh_as_of is None or fresh_as_of < session.get(_WRITE_STAMP, 0):
+            return None
+        return self.db.engines[REPLICA_BIND]
+
+    def fresh_as_of(self):
+        """Unix time the replica has caught up to, or None if it lags too much or is down."""
+        now = time.time()
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._fresh_as_of = self._measure()
+            fresh_as_of = self._fresh_as_of
+        if fresh_as_of is None or now - fresh_as_of > self.max_lag:
+            return None
+        return fresh_as_of
+
+    def _measure(self):
+        engine = self.db.engines[REPLICA_BIND]
+        try:
+            if engine.dialect.name == 'sqlite':
+                # A new snapshot replaces the file; pooled connections still read the old one
+                inode = os.stat(engine.url.database).st_ino
+                if inode != self._snapshot_inode:
+                    engine.dispose()
+                    self._snapshot_inode = inode
+                query = _SQLITE_FRESH_AS_OF
+            else:
+                query = _PG_FRESH_AS_OF
+            with engine.connect() as connection:
+                value = connection.execute(query).scalar()
+            return float(value) if value is not None else None
+        except Exception:
+            current_app.logger.warning('Replica unavailable, reading from the primary', exc_info=True)
+            return None
+
+
+def _stamp_write(db_session):
+    # Read-your-writes: this client's next reads need a replica at least this new
+    if has_request_context():
+        session[_WRITE_STAMP] = time.time()
+
+
+def snapshot(primary_path, replica_path):
+    """Copy a SQLite database to ``replica_path`` consistently, replacing it atomically."""
+    taken_at = time.time()
+    temporary_path = f'{replica_path}.tmp'
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(temporary_path)
+    try:
+        # One step: a consistent copy under a single read transaction; writers wait
+        # for the copy only outside WAL mode
+        source.backup(target)
+        target.execute(f'DROP TABLE IF EXISTS {SNAPSHOT_TABLE}')
+        target.execute(f'CREATE TABLE {SNAPSHOT_TABLE} (taken_at REAL NOT NULL)')
+        target.execute(f'INSERT INTO {SNAPSHOT_TABLE} VALUES (?)', (taken_at,))
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+    os.replace(temporary_path, replica_path)
+    return taken_at
+
+
+replica_cli = AppGroup('replica', help='Maintain the read replica.')
+
+
+@replica_cli.command('snapshot')
+@click.option('--every', type=float, default=None,
+              help='Keep taking a snapshot every this many seconds instead of once.')
+@with_appcontext
+def snapshot_command(every):
+    """Refresh the SQLite replica from the SQLite primary."""
+    db = current_app.extensions['replicas'].db
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('REPLICA_DATABASE_URL is not set')
+    primary, replica = db.engines[None], db.engines[REPLICA_BIND]
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException('Snapshots are for SQLite; use streaming replication for PostgreSQL')
+    while True:
+        started = time.perf_counter()
+        snapshot(primary.url.database, replica.url.database)
+        click.echo(f'Snapshot written to {replica.url.database} in {time.perf_counter() - started:.2f}s')
+        if every is None:
+            return
+        time.sleep(max(0.0, every - (time.perf_counter() - started)))
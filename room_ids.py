@@ -0,0 +1,104 @@
+# room_ids.py
+# Jitsi room names for consultations, allocated in-process.
+#
+# An id is 160 bits, written as 32 lowercase base32 characters:
+#
+#   48-bit Unix time in ms | 16-bit worker tag | 16-bit sequence | 80 random bits
+#
+# The timestamp makes ids k-sortable. Within one worker, the (time,
+# sequence) pair never repeats, even if the clock steps back or more than
+# 65536 rooms are asked for in one millisecond: the allocator then runs a
+# few ms ahead of the clock. Across workers and nodes, the worker tag and
+# 80 bits from the OS CSPRNG make a collision vanishingly unlikely, and the
+# same bits make a room name unguessable. No database round trip is needed.
+import hashlib
+import os
+import secrets
+import socket
+import threading
+import time
+
+# Crockford's alphabet: no i, l, o, u; safe in URLs and read out over the phone
+_ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+_SEQUENCE_MAX = 0xFFFF
+
+
+def encode(value, length=32):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + _ALPHABET.index(char)
+    return value
+
+
+def default_worker_tag():
+    """16 bits derived from this host and process."""
+    digest = hashlib.blake2b(f'{socket.gethostname()}:{os.getpid()}'.encode(), digest_size=2).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class RoomIds:
+    """Flask extension allocating consultation room ids and links.
+
+    Settings: VIDEO_CALL_BASE_URL (the Jitsi server), VIDEO_ROOM_PREFIX and
+    VIDEO_ROOM_WORKER_TAG (0-65535; derived from host and pid when unset).
+    """
+
+    def __init__(self, app=None):
+        self.base_url = 'https://meet.jit.si/'
+        self.prefix = 'medicare-'
+        self._configured_tag = None
+        self._lock = threading.Lock()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.base_url = app.config.get('VIDEO_CALL_BASE_URL', self.base_url)
+        self.prefix = app.config.get('VIDEO_ROOM_PREFIX', self.prefix)
+        tag = app.config.get('VIDEO_ROOM_WORKER_TAG')
+        self._configured_tag = int(tag) & 0xFFFF if tag not in (None, '') else None
+        self._reset()
+        app.extensions['room_ids'] = self
+
+    def _reset(self):
+        self.worker_tag = self._configured_tag if self._configured_tag is not None else default_worker_tag()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def reset_after_fork(self):
+        # A worker must not continue the master's sequence under the master's tag
+        self._lock = threading.Lock()
+        self._reset()
+
+    def allocate(self):
+        """A new room id."""
+        now = time.time_ns() // 1_000_000
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            elif self._sequence < _SEQUENCE_MAX:
+                self._sequence += 1
+            else:
+                self._last_ms, self._sequence = self._last_ms + 1, 0
+            timestamp, sequence = self._last_ms, self._sequence
+        value = ((timestamp & (2 ** 48 - 1)) << 112) | (self.worker_tag << 96) | (sequence << 80) \
+            | secrets.randbits(80)
+        return encode(value)
+
+    def video_call_link(self):
+        """URL of a new, unused room."""
+        return f'{self.base_url}{self.prefix}{self.allocate()}'
+
+
+def parse(room_id):
+    """(unix ms, worker tag, sequence) of an id from RoomIds.allocate(); for debugging."""
+    value = decode(room_id)
+    return value >> 112, (value >> 96) & 0xFFFF, (value >> 80) & 0xFFFF
@@ -0,0 +1,208 @@
+# search_index.py
+# Full-text prefix search over patients, appointments and consultations.
+#
+#   GET /search?q=ravi kum&type=appointment&limit=20
+#
+# As in a typeahead, the last word of the query matches the start of a word
+# and the others match whole words: "ravi kum" finds Ravi Kumar's
+# appointment. Once the query ends with a space the last word is complete
+# too. Indexed columns:
+#   - users: username (only patients are returned)
+#   - appointments: name, type_of_doctor, predicted_disease
+#   - consultation: patient_name, doctor_name
+#
+# The index lives in the database next to its table and is kept in sync by
+# the database itself. Core UPDATEs, the archive job's bulk DELETEs and
+# writes from other tools are covered as well as ORM flushes:
+#   - SQLite: an external-content FTS5 table <table>_fts (prefix indexes for 2
+#     and 3 characters), maintained by AFTER INSERT/UPDATE/DELETE triggers.
+#     Updates only fire the trigger when an indexed column changes, so status
+#     changes cost nothing.
+#   - PostgreSQL: a generated tsvector column search_vector ('simple'
+#     configuration, no stemming, as these are names) with a GIN index.
+# Both are created with their table (create_all, `shards init`) and by the
+# migration. Archived rows leave the index with their hot row.
+#
+# To stay fast at millions of rows, only the newest SEARCH_CANDIDATES
+# matches of each table and shard are ranked: rows whose name starts with
+# the first word come first, then the newest. bm25() is not used: its IDF
+# pass reads every match of a common prefix, tens of milliseconds per table
+# at a million rows. Filters on indexed columns, such as a doctor's own
+# consultations, are also part of the full-text match, so a rare value does
+# not scan every match of a common word.
+#
+#   flask --app app search rebuild
+#
+# recreates missing index objects and reindexes every row. Run it after a
+# batch migration has recreated an indexed SQLite table, which drops its
+# triggers.
+import re
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import Table, case, column, event, func, literal_column, select, table, text
+
+from extensions import db, shards
+from models import Appointment, Consultation, User
+from shards import SHARDED_TABLES
+
+MAX_TERMS = 8
+# Table name -> indexed columns
+INDEXED = {
+    User.__tablename__: ('username',),
+    Appointment.__tablename__: ('name', 'type_of_doctor', 'predicted_disease'),
+    Consultation.__tablename__: ('patient_name', 'doctor_name'),
+}
+# Result type -> (model, name column, returned columns, filters every result must meet)
+KINDS = {
+    'patient': (User, 'username', ('id', 'username', 'area_of_operation'), {'user_type': 'patient'}),
+    'appointment': (Appointment, 'name', ('id', 'name', 'type_of_doctor', 'predicted_disease', 'status'), {}),
+    'consultation': (Consultation, 'patient_name', ('id', 'patient_name', 'doctor_name', 'consultation_date'), {}),
+}
+# Letters and digits; both tokenizers split on everything else, underscores included
+_WORD = re.compile(r'[^\W_]+')
+
+
+def _sqlite_ddl(table_name, columns):
+    fts = f'{table_name}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{name}' for name in columns)
+    old = ', '.join(f'old.{name}' for name in columns)
+    insert_new = f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});'
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table_name}', "
+        f"content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table_name} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table_name} BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table_name} '
+        f'BEGIN {delete_old} {insert_new} END',
+    ]
+
+
+def _postgres_ddl(table_name, columns):
+    document = " || ' ' || ".join(f"coalesce({name}, '')" for name in columns)
+    return [
+        f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED",
+        f'CREATE INDEX IF NOT EXISTS ix_{table_name}_search_vector ON {table_name} USING gin (search_vector)',
+    ]
+
+
+def create_index(connection, table_name):
+    """Create the search index of ``table_name`` on ``connection`` unless it exists."""
+    ddl = {'sqlite': _sqlite_ddl, 'postgresql': _postgres_ddl}.get(connection.dialect.name)
+    if ddl is None:
+        return
+    for statement in ddl(table_name, INDEXED[table_name]):
+        connection.execute(text(statement))
+
+
+# Marks the tables to index on creation. Any Table is listened to, so the copies
+# shards.py makes (which keep the info) are indexed too, but not the tables that
+# old migrations create with op.create_table().
+for _model in (User, Appointment, Consultation):
+    _model.__table__.info['search_index'] = True
+
+
+@event.listens_for(Table, 'after_create')
+def _create_with_table(target, connection, **kw):
+    if target.info.get('search_index'):
+        create_index(connection, target.name)
+
+
+def terms(query):
+    """The words of ``query`` to match, lower-cased; single letters are dropped."""
+    return [word.lower() for word in _WORD.findall(query or '') if len(word) > 1][:MAX_TERMS]
+
+
+def _statement(kind, words, prefix, dialect, filters, candidates, limit):
+    model, name, returned, fixed = KINDS[kind]
+    source = model.__table__
+    filters = {**fixed, **filters}
+    fields = [source.c[column_name] for column_name in returned]
+    conditions = [source.c[column_name] == value for column_name, value in filters.items()]
+    narrowing = {column_name: terms(value) for column_name, value in filters.items()
+                 if column_name in INDEXED[source.name] and terms(value)}
+    score = case((func.lower(source.c[name]).like(f'{words[0]}%'), 1), else_=0).label('score')
+    if dialect == 'sqlite':
+        fts_name = f'{source.name}_fts'
+        fts = table(fts_name, column('rowid'))
+        # Quoted, so nothing in the words is FTS5 syntax
+        phrases = [f'"{word}"' for word in words]
+        if prefix:
+            phrases[-1] += '*'
+        phrases += [f'{column_name} : "{" ".join(value)}"' for column_name, value in narrowing.items()]
+        matches = (select(*fields, score)
+                   .select_from(fts.join(source, source.c.id == fts.c.rowid))
+                   .where(literal_column(fts_name).op('MATCH')(' '.join(phrases)), *conditions)
+                   .order_by(fts.c.rowid.desc()))
+    else:
+        lexemes = list(words)
+        if prefix:
+            lexemes[-1] += ':*'
+        lexemes += [word for value in narrowing.values() for word in value]
+        query = func.to_tsquery(literal_column("'simple'"), ' & '.join(lexemes))
+        matches = (select(*fields, score)
+                   .where(literal_column(f'{source.name}.search_vector').op('@@')(query), *conditions)
+                   .order_by(source.c.id.desc()))
+    ranked = matches.limit(candidates).subquery()
+    return select(ranked).order_by(ranked.c.score.desc(), ranked.c.id.desc()).limit(limit)
+
+
+def search(query, kinds=None, limit=20, filters=None):
+    """{type: [row, ...]} of the rows matching ``query``, best first, each a dict.
+
+    ``kinds`` restricts the types (default: all of KINDS); ``filters`` maps a
+    type to {column: value} its rows must have, such as what the caller may see.
+    """
+    kinds = list(KINDS) if kinds is None else kinds
+    words = terms(query)
+    if not words:
+        return {kind: [] for kind in kinds}
+    prefix = not query[-1].isspace()
+    filters = filters or {}
+    dialect = db.engine.dialect.name
+    candidates = current_app.config.get('SEARCH_CANDIDATES', 1000)
+    results = {}
+    for kind in kinds:
+        statement = _statement(kind, words, prefix, dialect, filters.get(kind, {}), candidates, limit)
+
+        def run(statement=statement):
+            return [dict(row._mapping) for row in db.session.execute(statement)]
+        if KINDS[kind][0].__tablename__ in SHARDED_TABLES:
+            rows = [row for shard_rows in shards.scatter(run).values() for row in shard_rows]
+            rows.sort(key=lambda row: (row['score'], row['id']), reverse=True)
+            del rows[limit:]
+        else:
+            rows = run()
+        results[kind] = rows
+    return results
+
+
+def rebuild():
+    """Create any missing index objects and reindex every row; returns the seconds taken."""
+    started = time.perf_counter()
+    for shard in shards.all():
+        engine = db.engine if shard is None else shards.engine(shard)
+        sharded_only = shard is not None
+        with engine.begin() as connection:
+            for table_name in INDEXED:
+                if sharded_only and table_name not in SHARDED_TABLES:
+                    continue
+                create_index(connection, table_name)
+                if connection.dialect.name == 'sqlite':
+                    connection.execute(text(f"INSERT INTO {table_name}_fts({table_name}_fts) VALUES ('rebuild')"))
+    return time.perf_counter() - started
+
+
+search_cli = AppGroup('search', help='Maintain the full-text search index.')
+
+
+@search_cli.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recreate the search index objects and reindex every row."""
+    click.echo(f'Search index rebuilt in {rebuild():.1f}s')
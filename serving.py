@@ -0,0 +1,83 @@
+# serving.py
+# Selects how the app is served. ASYNC_MODE=sync (default) keeps gunicorn's
+# blocking workers; gevent or eventlet switch to cooperative workers that can
+# hold thousands of idle Socket.IO connections and keep serving while a request
+# waits on Twilio or a slow client.
+import os
+import time
+
+from lazy_imports import is_available
+
+ASYNC_MODES = ('sync', 'gevent', 'eventlet')
+
+_patched = False
+
+
+def get_async_mode():
+    mode = os.getenv('ASYNC_MODE', 'sync').strip().lower()
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"ASYNC_MODE must be one of {', '.join(ASYNC_MODES)}, got {mode!r}")
+    return mode
+
+
+def monkey_patch(mode=None):
+    """Make the stdlib cooperative for the selected mode.
+
+    Must run before anything creates sockets, locks or threads, i.e. before the
+    app (and SQLAlchemy, Twilio, ...) is imported.
+    """
+    global _patched
+    mode = mode or get_async_mode()
+    if _patched or mode == 'sync':
+        return
+    if mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    _patched = True
+
+
+def native_threading():
+    """Return (start_new_thread, sleep, get_ident, allocate_lock) that bypass gevent/eventlet patching.
+
+    For background work that has to keep running while a greenlet hogs the CPU
+    or blocks on I/O, which only a real OS thread can do.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return (monkey.get_original('_thread', 'start_new_thread'),
+                    monkey.get_original('time', 'sleep'),
+                    monkey.get_original('_thread', 'get_ident'),
+                    monkey.get_original('_thread', 'allocate_lock'))
+    except ImportError:
+        pass
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            real_thread = patcher.original('_thread')
+            return (real_thread.start_new_thread, patcher.original('time').sleep,
+                    real_thread.get_ident, real_thread.allocate_lock)
+    except ImportError:
+        pass
+    import _thread
+    return _thread.start_new_thread, time.sleep, _thread.get_ident, _thread.allocate_lock
+
+
+def socketio_async_mode(mode=None):
+    mode = mode or get_async_mode()
+    return 'threading' if mode == 'sync' else mode
+
+
+def gunicorn_worker_class(mode=None):
+    mode = mode or get_async_mode()
+    if mode == 'gevent':
+        if not is_available('geventwebsocket'):
+            # Plain gevent workers still serve long-polling, just not WebSocket upgrades
+            return 'gevent'
+        return 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+    if mode == 'eventlet':
+        return 'eventlet'
+    return 'sync'
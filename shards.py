@@ -0,0 +1,352 @@
+# shards.py
+# District sharding of appointments and consultations.
+#
+# SHARDS names extra databases, SHARD_DISTRICTS says which districts
+# (area_of_operation) live in each, and anything unmapped stays in the
+# primary database (or SHARD_DEFAULT). These tables are partitioned:
+#   - appointments and consultation
+#   - appointments_archive and consultations_archive
+# Users and doctors stay in the primary, which serves as the directory:
+# logins and username/email uniqueness need no fan-out.
+#
+# The bookkeeping about those rows, the analytics rollups and the
+# fragment-cache data versions (LOCAL_TABLES), is kept next to them: every
+# database, the primary included, has its own copy of those tables, written
+# in the same transaction as the rows it counts. A write thus commits in a
+# single database, atomically, and readers add the copies up (see
+# analytics.summary() and fragment_cache.get_version()). A profile edit,
+# which changes a user, bumps its data versions in the primary.
+#
+# Each shard hands out ids from its own range: shard n, in SHARDS order,
+# starting at 1, uses [n * SHARD_ID_SPAN, (n + 1) * SHARD_ID_SPAN). The
+# primary uses ids below SHARD_ID_SPAN. An id alone thus names its shard, and
+# the URLs stay as they are. Never reorder or remove shards; append new ones
+# and create their tables with
+#
+#   flask --app app shards init
+#
+# db.session (replicas.RoutingSession) then picks the database per statement:
+#   - an instance being flushed goes to the shard of its id;
+#   - get(Model, id) here goes to the shard of the id;
+#   - any other query goes to the shard set by use(), or else to the shard
+#     of the logged-in user's district. A patient's or ASHA worker's pages
+#     thus only ever touch their own district.
+# Doctors are not tied to a district: their listings read every shard with
+# gather(). Admin aggregates run with scatter(), one thread per shard.
+#
+# Alembic migrations target the primary; run `shards init` for the shards.
+# When a release adds tables to a shard, run it again, followed by
+# `analytics rebuild` to recount the rollups per database.
+# Moving a user to another district does not move their appointments.
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import click
+from flask import abort, current_app, g, has_app_context, has_request_context
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import Column, Index, MetaData, Table, false, func, inspect, or_, text, true
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.util import find_tables
+
+SHARDED_TABLES = frozenset(('appointments', 'consultation', 'appointments_archive', 'consultations_archive'))
+# In every database, about that database's rows; no id ranges
+LOCAL_TABLES = frozenset(('appointment_daily_counts', 'disease_counts', 'consultation_state_counts',
+                          'asha_workload', 'data_versions'))
+_ROUTED_TABLES = SHARDED_TABLES | LOCAL_TABLES
+DEFAULT_ID_SPAN = 2 ** 40  # 8192 shards still fit in the 53 bits a JavaScript number holds exactly
+_UNSET = object()
+# Default of the helpers taking a shard: shards.current()
+CURRENT = object()
+
+
+def bind_key(name):
+    return f'shard:{name}'
+
+
+def parse_mapping(value):
+    """{'a': 'b', ...} from 'a=b,c=d' (the format of the SHARDS and SHARD_DISTRICTS variables)."""
+    mapping = {}
+    for item in (value or '').split(','):
+        key, _, target = item.partition('=')
+        if key.strip() and target.strip():
+            mapping[key.strip()] = target.strip()
+    return mapping
+
+
+class Shards:
+    """Flask extension routing the sharded tables to their district's database.
+
+    Settings: SHARDS ({name: database URL}, in id-range order),
+    SHARD_DISTRICTS ({district: shard name}), SHARD_DEFAULT (shard of
+    unmapped districts; None for the primary) and SHARD_ID_SPAN.
+
+    A shard is named by its string; None stands for the primary database.
+    """
+
+    def __init__(self, app=None, current_user=None):
+        self.names = []
+        self.districts = {}  # lower-cased district -> shard name
+        self.default = None
+        self.id_span = DEFAULT_ID_SPAN
+        self.configured = False
+        self._current_user = current_user
+        if app is not None:
+            self.init_app(app, current_user)
+
+    def init_app(self, app, current_user=None):
+        """Call before db.init_app(): adds a bind per shard to SQLALCHEMY_BINDS."""
+        shards = app.config.get('SHARDS') or {}
+        self.names = list(shards)
+        self.districts = {district.strip().lower(): name
+                          for district, name in (app.config.get('SHARD_DISTRICTS') or {}).items()}
+        self.default = app.config.get('SHARD_DEFAULT')
+        self.id_span = app.config.get('SHARD_ID_SPAN', DEFAULT_ID_SPAN)
+        unknown = {name for name in self.districts.values() if name not in shards} | (
+            {self.default} if self.default is not None and self.default not in shards else set())
+        if unknown:
+            raise ValueError(f"SHARD_DISTRICTS/SHARD_DEFAULT name unknown shards: {', '.join(sorted(unknown))}")
+        self.configured = bool(shards)
+        self._current_user = current_user
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update({bind_key(name): url for name, url in shards.items()})
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.cli.add_command(shards_cli)
+        app.extensions['shards'] = self
+
+    # Which shard
+
+    def shard_of_district(self, district):
+        if not district:
+            return self.default
+        return self.districts.get(district.strip().lower(), self.default)
+
+    def shard_of_user(self, user):
+        return self.shard_of_district(user.area_of_operation) if user is not None else None
+
+    def shard_of_id(self, row_id):
+        """Shard whose id range holds ``row_id``; KeyError if there is no such shard."""
+        number = row_id // self.id_span
+        if number == 0:
+            return None
+        if not 0 < number <= len(self.names):
+            raise KeyError(row_id)
+        return self.names[number - 1]
+
+    def id_base(self, name):
+        return 0 if name is None else (self.names.index(name) + 1) * self.id_span
+
+    def districts_of(self, name):
+        """The districts mapped to shard ``name``."""
+        return sorted(district for district, shard in self.districts.items() if shard == name)
+
+    def all(self):
+        """Every shard, the primary first."""
+        return [None] + self.names
+
+    def current(self):
+        """Shard of this context: the one set by use(), else the session user's."""
+        shard = g.get('shard', _UNSET) if has_app_context() else None
+        if shard is _UNSET:
+            user = self._current_user() if has_request_context() and self._current_user else None
+            shard = g.shard = self.shard_of_user(user)
+        return shard
+
+    @contextmanager
+    def use(self, name):
+        """Send the queries of the block to shard ``name``."""
+        outer = g.get('shard', _UNSET)
+        g.shard = name
+        try:
+            yield
+        finally:
+            if outer is _UNSET:
+                g.pop('shard', None)
+            else:
+                g.shard = outer
+
+    # Routing, for replicas.RoutingSession
+
+    def is_sharded(self, mapper=None, clause=None):
+        """Whether the statement touches a table that lives in every shard."""
+        if mapper is not None:
+            return inspect(mapper).local_table.name in _ROUTED_TABLES
+        if isinstance(clause, UpdateBase):
+            return clause.table.name in _ROUTED_TABLES
+        if clause is not None:
+            return any(getattr(table, 'name', None) in _ROUTED_TABLES for table in find_tables(clause))
+        return False
+
+    def route(self, mapper=None, clause=None, bind_arguments=None):
+        """(True, shard) if the statement goes to a shard, else (False, None).
+
+        ``bind_arguments`` may name the ``shard``, or the ``instance`` being
+        flushed. A text() statement, whose tables are unknown, goes to a shard
+        only when it is named.
+        """
+        if not self.configured:
+            return False, None
+        bind_arguments = bind_arguments or {}
+        if isinstance(clause, TextClause):
+            return 'shard' in bind_arguments, bind_arguments.get('shard')
+        if not self.is_sharded(mapper, clause):
+            return False, None
+        if 'shard' in bind_arguments:
+            return True, bind_arguments['shard']
+        instance = bind_arguments.get('instance')
+        if instance is not None:
+            shard = self.shard_of_state(inspect(instance))
+            if shard is not _UNSET:
+                return True, shard
+        return True, self.current()
+
+    def shard_of(self, instance):
+        """Shard of ``instance``'s row: the primary for unsharded tables, else the
+        shard of its id, or, before its first flush, the one the flush will pick."""
+        if not self.configured:
+            return None
+        state = inspect(instance)
+        if state.mapper.local_table.name not in SHARDED_TABLES:
+            return None
+        shard = self.shard_of_state(state)
+        return self.current() if shard is _UNSET else shard
+
+    def bind_arguments(self, shard=CURRENT):
+        """``bind_arguments`` sending a statement to ``shard`` (default: the current one)."""
+        if not self.configured:
+            return None
+        return {'shard': self.current() if shard is CURRENT else shard}
+
+    def shard_of_state(self, state):
+        """Shard of a persistent instance's row (from its identity, which never loads), else _UNSET."""
+        if state.key is None or state.mapper.local_table.name not in SHARDED_TABLES:
+            return _UNSET
+        return self.shard_of_id(state.key[1][0])
+
+    def route_load(self, orm_execute_state):
+        """do_orm_execute hook: refreshes of expired attributes and lazy loads go to the
+        shard of the instance they load for, not to the shard of the request."""
+        if not self.configured or not orm_execute_state.is_select \
+                or 'shard' in orm_execute_state.bind_arguments:
+            return None
+        state = orm_execute_state.load_options._refresh_state or orm_execute_state.lazy_loaded_from
+        shard = self.shard_of_state(state) if state is not None else _UNSET
+        if shard is _UNSET:
+            return None
+        return orm_execute_state.invoke_statement(
+            bind_arguments={**orm_execute_state.bind_arguments, 'shard': shard})
+
+    def engine(self, name):
+        return current_app.extensions['sqlalchemy'].engines[bind_key(name)]
+
+    # Queries
+
+    def get(self, model, row_id):
+        """``db.session.get(model, row_id)`` on the shard the id belongs to."""
+        db = current_app.extensions['sqlalchemy']
+        try:
+            shard = self.shard_of_id(row_id) if self.configured else None
+        except KeyError:
+            return None
+        return db.session.get(model, row_id, bind_arguments={'shard': shard})
+
+    def get_or_404(self, model, row_id):
+        row = self.get(model, row_id)
+        if row is None:
+            abort(404)
+        return row
+
+    def gather(self, query):
+        """Concatenated results of ``query()`` run on every shard in turn, in this session."""
+        if not self.configured:
+            return list(query())
+        results = []
+        for name in self.all():
+            with self.use(name):
+                results.extend(query())
+        return results
+
+    def scatter(self, query):
+        """{shard: query()} with every shard queried in parallel, each in its own session.
+
+        ``query`` must return plain values, not instances: each session closes
+        with its thread. Without shards it just runs ``query()`` here.
+        """
+        if not self.configured:
+            return {None: query()}
+        app = current_app._get_current_object()
+
+        def run(name):
+            with app.app_context(), self.use(name):
+                return query()
+        with ThreadPoolExecutor(max_workers=len(self.names) + 1, thread_name_prefix='shard') as pool:
+            return dict(zip(self.all(), pool.map(run, self.all())))
+
+    def district_filter(self, column, name):
+        """SQL condition: the district in ``column`` belongs to shard ``name``."""
+        if not self.configured:
+            return true()
+        mapped = self.districts_of(name)
+        condition = func.lower(column).in_(mapped) if mapped else false()
+        if name == self.default:
+            # Unmapped districts, and users without one, fall to the default shard
+            condition = or_(condition, column.is_(None), func.lower(column).not_in(list(self.districts)))
+        return condition
+
+
+def _shard_metadata(source):
+    """Copies of the sharded and local tables, without their foreign keys into the primary."""
+    metadata = MetaData()
+    for table in source.sorted_tables:
+        if table.name not in _ROUTED_TABLES:
+            continue
+        # AUTOINCREMENT keeps SQLite's sequence (and so the id range) even when the table empties
+        copy = Table(table.name, metadata,
+                     *(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                              autoincrement=column.autoincrement) for column in table.columns),
+                     sqlite_autoincrement=table.name in SHARDED_TABLES and table.c.id.autoincrement is not False,
+                     info=dict(table.info))
+        for index in table.indexes:
+            Index(index.name, *(copy.c[column.name] for column in index.columns), unique=index.unique)
+    return metadata
+
+
+def init_shard(name):
+    """Create the sharded and local tables in shard ``name`` and start its id sequences at its range."""
+    db = current_app.extensions['sqlalchemy']
+    shards = current_app.extensions['shards']
+    engine = shards.engine(name)
+    metadata = _shard_metadata(db.metadata)
+    base = shards.id_base(name)
+    with engine.begin() as connection:
+        metadata.create_all(connection)
+        for table in metadata.sorted_tables:
+            if table.name not in SHARDED_TABLES or table.c.id.autoincrement is False:
+                continue
+            highest = connection.execute(text(f'SELECT MAX(id) FROM {table.name}')).scalar() or 0
+            if highest >= base:
+                continue
+            if engine.dialect.name == 'sqlite':
+                connection.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': table.name})
+                connection.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                                   {'name': table.name, 'seq': base})
+            elif engine.dialect.name == 'postgresql':
+                connection.execute(text("SELECT setval(pg_get_serial_sequence(:name, 'id'), :seq)"),
+                                   {'name': table.name, 'seq': base})
+            else:
+                raise click.ClickException(f'Cannot set the id range of {engine.dialect.name} shards')
+
+
+shards_cli = AppGroup('shards', help='Maintain the district shards.')
+
+
+@shards_cli.command('init')
+@with_appcontext
+def init_command():
+    """Create the tables of every shard; safe to run again after adding one."""
+    shards = current_app.extensions['shards']
+    if not shards.configured:
+        raise click.ClickException('SHARDS is not set')
+    for name in shards.names:
+        init_shard(name)
+        click.echo(f'Shard {name}: ids from {shards.id_base(name)}')
@@ -0,0 +1,92 @@
+# sms.py
+import itertools
+import threading
+import time
+from collections import deque
+
+from lazy_imports import lazy_import
+from metrics import SMS_SEND_SECONDS
+
+twilio_rest = lazy_import('twilio.rest', 'twilio')
+
+
+class TwilioTransport:
+    name = 'twilio'
+
+    def __init__(self, account_sid, auth_token, from_number):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+
+    def is_configured(self):
+        return bool(self.from_number)
+
+    def send(self, to, body):
+        if self._client is None:
+            # The client holds an HTTP session; build it once per process, not per message
+            self._client = twilio_rest.Client(self.account_sid, self.auth_token)
+        message = self._client.messages.create(body=body, from_=self.from_number, to=to)
+        return message.sid
+
+
+class FakeTransport:
+    """Records messages in memory instead of sending them.
+
+    Used for load tests and local runs so traffic never reaches Twilio.
+    ``latency`` (seconds) simulates the provider's response time.
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0, max_messages=1000):
+        self.latency = latency
+        self.sent = deque(maxlen=max_messages)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def is_configured(self):
+        return True
+
+    def send(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            sid = f'FAKE{next(self._ids):010d}'
+            self.sent.append({'sid': sid, 'to': to, 'body': body})
+        return sid
+
+
+class SMS:
+    """Flask extension exposing the configured SMS transport (SMS_TRANSPORT=twilio|fake)."""
+
+    def __init__(self, app=None):
+        self.transport = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('SMS_TRANSPORT', 'twilio')
+        if kind == 'twilio':
+            self.transport = TwilioTransport(
+                app.config.get('TWILIO_ACCOUNT_SID'),
+                app.config.get('TWILIO_AUTH_TOKEN'),
+                app.config.get('TWILIO_PHONE_NUMBER'),
+            )
+        elif kind == 'fake':
+            self.transport = FakeTransport(latency=app.config.get('SMS_FAKE_LATENCY', 0.0))
+        else:
+            raise ValueError(f"Unknown SMS_TRANSPORT {kind!r}; expected 'twilio' or 'fake'")
+        app.extensions['sms'] = self
+
+    def is_configured(self):
+        return self.transport is not None and self.transport.is_configured()
+
+    def send(self, to, body):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            sid = self.transport.send(to, body)
+            outcome = 'sent'
+            return sid
+        finally:
+            SMS_SEND_SECONDS.observe(self.transport.name, outcome, value=time.perf_counter() - start)
@@ -0,0 +1,48 @@
+const socket = io('/asha_worker');
+
+socket.on('connect', () => {
+    console.log('Connected to WebSocket server');
+});
+
+socket.on('appointment_assigned', (data) => {
+    console.log('Appointment assigned:', data);
+    const notificationList = document.getElementById('notification-list');
+    const li = document.createElement('li');
+    li.innerHTML = `<span>New appointment assigned: ${data.patient_name} with ${data.doctor_name} at ${data.time_slot}</span>`;
+    notificationList.insertBefore(li, notificationList.firstChild);
+});
+
+socket.on('prescription_uploaded', (data) => {
+    console.log('Prescription uploaded:', data);
+    const modal = document.getElementById('prescription-modal');
+    const message = document.getElementById('prescription-message');
+    const downloadLink = document.getElementById('download-link');
+    const previewLink = document.getElementById('preview-link');
+
+    message.textContent = `Prescription uploaded for ${data.patient_name} by ${data.doctor_name}`;
+    downloadLink.href = `/download_prescription/${data.appointment_id}`;
+    previewLink.href = `/view_prescription/${data.appointment_id}`;
+    modal.style.display = 'block';
+
+    const notificationList = document.getElementById('notification-list');
+    const li = document.createElement('li');
+    li.innerHTML = `<span>Prescription uploaded for ${data.patient_name} by ${data.doctor_name}</span>
+                    <a href="/download_prescription/${data.appointment_id}" target="_blank">Download</a>`;
+    notificationList.insertBefore(li, notificationList.firstChild);
+});
+
+function closePrescriptionModal() {
+    const modal = document.getElementById('prescription-modal');
+    modal.style.display = 'none';
+}
+
+document.getElementById('menu-btn').onclick = () => {
+    document.querySelector('.navbar').classList.toggle('active');
+};
+
+window.onclick = function(event) {
+    const modal = document.getElementById('prescription-modal');
+    if (event.target === modal) {
+        modal.style.display = 'none';
+    }
+}
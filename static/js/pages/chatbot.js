@@ -0,0 +1,79 @@
+// Network errors on a weak connection are retried this many times
+const MAX_ATTEMPTS = 3;
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID(); // secure contexts only
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+function postWithRetry(url, body, idempotencyKey, attempt = 1) {
+    return fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey,
+        },
+        body: body,
+    })
+    .then(response => {
+        // 409: the first attempt is still being processed
+        if (response.status === 409 && attempt < MAX_ATTEMPTS) {
+            return new Promise(resolve => setTimeout(resolve, 1000 * attempt))
+                .then(() => postWithRetry(url, body, idempotencyKey, attempt + 1));
+        }
+        return response;
+    }, error => {
+        if (attempt >= MAX_ATTEMPTS) throw error;
+        return new Promise(resolve => setTimeout(resolve, 1000 * attempt))
+            .then(() => postWithRetry(url, body, idempotencyKey, attempt + 1));
+    });
+}
+
+function sendMessage() {
+    const userInput = document.getElementById('userInput').value.trim();
+    if (userInput === "") return; // Don't send empty messages
+
+    const chatbox = document.getElementById('chatbox');
+
+    // Append user's message
+    const userMessage = document.createElement('div');
+    userMessage.classList.add('chat-message', 'user');
+    userMessage.innerHTML = `<div class="message">${userInput}</div>`;
+    chatbox.appendChild(userMessage);
+    chatbox.scrollTop = chatbox.scrollHeight;
+
+    // Send user input to chatbot; retries reuse the key, so the server books once
+    postWithRetry('/chatbot', JSON.stringify({ user_input: userInput }), newIdempotencyKey())
+    .then(response => response.json())
+    .then(data => {
+        console.log("Response from backend:", data); // Log the response
+
+        // Append bot's response
+        const botMessage = document.createElement('div');
+        botMessage.classList.add('chat-message', 'bot');
+        botMessage.innerHTML = `<div class="message">${data.message || "I'm not sure. Please try again."}</div>`;
+        chatbox.appendChild(botMessage);
+
+        // Append video call link if available
+        if (data.video_link) {
+            const videoLink = document.createElement('div');
+            videoLink.classList.add('chat-message', 'bot');
+            videoLink.innerHTML = `<div class="message"><a href="${data.video_link}" target="_blank" class="video-link">Join Video Call with ${data.doctor_name}</a></div>`;
+            chatbox.appendChild(videoLink);
+        }
+
+        // Scroll to the bottom of the chat
+        chatbox.scrollTop = chatbox.scrollHeight;
+
+        // Clear input field
+        document.getElementById('userInput').value = "";
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        const errorMessage = document.createElement('div');
+        errorMessage.classList.add('chat-message', 'bot');
+        errorMessage.innerHTML = `<div class="message error"><strong>Error:</strong> Failed to get a response from the bot.</div>`;
+        chatbox.appendChild(errorMessage);
+        chatbox.scrollTop = chatbox.scrollHeight;
+    });
+}
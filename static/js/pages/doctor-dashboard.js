@@ -0,0 +1,48 @@
+const socket = io('/doctor');
+
+socket.on('connect', () => {
+    console.log('Connected to WebSocket server');
+});
+
+// Keeps this doctor listed as online for triage (see presence.py)
+const heartbeatSeconds = Number(document.currentScript.dataset.heartbeatInterval) || 20;
+setInterval(() => {
+    if (socket.connected) {
+        socket.emit('heartbeat');
+    }
+}, heartbeatSeconds * 1000);
+
+socket.on('patient_joined', (data) => {
+    console.log(data);
+    const modal = document.getElementById('notification-modal');
+    const message = document.getElementById('modal-message');
+    const joinLink = document.getElementById('modal-join-link');
+
+    message.textContent = `Patient ${data.patient_name} has joined the video call!`;
+    joinLink.href = `/doctor_join_consultation/${data.consultation_id}`; // Updated link
+    modal.style.display = 'block';
+
+    const notificationList = document.getElementById('notification-list');
+    const li = document.createElement('li');
+    li.innerHTML = `
+        <span>Patient ${data.patient_name} has joined the video call!</span>
+        <a href="/doctor_join_consultation/${data.consultation_id}" target="_blank"><i class="fas fa-video"></i> Join Now</a>
+    `;
+    notificationList.insertBefore(li, notificationList.firstChild);
+});
+
+socket.on('message', (data) => {
+    console.log('Message from server:', data.data);
+});
+
+function closeModal() {
+    const modal = document.getElementById('notification-modal');
+    modal.style.display = 'none';
+}
+
+window.onclick = function(event) {
+    const modal = document.getElementById('notification-modal');
+    if (event.target == modal) {
+        modal.style.display = 'none';
+    }
+}
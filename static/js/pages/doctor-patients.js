@@ -0,0 +1,54 @@
+const socket = io('/doctor');
+
+socket.on('connect', () => {
+    console.log('Connected to WebSocket server');
+});
+
+// Keeps this doctor listed as online for triage (see presence.py)
+const heartbeatSeconds = Number(document.currentScript.dataset.heartbeatInterval) || 20;
+setInterval(() => {
+    if (socket.connected) {
+        socket.emit('heartbeat');
+    }
+}, heartbeatSeconds * 1000);
+
+socket.on('patient_joined', (data) => {
+    console.log('Patient joined event received:', data);
+    const modal = document.getElementById('notification-modal');
+    const message = document.getElementById('modal-message');
+    const joinLink = document.getElementById('modal-join-link');
+
+    message.textContent = `Patient ${data.patient_name} has joined the video call!`;
+    joinLink.href = `/doctor_join_consultation/${data.consultation_id}`;
+    modal.style.display = 'block';
+
+    const notificationList = document.getElementById('notification-list');
+    const li = document.createElement('li');
+    li.style.cssText = 'background-color: #fff; border: 1px solid #e0e0e0; border-radius: 10px; padding: 1rem; margin-bottom: 0.5rem; display: flex; justify-content: space-between; align-items: center;';
+    li.innerHTML = `
+        <span>Patient ${data.patient_name} has joined the video call!</span>
+        <a href="/doctor_join_consultation/${data.consultation_id}" target="_blank" style="background-color: #16a085; color: white; padding: 0.5rem 1rem; border-radius: 20px; text-decoration: none;">Join Now</a>
+    `;
+    notificationList.insertBefore(li, notificationList.firstChild);
+});
+
+socket.on('message', (data) => {
+    console.log('Message from server:', data.data);
+});
+
+function closeModal() {
+    const modal = document.getElementById('notification-modal');
+    modal.style.display = 'none';
+}
+
+window.onclick = function(event) {
+    const modal = document.getElementById('notification-modal');
+    if (event.target === modal) {
+        modal.style.display = 'none';
+    }
+}
+
+// Responsive navbar toggle
+document.getElementById('menu-btn').onclick = () => {
+    document.querySelector('.navbar').classList.toggle('active');
+};
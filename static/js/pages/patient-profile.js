@@ -0,0 +1,4 @@
+// Toggle navbar on mobile
+document.getElementById('menu-btn').onclick = () => {
+    document.querySelector('.navbar').classList.toggle('active');
+};
@@ -0,0 +1,209 @@
+# structured_logging.py
+# Logging that never blocks the request path on I/O.
+#
+# Every record goes onto an in-memory queue through a QueueHandler on the root
+# logger; a QueueListener on a native thread redacts it, formats it and writes
+# it to stdout. With LOG_FORMAT=json (the default) each record is one JSON
+# object per line, which the CloudWatch agent / awslogs driver ingest as is:
+#   {"time": "...", "level": "INFO", "logger": "app", "message": "SMS sent",
+#    "pid": 12, "request": {"method": "GET", "path": "/join_video/3", ...}, "sid": "SM..."}
+import _queue
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import has_request_context, request, session
+
+from serving import native_threading
+
+# Extra fields whose names look like credentials are never written out
+SECRET_KEY_PATTERN = re.compile(r'pass(word)?|secret|token|auth|api_?key|credential|account_sid', re.I)
+# Twilio account SIDs and auth tokens, should they end up inside a message
+SECRET_VALUE_PATTERNS = [re.compile(r'\bAC[0-9a-fA-F]{32}\b')]
+# Config values that must never appear in a log line, whatever the message
+SECRET_CONFIG_KEYS = ('SECRET_KEY', 'TWILIO_ACCOUNT_SID', 'TWILIO_AUTH_TOKEN', 'MAIL_PASSWORD')
+REDACTED = '[REDACTED]'
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request'}
+
+
+def parse_levels(spec):
+    """Parse ``'sms=DEBUG,werkzeug=WARNING'`` into ``{'sms': 'DEBUG', 'werkzeug': 'WARNING'}``."""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request to the record.
+
+    Runs on the calling side, since the listener thread has no request context.
+    """
+
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'request'):
+            record.request = {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'remote_addr': request.remote_addr,
+                'user_id': session.get('user_id'),
+            }
+        return True
+
+
+class RedactingFilter(logging.Filter):
+    """Mask secrets in extra fields (by name) and in the message text (by value)."""
+
+    def __init__(self, secrets=()):
+        super().__init__()
+        self.patterns = list(SECRET_VALUE_PATTERNS)
+        self.patterns.extend(re.compile(re.escape(secret)) for secret in secrets if secret and len(secret) >= 6)
+
+    def redact_text(self, text):
+        for pattern in self.patterns:
+            text = pattern.sub(REDACTED, text)
+        return text
+
+    def redact_value(self, key, value):
+        if key is not None and SECRET_KEY_PATTERN.search(key):
+            return REDACTED
+        if isinstance(value, dict):
+            return {k: self.redact_value(str(k), v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.redact_value(None, v) for v in value]
+        if isinstance(value, str):
+            return self.redact_text(value)
+        return value
+
+    def filter(self, record):
+        # QueueHandler.prepare() has already merged args into msg
+        record.msg = self.redact_text(str(record.msg))
+        for key, value in _extra_fields(record).items():
+            setattr(record, key, self.redact_value(key, value))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: the standard fields, the request, then any ``extra=`` fields."""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if getattr(record, 'request', None):
+            entry['request'] = record.request
+        entry.update(_extra_fields(record))
+        return json.dumps(entry, default=str)
+
+
+class _NativeThread:
+    """Joinable handle for a thread that bypasses gevent/eventlet patching."""
+
+    def __init__(self, target):
+        start_new_thread, _, _, allocate_lock = native_threading()
+        self._done = allocate_lock()
+        self._done.acquire()
+        start_new_thread(self._run, (target,))
+
+    def _run(self, target):
+        try:
+            target()
+        finally:
+            self._done.release()
+
+    def join(self, timeout=-1):
+        if self._done.acquire(True, timeout):
+            self._done.release()
+
+
+class NativeQueueListener(QueueListener):
+    """QueueListener whose writer is a real OS thread.
+
+    Under gevent a greenlet writer would still block the whole worker while it
+    writes to a full pipe; a native thread blocks only itself.
+    """
+
+    def start(self):
+        self._thread = _NativeThread(self._monitor)
+
+
+class StructuredLogging:
+    """Flask extension routing all logging through a background writer.
+
+    Settings: LOG_LEVEL (root level), LOG_LEVELS (per-logger overrides,
+    ``'sms=DEBUG,werkzeug=WARNING'``) and LOG_FORMAT (``json`` or ``text``).
+    """
+
+    def __init__(self, app=None):
+        self.queue_handler = None
+        self.listener = None
+        self.output_handler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.stop()
+        self.output_handler = logging.StreamHandler(sys.stdout)
+        if app.config.get('LOG_FORMAT', 'json') == 'json':
+            self.output_handler.setFormatter(JsonFormatter())
+        else:
+            self.output_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        self.output_handler.addFilter(RedactingFilter(app.config.get(key) for key in SECRET_CONFIG_KEYS))
+
+        # The C SimpleQueue is never patched, so put() never yields and the native
+        # listener thread can block on get() safely
+        self.queue_handler = QueueHandler(_queue.SimpleQueue())
+        self.queue_handler.addFilter(RequestContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, QueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(app.config.get('LOG_LEVEL', 'INFO').upper())
+        for name, level in parse_levels(app.config.get('LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(level)
+
+        self.start()
+        app.extensions['structured_logging'] = self
+
+    def start(self):
+        self.listener = NativeQueueListener(self.queue_handler.queue, self.output_handler,
+                                            respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flush whatever is queued and stop the writer thread."""
+        if self.listener is not None:
+            atexit.unregister(self.stop)
+            self.listener.stop()
+            self.listener = None
+
+    def reset_after_fork(self):
+        # The writer thread does not survive fork; give the worker its own queue and writer
+        if self.queue_handler is None:
+            return
+        self.listener = None
+        atexit.unregister(self.stop)
+        self.queue_handler.queue = _queue.SimpleQueue()
+        self.start()
+        logging.getLogger(__name__).debug('Log writer restarted in worker %d', os.getpid())
@@ -0,0 +1,66 @@
+# Shared fixtures: a fresh app on an in-memory database per test, with one
+# doctor, ASHA worker and patient, and test clients logged in as them.
+import pytest
+
+import app as medicare
+import auth
+import fragment_cache
+import idempotency
+from config import TestConfig
+from extensions import db
+from models import Doctor, User
+
+
+@pytest.fixture
+def config():
+    """The config class of the app; override in a module for other settings."""
+    return TestConfig
+
+
+@pytest.fixture
+def app(config):
+    # Per-worker caches outlive an app, and ids repeat across fresh databases
+    auth._role_cache.clear()
+    fragment_cache._fragments.clear()
+    idempotency._cache.clear()
+    idempotency._next_purge = 0.0
+    flask_app = medicare.create_app(config)
+    with flask_app.app_context():
+        db.create_all()
+    # No context stays pushed: requests would share its g (and memoized user)
+    yield flask_app
+    with flask_app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def users(app):
+    """{'doctor': id, 'asha': id, 'patient': id}"""
+    with app.app_context():
+        return _create_users()
+
+
+def _create_users():
+    doctor = User(username='doctor', email='doctor@test', password='pw', user_type='doctor',
+                  type_of_doctor='General Physician', phone='+10000000000')
+    asha = User(username='asha', email='asha@test', password='pw', user_type='asha_worker',
+                phone='+10000000001', area_of_operation='Test', worker_id='T1')
+    patient = User(username='patient', email='patient@test', password='pw', user_type='patient',
+                   age=30, blood_group='O+')
+    db.session.add_all([doctor, asha, patient])
+    db.session.flush()
+    db.session.add(Doctor(user_id=doctor.id, name=doctor.username, specialty='General Physician',
+                          phone_number=doctor.phone))
+    db.session.commit()
+    return {'doctor': doctor.id, 'asha': asha.id, 'patient': patient.id}
+
+
+@pytest.fixture
+def login(app):
+    """login(user_id) -> a test client whose session is that user's."""
+    def logged_in(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+    return logged_in
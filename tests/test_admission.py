@@ -0,0 +1,123 @@
+import math
+import os
+
+import pytest
+
+from admission import _PROBES, _SLOT, SharedBuckets
+from config import TestConfig
+
+
+def _stored_hashes(buckets):
+    return sorted(_SLOT.unpack_from(buckets._map, slot * _SLOT.size)[0] for slot in range(buckets.slots))
+
+
+def _hashing(buckets, hashes):
+    """Make ``buckets`` hash keys as ``hashes`` says, to choose their probe sequences."""
+    buckets.key_hash = hashes.__getitem__
+
+
+def test_burst_then_refill():
+    buckets = SharedBuckets(slots=64)
+    assert [buckets.take([('a', 1.0, 3)], now=10.0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take([('a', 1.0, 3)], now=10.0) == pytest.approx(1.0)
+    assert buckets.take([('a', 1.0, 3)], now=10.25) == pytest.approx(0.75)
+    assert buckets.take([('a', 1.0, 3)], now=11.0) == 0
+
+
+def test_refill_stops_at_the_burst():
+    buckets = SharedBuckets(slots=64)
+    buckets.take([('a', 1.0, 2)], now=0.0)
+    results = [buckets.take([('a', 1.0, 2)], now=1000.0) for _ in range(3)]
+    assert results[:2] == [0, 0] and results[2] > 0
+
+
+def test_all_or_none():
+    buckets = SharedBuckets(slots=64)
+    buckets.take([('empty', 0.5, 1)], now=0.0)
+    # 'full' has tokens, 'empty' has none: nothing is taken from either
+    assert buckets.take([('full', 1.0, 1), ('empty', 0.5, 1)], now=0.0) == pytest.approx(2.0)
+    assert buckets.take([('full', 1.0, 1)], now=0.0) == 0
+
+
+def test_wait_is_the_longest_of_the_empty_buckets():
+    buckets = SharedBuckets(slots=64)
+    buckets.take([('slow', 0.1, 1), ('fast', 1.0, 1)], now=0.0)
+    assert buckets.take([('slow', 0.1, 1), ('fast', 1.0, 1)], now=0.0) == pytest.approx(10.0)
+
+
+def test_colliding_keys_probe_to_the_next_slot():
+    buckets = SharedBuckets(slots=16)
+    _hashing(buckets, {'a': 16, 'b': 32})  # both start at slot 0
+    buckets.take([('a', 1.0, 1)], now=0.0)
+    assert buckets.take([('b', 1.0, 1)], now=0.0) == 0
+    assert buckets.take([('a', 1.0, 1)], now=0.0) > 0
+    assert _stored_hashes(buckets)[-2:] == [16, 32]
+
+
+def test_full_probe_sequence_evicts_the_least_recently_used():
+    buckets = SharedBuckets(slots=_PROBES)
+    hashes = {f'k{n}': _PROBES * (n + 1) for n in range(_PROBES + 1)}  # all start at slot 0
+    _hashing(buckets, hashes)
+    for n in range(_PROBES):
+        buckets.take([(f'k{n}', 1.0, 1)], now=float(n))
+    buckets.take([('k0', 1.0, 1)], now=100.0)  # k1 is now the oldest
+    buckets.take([(f'k{_PROBES}', 1.0, 1)], now=101.0)
+    stored = _stored_hashes(buckets)
+    assert hashes['k1'] not in stored
+    assert hashes['k0'] in stored and hashes[f'k{_PROBES}'] in stored
+
+
+def test_new_keys_of_one_take_get_their_own_slots():
+    buckets = SharedBuckets(slots=_PROBES)
+    _hashing(buckets, {'a': 8, 'b': 16})
+    # One free slot left in the probe sequence both keys start on
+    for slot in range(1, _PROBES):
+        _SLOT.pack_into(buckets._map, slot * _SLOT.size, 1000 + slot, 1.0, 50.0)
+    assert buckets.take([('a', 1.0, 5), ('b', 1.0, 5)], now=100.0) == 0
+    stored = _stored_hashes(buckets)
+    assert 8 in stored and 16 in stored
+
+
+def test_new_key_does_not_evict_another_key_of_the_same_take():
+    buckets = SharedBuckets(slots=_PROBES)
+    _hashing(buckets, {'a': 8, 'b': 16})
+    _SLOT.pack_into(buckets._map, 0, 8, 5.0, 1.0)  # 'a', the least recently used slot
+    for slot in range(1, _PROBES):
+        _SLOT.pack_into(buckets._map, slot * _SLOT.size, 1000 + slot, 1.0, 50.0 + slot)
+    assert buckets.take([('a', 1.0, 5), ('b', 1.0, 5)], now=100.0) == 0
+    stored = _stored_hashes(buckets)
+    assert 8 in stored and 16 in stored
+
+
+def test_tiny_tables_still_give_each_key_a_slot():
+    buckets = SharedBuckets(slots=1)
+    assert buckets.slots == _PROBES
+    assert buckets.take([('a', 1.0, 1), ('b', 1.0, 1), ('c', 1.0, 1)], now=0.0) == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_buckets_are_shared_with_forked_workers():
+    buckets = SharedBuckets(slots=64)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if buckets.take([('a', 0.001, 2)], now=0.0) == 0 else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert buckets.take([('a', 0.001, 2)], now=0.0) == 0
+    assert buckets.take([('a', 0.001, 2)], now=0.0) > 0
+
+
+class AdmissionConfig(TestConfig):
+    ADMISSION_ENABLED = True
+    ADMISSION_LIMITS = {'join_video': {'user': (0.5, 2)}}
+    ADMISSION_GLOBAL = None
+
+
+@pytest.mark.parametrize('config', [AdmissionConfig])
+def test_rejected_request_gets_429_with_retry_after(users, login):
+    client = login(users['patient'])
+    for _ in range(2):
+        assert client.get('/join_video/1').status_code != 429
+    response = client.get('/join_video/1')
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= math.ceil(1 / 0.5)
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
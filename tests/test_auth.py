@@ -0,0 +1,78 @@
+from flask import session
+
+import auth
+from extensions import db
+from models import Doctor, User
+
+
+def _set(app, user_id, **values):
+    with app.app_context():
+        db.session.query(User).filter_by(id=user_id).update(values)
+        db.session.commit()
+
+
+def test_role_required_turns_away_other_roles(users, login):
+    response = login(users['patient']).get('/doctor_patients')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/'
+
+
+def test_role_required_checks_the_row_not_the_cache(app, users, login):
+    client = login(users['doctor'])
+    assert client.get('/doctor_patients').status_code == 200
+    assert users['doctor'] in auth._role_cache
+    _set(app, users['doctor'], type_of_doctor=None)
+    response = client.get('/doctor_patients')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/'
+
+
+def test_deleted_user_is_logged_out(app, users, login):
+    client = login(users['doctor'])
+    assert client.get('/doctor_patients').status_code == 200
+    with app.app_context():
+        db.session.query(Doctor).filter_by(user_id=users['doctor']).delete()
+        db.session.query(User).filter_by(id=users['doctor']).delete()
+        db.session.commit()
+    response = client.get('/doctor_patients')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/login'
+    assert users['doctor'] not in auth._role_cache
+    with client.session_transaction() as stored:
+        assert 'user_id' not in stored
+
+
+def test_has_role_answers_from_the_cache(app, users, login):
+    login(users['doctor']).get('/')
+    _set(app, users['doctor'], type_of_doctor=None)
+    with app.test_request_context():
+        session['user_id'] = users['doctor']
+        assert auth.has_role('doctor')
+    auth.invalidate_user_role(users['doctor'])
+    with app.test_request_context():
+        session['user_id'] = users['doctor']
+        assert not auth.has_role('doctor')
+
+
+def test_expired_cache_entry_reads_the_row(app, users):
+    _set(app, users['doctor'], type_of_doctor=None)
+    auth._role_cache[users['doctor']] = (0, 'doctor', 'General Physician')  # expired long ago
+    with app.test_request_context():
+        session['user_id'] = users['doctor']
+        assert not auth.has_role('doctor')
+
+
+def test_profile_update_invalidates_the_cached_role(users, login):
+    client = login(users['patient'])
+    client.get('/')
+    assert users['patient'] in auth._role_cache
+    client.post('/profile/patient', data={'phone': '+10000000009'})
+    assert users['patient'] not in auth._role_cache
+
+
+def test_logout_invalidates_the_cached_role(users, login):
+    client = login(users['patient'])
+    client.get('/')
+    assert users['patient'] in auth._role_cache
+    client.get('/logout')
+    assert users['patient'] not in auth._role_cache
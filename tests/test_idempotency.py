@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import idempotency
+from config import TestConfig
+from extensions import db
+from models import Appointment, IdempotencyKey
+
+CHATBOT = {'user_input': 'fever,cough'}
+
+
+def _post(client, key, body=CHATBOT):
+    headers = {idempotency.HEADER: key} if key else {}
+    return client.post('/chatbot', json=body, headers=headers)
+
+
+def _appointments(app):
+    with app.app_context():
+        return db.session.query(Appointment).count()
+
+
+def _pending_row(app, user_id, client_key, age):
+    with app.app_context():
+        db.session.add(IdempotencyKey(
+            key=idempotency._digest('chatbot', user_id, client_key), fingerprint=b'\0' * 16,
+            created_at=datetime.utcnow() - timedelta(seconds=age)))
+        db.session.commit()
+
+
+def test_retry_is_replayed(app, users, login):
+    client = login(users['patient'])
+    first = _post(client, 'k1')
+    retry = _post(client, 'k1')
+    assert first.status_code == retry.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert _appointments(app) == 1
+
+
+def test_requests_without_a_key_run_every_time(app, users, login):
+    client = login(users['patient'])
+    assert _post(client, None).status_code == _post(client, None).status_code == 200
+    assert _appointments(app) == 2
+
+
+def test_failed_attempt_frees_the_key(app, users, login):
+    client = login(users['patient'])
+    assert _post(client, 'k1', {}).status_code == 400
+    response = _post(client, 'k1')
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+
+
+def test_key_reused_for_another_body(app, users, login):
+    client = login(users['patient'])
+    _post(client, 'k1')
+    response = _post(client, 'k1', {'user_input': 'headache'})
+    assert response.status_code == 422
+    assert _appointments(app) == 1
+
+
+def test_key_still_in_progress(app, users, login):
+    _pending_row(app, users['patient'], 'k1', age=1)
+    response = _post(login(users['patient']), 'k1')
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert _appointments(app) == 0
+
+
+def test_abandoned_claim_is_taken_over(app, users, login):
+    _pending_row(app, users['patient'], 'k1', age=TestConfig.IDEMPOTENCY_LOCK_TIMEOUT + 1)
+    response = _post(login(users['patient']), 'k1')
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert _appointments(app) == 1
+
+
+def test_keys_are_scoped_to_the_user(app, users, login):
+    _post(login(users['patient']), 'k1')
+    with app.app_context():
+        stored = db.session.query(IdempotencyKey).one()
+        assert stored.key == idempotency._digest('chatbot', users['patient'], 'k1')
+        assert stored.status == 200
+
+
+def test_expired_keys_are_purged(app, users, login):
+    client = login(users['patient'])
+    _post(client, 'k1')
+    with app.app_context():
+        db.session.query(IdempotencyKey).update(
+            {'created_at': datetime.utcnow() - timedelta(seconds=TestConfig.IDEMPOTENCY_TTL + 1)})
+        db.session.commit()
+    idempotency._cache.clear()
+    # An expired key runs the view again...
+    response = _post(client, 'k1')
+    assert 'Idempotent-Replayed' not in response.headers
+    assert _appointments(app) == 2
+    with app.app_context():
+        db.session.query(IdempotencyKey).update(
+            {'created_at': datetime.utcnow() - timedelta(seconds=TestConfig.IDEMPOTENCY_TTL + 1)})
+        db.session.commit()
+        # ...and the purge deletes it
+        assert idempotency.purge_expired(force=True) == 1
+        db.session.commit()
+        assert db.session.query(IdempotencyKey).count() == 0
+
+
+def _multipart(boundary, fields):
+    lines = []
+    for name, value in fields:
+        lines += [f'--{boundary}', f'Content-Disposition: form-data; name="{name}"', '', value]
+    lines.append(f'--{boundary}--')
+    return '\r\n'.join(lines + ['']).encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def test_multipart_fingerprint_ignores_the_boundary(app):
+    fingerprints = []
+    for boundary, fields in (('aaaa', [('a', '1'), ('b', '2')]), ('bbbbbb', [('a', '1'), ('b', '2')]),
+                             ('cccc', [('a', '1'), ('b', '3')])):
+        body, content_type = _multipart(boundary, fields)
+        with app.test_request_context('/upload_prescription/1', method='POST', data=body,
+                                      content_type=content_type):
+            fingerprints.append(idempotency._fingerprint())
+    assert fingerprints[0] == fingerprints[1] != fingerprints[2]
+
+
+class AdmissionConfig(TestConfig):
+    ADMISSION_ENABLED = True
+
+
+@pytest.mark.parametrize('config', [AdmissionConfig])
+def test_replays_take_no_admission_token(app, users, login):
+    client = login(users['patient'])
+    burst = AdmissionConfig.ADMISSION_LIMITS['chatbot']['user'][1]
+    responses = [_post(client, 'k1') for _ in range(burst + 2)]
+    assert [response.status_code for response in responses] == [200] * (burst + 2)
+    assert all(response.headers.get('Idempotent-Replayed') == 'true' for response in responses[1:])
@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+
+import pytest
+
+import join_events
+from config import TestConfig
+from extensions import db, socketio
+from models import Consultation
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    join_events.reset_after_fork()
+    yield
+    join_events.reset_after_fork()
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    """The Socket.IO events emitted and the background tasks started, by name."""
+    calls = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, *args, **kwargs: calls.append(event))
+    monkeypatch.setattr(socketio, 'start_background_task', lambda target, *args, **kwargs: calls.append(target.__name__))
+    return calls
+
+
+def _consultations(app, count=1):
+    with app.app_context():
+        rows = [Consultation(doctor_name='doctor', patient_name='patient') for _ in range(count)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def _joined(app, consultation_id, role='patient'):
+    with app.app_context():
+        return getattr(db.session.get(Consultation, consultation_id), f'{role}_joined')
+
+
+def test_only_the_first_join_is_written(app):
+    consultation_id, = _consultations(app)
+    with app.app_context():
+        assert join_events.apply_join(consultation_id, 'patient', datetime.utcnow()) is True
+        assert join_events.apply_join(consultation_id, 'patient', datetime.utcnow()) is False
+        db.session.commit()
+    assert _joined(app, consultation_id)
+
+
+def test_reloads_notify_the_doctor_once(app, users, login, notified):
+    consultation_id, = _consultations(app)
+    client = login(users['patient'])
+    for _ in range(3):
+        assert client.get(f'/join_video/{consultation_id}').status_code == 302
+    assert notified == ['patient_joined', 'send_sms_notification']
+    assert _joined(app, consultation_id)
+
+
+def test_reloads_notify_the_asha_workers_once(app, users, login, notified):
+    consultation_id, = _consultations(app)
+    client = login(users['doctor'])
+    for _ in range(2):
+        assert client.get(f'/doctor_join_consultation/{consultation_id}').status_code == 302
+    assert notified == ['doctor_joined']
+
+
+class WriteBehindConfig(TestConfig):
+    JOIN_WRITE_BEHIND = True
+
+
+@pytest.mark.parametrize('config', [WriteBehindConfig])
+def test_queued_join_is_the_first_transition_once(app, users, login, notified):
+    consultation_id, = _consultations(app)
+    client = login(users['patient'])
+    for _ in range(3):
+        client.get(f'/join_video/{consultation_id}')
+    assert notified == ['_flush_loop', 'patient_joined', 'send_sms_notification']
+    assert not _joined(app, consultation_id)
+    with app.app_context():
+        join_events.flush()
+    assert _joined(app, consultation_id)
+    client.get(f'/join_video/{consultation_id}')
+    assert len(notified) == 3
+
+
+def test_failed_batch_is_retried_per_join_and_dropped_after_max_attempts(app, monkeypatch, caplog):
+    good, bad = _consultations(app, 2)
+    apply_join = join_events.apply_join
+
+    def poisoned(consultation_id, role, joined_at):
+        if consultation_id == bad:
+            raise RuntimeError('poisoned row')
+        return apply_join(consultation_id, role, joined_at)
+    monkeypatch.setattr(join_events, 'apply_join', poisoned)
+    for consultation_id in (good, bad):
+        join_events._pending[consultation_id, 'patient'] = (datetime.utcnow(), 0)
+    with app.app_context(), caplog.at_level(logging.ERROR, logger='join_events'):
+        join_events.flush()
+        # The good join made it through on its own; the bad one is queued again
+        assert _joined(app, good)
+        assert list(join_events._pending) == [(bad, 'patient')]
+        for _ in range(join_events.MAX_ATTEMPTS - 1):
+            join_events.flush()
+    assert not join_events._pending
+    assert not _joined(app, bad)
+    assert f'Dropping the patient join of consultation {bad}' in caplog.text
+
+
+def test_queued_joins_are_flushed_at_exit(app):
+    consultation_id, = _consultations(app)
+    join_events._pending[consultation_id, 'doctor'] = (datetime.utcnow(), 0)
+    join_events._app = app
+    join_events._flush_at_exit()
+    assert not join_events._pending
+    assert _joined(app, consultation_id, 'doctor')
@@ -0,0 +1,38 @@
+import metrics
+from extensions import db
+from models import User
+
+
+def _sql_total():
+    return metrics._shared().items().get(metrics.SQL_STATEMENTS.name, {}).get((), {}).get('', 0)
+
+
+def test_a_request_writes_its_samples_once(app, users, login, monkeypatch):
+    client = login(users['patient'])
+    writes = []
+    update = metrics.SharedSamples.update
+
+    def recorded(self, changes, replace=False):
+        writes.append(changes)
+        update(self, changes, replace)
+    monkeypatch.setattr(metrics.SharedSamples, 'update', recorded)
+    before = _sql_total()
+    client.get('/profile/patient')
+    assert len(writes) == 1
+    statements = dict(writes[0])[(metrics.SQL_STATEMENTS.name, (), '')]
+    assert statements > 0 and _sql_total() == before + statements
+
+
+def test_statements_outside_requests_are_added_in_batches(app, monkeypatch):
+    monkeypatch.setattr(metrics, 'SQL_BATCH', 3)
+    with app.app_context():
+        metrics._flush_sql_statements()
+        before = _sql_total()
+        for _ in range(2):
+            db.session.query(User).count()
+        assert _sql_total() == before
+        db.session.query(User).count()
+        assert _sql_total() == before + 3
+        db.session.query(User).count()
+        metrics.render_metrics()
+        assert _sql_total() == before + 4
@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import profiling
+from config import TestConfig
+
+
+@pytest.fixture
+def config(tmp_path):
+    class SlowRequestConfig(TestConfig):
+        PROFILING_DIR = str(tmp_path)
+        SLOW_REQUEST_THRESHOLD = 1e-9
+        SLOW_REQUEST_KEEP = 2
+    return SlowRequestConfig
+
+
+@pytest.fixture(autouse=True)
+def idle_profiler(app):
+    # The profiler is one instance shared by every app
+    app.extensions['profiler'].reset_after_fork()
+    yield
+    app.extensions['profiler'].reset_after_fork()
+
+
+def _slow_files(directory, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        names = sorted(name for name in os.listdir(directory) if name.startswith('slow-') and name.endswith('.json'))
+        if len(names) >= count:
+            return names
+        time.sleep(0.01)
+    raise AssertionError(f'expected {count} slow-request files, found {names}')
+
+
+def test_slow_requests_are_written_off_the_request_thread(app, tmp_path, monkeypatch):
+    writers = []
+    write_atomic = profiling._write_atomic
+
+    def recorded(path, data):
+        writers.append(threading.get_ident())
+        write_atomic(path, data)
+    monkeypatch.setattr(profiling, '_write_atomic', recorded)
+    client = app.test_client()
+    for _ in range(3):
+        client.get('/login')
+    names = _slow_files(tmp_path, 2)
+    assert threading.get_ident() not in writers
+    with open(tmp_path / names[-1]) as f:
+        capture = json.load(f)
+    assert capture['path'] == '/login' and isinstance(capture['stacks'], list)
+    # The ring keeps the newest SLOW_REQUEST_KEEP
+    deadline = time.monotonic() + 5.0
+    while app.extensions['profiler']._writer_running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(_slow_files(tmp_path, 2)) == 2
+
+
+def test_queued_captures_are_written_at_exit(app, tmp_path, monkeypatch):
+    profiler = app.extensions['profiler']
+    monkeypatch.setattr(profiler, '_start_thread', lambda target, args: None)
+    app.test_client().get('/login')
+    assert not os.listdir(tmp_path)
+    profiler.write_pending()
+    assert len(_slow_files(tmp_path, 1)) == 1
@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import func, select, text
+
+import analytics
+from config import TestConfig
+from extensions import db, shards
+from fragment_cache import bump_version, get_version, specialty_scope
+from models import Appointment, DataVersion, DiseaseCount, Doctor, User
+
+
+@pytest.fixture
+def config(tmp_path):
+    class ShardConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path}/primary.db'
+        SHARDS = {'kerala': f'sqlite:///{tmp_path}/kerala.db', 'tn': f'sqlite:///{tmp_path}/tn.db'}
+        SHARD_DISTRICTS = {'Kottayam': 'kerala', 'Chennai': 'tn'}
+    return ShardConfig
+
+
+@pytest.fixture
+def sharded(app):
+    """The app, with its shard databases created."""
+    assert app.test_cli_runner().invoke(args=['shards', 'init']).exit_code == 0
+    return app
+
+
+@pytest.fixture
+def district_users(sharded):
+    """A doctor, and a patient and ASHA worker in Kottayam (the 'kerala' shard)."""
+    with sharded.app_context():
+        doctor = User(username='doctor', email='doctor@test', password='pw', user_type='doctor',
+                      type_of_doctor='General Physician', phone='+10000000000')
+        asha = User(username='asha', email='asha@test', password='pw', user_type='asha_worker',
+                    phone='+10000000001', area_of_operation='Kottayam', worker_id='K1')
+        patient = User(username='patient', email='patient@test', password='pw', user_type='patient',
+                       age=30, blood_group='O+', area_of_operation='Kottayam')
+        db.session.add_all([doctor, asha, patient])
+        db.session.flush()
+        db.session.add(Doctor(user_id=doctor.id, name=doctor.username, specialty='General Physician',
+                              phone_number=doctor.phone))
+        db.session.commit()
+        return {'doctor': doctor.id, 'asha': asha.id, 'patient': patient.id}
+
+
+def _add_appointment(shard, user_id):
+    with shards.use(shard):
+        appointment = Appointment(user_id=user_id, name='patient', time_slot='morning',
+                                  type_of_doctor='General Physician')
+        db.session.add(appointment)
+        db.session.commit()
+        return appointment
+
+
+def test_statements_follow_the_current_shard(app):
+    with app.app_context(), shards.use('tn'):
+        assert db.session.get_bind(Appointment.__mapper__, clause=select(Appointment)) is shards.engine('tn')
+        assert db.session.get_bind(DiseaseCount.__mapper__, clause=select(DiseaseCount)) is shards.engine('tn')
+        assert db.session.get_bind(User.__mapper__, clause=select(User)) is db.engine
+
+
+def test_rows_route_by_their_id(app, district_users):
+    with app.app_context():
+        appointment = _add_appointment('kerala', district_users['patient'])
+        assert shards.shard_of_id(appointment.id) == 'kerala'
+        with shards.use('tn'):
+            assert db.session.get_bind(Appointment.__mapper__, instance=appointment) is shards.engine('kerala')
+            assert shards.shard_of(appointment) == 'kerala'
+            assert shards.get(Appointment, appointment.id).id == appointment.id
+
+
+def test_lazy_loads_of_users_stay_in_the_primary(app, district_users):
+    with app.app_context():
+        appointment_id = _add_appointment('kerala', district_users['patient']).id
+        db.session.expunge_all()
+        with shards.use('tn'):
+            assert shards.get(Appointment, appointment_id).user.username == 'patient'
+
+
+def test_text_goes_to_a_shard_only_when_named(app):
+    statement = text('SELECT 1')
+    with app.app_context(), shards.use('tn'):
+        assert db.session.get_bind(clause=statement) is db.engine
+        assert db.session.get_bind(clause=statement, shard='kerala') is shards.engine('kerala')
+
+
+def test_scatter_runs_the_query_in_every_shard(app, district_users):
+    with app.app_context():
+        _add_appointment('kerala', district_users['patient'])
+        _add_appointment('kerala', district_users['patient'])
+        _add_appointment('tn', district_users['patient'])
+        counts = shards.scatter(lambda: db.session.execute(select(func.count(Appointment.id))).scalar())
+        assert counts == {None: 0, 'kerala': 2, 'tn': 1}
+        assert shards.scatter(shards.current) == {None: None, 'kerala': 'kerala', 'tn': 'tn'}
+
+
+def _in(shard, statement):
+    with shards.use(shard):
+        return db.session.execute(statement).scalar()
+
+
+def test_booking_keeps_its_rollups_in_its_shard(app, district_users, login):
+    response = login(district_users['patient']).post('/chatbot', json={'user_input': 'fever,cough'})
+    assert response.status_code == 200
+    assert shards.shard_of_id(response.get_json()['appointment_id']) == 'kerala'
+    predictions = select(func.sum(DiseaseCount.predictions))
+    version = select(DataVersion.version).where(DataVersion.scope == specialty_scope('General Physician'))
+    with app.app_context():
+        assert _in('kerala', predictions) == 1 and _in(None, predictions) is None
+        assert _in('kerala', version) == 1 and _in(None, version) is None
+        summary = analytics.summary()
+        assert sum(entry['predictions'] for entry in summary['predicted_diseases']) == 1
+        assert summary['asha_workload'][0]['username'] == 'asha'
+
+
+def test_versions_add_up_across_shards(sharded):
+    scope = specialty_scope('General Physician')
+    with sharded.app_context():
+        bump_version(scope, shard='kerala')
+        bump_version(scope, shard='tn')
+        bump_version(scope, shard=None)
+        db.session.commit()
+        assert get_version(scope) == 3
+
+
+def test_rebuild_recounts_each_shard_in_place(app, district_users, login):
+    login(district_users['patient']).post('/chatbot', json={'user_input': 'fever,cough'})
+    with app.app_context():
+        with shards.use('kerala'):
+            db.session.query(DiseaseCount).delete()
+            db.session.commit()
+        assert analytics.rebuild() == 0
+        assert _in('kerala', select(func.sum(DiseaseCount.predictions))) == 1
+        assert _in(None, select(func.sum(DiseaseCount.predictions))) is None